@@ -0,0 +1,1475 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import glob
+import hashlib
+import ipaddress
+import json
+import multiprocessing
+import os
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psutil
+
+import server
+from hlsClient import AsyncHTTPConnection, latency_summary, segment_uris
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+LAUNCH_TIMEOUT = 600  # Seconds to wait for a channel's background start (source cache, probe, paced TS encode)
+
+class CountingSource:
+    """Local HTTP stand-in for the CDN that counts every byte sent to ffmpeg
+
+    bandwidth_mbps caps the rate of all responses together (one shared link), latency_ms delays every response.
+    """
+
+    def __init__(self, source, host="127.0.0.1", port=0, bandwidth_mbps=None, latency_ms=0.0):
+        self.source = source
+        self.bytes_sent = 0
+        self.requests = 0
+        self.bandwidth = bandwidth_mbps * 1e6 / 8 if bandwidth_mbps else None
+        self.latency = latency_ms / 1000.0
+        self.link_free_at = 0.0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        name = os.path.basename(urllib.request.urlparse(self.source).path) or "source.mp4"
+        return f"http://{host}:{port}/{name}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset(self):
+        with self.lock:
+            self.bytes_sent = 0
+            self.requests = 0
+
+    def count(self, n):
+        with self.lock:
+            self.bytes_sent += n
+
+    def shape(self, n):
+        """Hold a chunk of n bytes until the link has carried everything queued before it"""
+        if self.bandwidth is None:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.link_free_at = max(self.link_free_at, now) + n / self.bandwidth
+            wait = self.link_free_at - now
+        time.sleep(wait)
+
+    def _make_handler(self):
+        source = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                with source.lock:
+                    source.requests += 1
+                time.sleep(source.latency)
+                try:
+                    if source.source.startswith(("http://", "https://")):
+                        self._proxy()
+                    else:
+                        self._serve_file()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def do_HEAD(self):
+                time.sleep(source.latency)
+                if source.source.startswith(("http://", "https://")):
+                    self.send_response(405)
+                    self.end_headers()
+                    return
+                self._serve_file(body=False)
+
+            def _serve_file(self, body=True):
+                size = os.path.getsize(source.source)
+                start, end = 0, size - 1
+                range_header = self.headers.get("Range")
+                if range_header and range_header.startswith("bytes="):
+                    first, _, last = range_header[6:].split(",")[0].partition("-")
+                    start = int(first) if first else max(0, size - int(last))
+                    end = int(last) if first and last else size - 1
+                    if start >= size:
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{size}")
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Type", "video/mp4")
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end - start + 1))
+                self.end_headers()
+                if not body:
+                    return
+                with open(source.source, "rb") as f:
+                    f.seek(start)
+                    remaining = end - start + 1
+                    while remaining > 0:
+                        chunk = f.read(min(65536, remaining))
+                        if not chunk:
+                            break
+                        source.shape(len(chunk))
+                        self.wfile.write(chunk)
+                        source.count(len(chunk))
+                        remaining -= len(chunk)
+
+            def _proxy(self):
+                upstream = urllib.request.Request(source.source)
+                if self.headers.get("Range"):
+                    upstream.add_header("Range", self.headers["Range"])
+                with urllib.request.urlopen(upstream, timeout=10) as response:
+                    self.send_response(response.status)
+                    for header in ("Content-Type", "Content-Length", "Content-Range", "Accept-Ranges"):
+                        if response.headers.get(header):
+                            self.send_header(header, response.headers[header])
+                    self.end_headers()
+                    while True:
+                        chunk = response.read(65536)
+                        if not chunk:
+                            break
+                        source.shape(len(chunk))
+                        self.wfile.write(chunk)
+                        source.count(len(chunk))
+
+        return Handler
+
+def process_cpu_seconds(pids):
+    """Total CPU seconds (user + system) used by the given processes so far"""
+    total = 0.0
+    for pid in pids:
+        try:
+            times = psutil.Process(pid).cpu_times()
+            total += times.user + times.system
+        except psutil.Error:
+            pass
+    return total
+
+def channel_pids(channel_id):
+    """PIDs of the ffmpeg processes of a channel"""
+    channel = server.get_channel(channel_id)
+    if channel is None:
+        return set()
+    return {p.pid for p in (channel.ffmpeg_process, channel.hls_process) if p is not None}
+
+def wait_for_launch(channel_id, timeout=LAUNCH_TIMEOUT):
+    """Wait until a started channel has launched its processes; the channel, or None if it failed"""
+    deadline = time.monotonic() + timeout
+    while True:
+        channel = server.get_channel(channel_id)
+        if channel is None:
+            return None
+        if channel.state == "failed":
+            print(f"[{channel_id}] failed to start: {channel.state_message}", file=sys.stderr)
+            return None
+        if not channel.preparing and channel.state != "queued":
+            if channel.ffmpeg_process is None and channel.hls_process is None:
+                print(f"[{channel_id}] not running: {channel.state_message}", file=sys.stderr)
+                return None
+            return channel
+        if time.monotonic() > deadline:
+            print(f"[{channel_id}] still {channel.state} after {timeout} s", file=sys.stderr)
+            return None
+        time.sleep(0.1)
+
+def scheduler_refused(message):
+    """True if a /start message is a refusal by the server's CPU scheduler rather than a start failure"""
+    return message.startswith(server.SCHEDULER_REFUSED)
+
+def run_pipeline_mode(mode, source, multicast_addr, port, duration, cache):
+    """Run one pipeline mode for `duration` seconds and measure CPU and CDN bytes"""
+    return run_channel(mode, source, multicast_addr, port, duration, pipeline=mode, cache=cache)
+
+def run_channel(mode, source, multicast_addr, port, duration, **options):
+    """Run a channel with the given start options for `duration` seconds and measure CPU and CDN bytes"""
+    source.reset()
+    success, message = server.start_channel("bench", source.url, multicast_addr, port, server.DEFAULT_TTL,
+                                            **options)
+    if not success:
+        print(f"[{mode}] failed to start: {message}", file=sys.stderr)
+        return None
+    # start_channel returns before the background start has launched ffmpeg
+    if wait_for_launch("bench") is None:
+        server.stop_channel("bench")
+        return None
+
+    pids = channel_pids("bench")
+    process_count = len(pids)
+    start_time = time.monotonic()
+    cpu_seconds = 0.0
+    while time.monotonic() - start_time < duration:
+        time.sleep(1)
+        # Sample continuously so CPU time is not lost if a process exits early
+        cpu_seconds = max(cpu_seconds, process_cpu_seconds(pids))
+    elapsed = time.monotonic() - start_time
+    passthrough = server.get_channel("bench").passthrough
+    server.stop_channel("bench")
+
+    return {
+        "mode": mode,
+        "passthrough": passthrough,
+        "duration_s": elapsed,
+        "ffmpeg_processes": process_count,
+        "cpu_seconds": cpu_seconds,
+        "cpu_percent_of_core": 100.0 * cpu_seconds / elapsed,
+        "cdn_bytes": source.bytes_sent,
+        "cdn_requests": source.requests,
+        "cdn_bytes_per_second": source.bytes_sent / elapsed,
+    }
+
+def benchmark_pipeline(args):
+    """Compare the separate (two ffmpeg) and shared (tee) pipelines for one channel"""
+    source = CountingSource(args.source).start()
+    results = []
+    try:
+        for mode in args.modes:
+            print(f"Running pipeline mode '{mode}' for {args.duration} seconds...")
+            result = run_pipeline_mode(mode, source, args.multicast_addr, args.port, args.duration,
+                                       not args.no_cache)
+            if result:
+                results.append(result)
+                print(f"  ffmpeg processes: {result['ffmpeg_processes']}")
+                print(f"  CPU: {result['cpu_seconds']:.2f} s ({result['cpu_percent_of_core']:.1f}% of one core)")
+                print(f"  CDN bytes: {result['cdn_bytes']} in {result['cdn_requests']} requests "
+                      f"({result['cdn_bytes_per_second'] / 1024:.1f} KB/s)")
+    finally:
+        source.stop()
+
+    by_mode = {r["mode"]: r for r in results}
+    if "separate" in by_mode and "shared" in by_mode:
+        before, after = by_mode["separate"], by_mode["shared"]
+        print("\nShared vs separate:")
+        if before["cpu_seconds"] > 0:
+            print(f"  CPU per channel: {100 * (1 - after['cpu_seconds'] / before['cpu_seconds']):.1f}% less")
+        if before["cdn_bytes"] > 0:
+            print(f"  CDN bytes per channel: {100 * (1 - after['cdn_bytes'] / before['cdn_bytes']):.1f}% less")
+
+    write_results(args.output, "pipeline", vars(args), results)
+
+def run_ladder(source, ladder, multicast_addr, port, duration):
+    """Encode one ladder on an HLS-only channel for `duration` seconds and return its CPU usage"""
+    success, message = server.start_channel("bench-ladder", source, multicast_addr, port, server.DEFAULT_TTL,
+                                            "separate", ladder=ladder)
+    if not success:
+        print(f"[{','.join(ladder)}] failed to start: {message}", file=sys.stderr)
+        return None
+    channel = wait_for_launch("bench-ladder")
+    if channel is None or channel.hls_process is None:
+        server.stop_channel("bench-ladder")
+        return None
+    # Only the HLS process encodes the ladder; stop the multicast one so it does not skew CPU numbers
+    if channel.ffmpeg_process is not None and channel.ffmpeg_process is not channel.hls_process:
+        server.stop_process(channel.ffmpeg_process)
+    pids = {channel.hls_process.pid}
+    start_time = time.monotonic()
+    cpu_seconds = 0.0
+    while time.monotonic() - start_time < duration:
+        time.sleep(1)
+        cpu_seconds = max(cpu_seconds, process_cpu_seconds(pids))
+    elapsed = time.monotonic() - start_time
+    server.stop_channel("bench-ladder")
+    return 100.0 * cpu_seconds / elapsed
+
+def benchmark_ladder(args):
+    """Encode CPU of each rendition alone and of the whole ladder sharing one decode"""
+    ladder = server.parse_ladder(args.ladder)
+    results = {"renditions": {}}
+    for name in ladder:
+        print(f"Encoding rendition {name} for {args.duration} seconds...")
+        cpu_percent = run_ladder(args.source, [name], args.multicast_addr, args.port, args.duration)
+        if cpu_percent is not None:
+            results["renditions"][name] = {"cpu_percent_of_core": cpu_percent, **server.HLS_RENDITIONS[name]}
+            print(f"  CPU: {cpu_percent:.1f}% of one core")
+
+    print(f"Encoding full ladder {args.ladder} for {args.duration} seconds...")
+    ladder_cpu = run_ladder(args.source, ladder, args.multicast_addr, args.port, args.duration)
+    separate_cpu = sum(r["cpu_percent_of_core"] for r in results["renditions"].values())
+    results["ladder_cpu_percent_of_core"] = ladder_cpu
+    results["separate_encodes_cpu_percent_of_core"] = separate_cpu
+    if ladder_cpu is not None:
+        print(f"  CPU: {ladder_cpu:.1f}% of one core (separate encodes: {separate_cpu:.1f}%)")
+    write_results(args.output, "ladder", vars(args), results)
+
+def benchmark_passthrough(args):
+    """CPU per channel with re-encoding vs remux-only passthrough for a compatible source"""
+    source = CountingSource(args.source).start()
+    results = []
+    try:
+        for passthrough in ("off", "auto"):
+            print(f"Running {args.pipeline} pipeline with passthrough={passthrough} for {args.duration} seconds...")
+            result = run_channel(passthrough, source, args.multicast_addr, args.port, args.duration,
+                                 pipeline=args.pipeline, cache=not args.no_cache, passthrough=passthrough)
+            if result:
+                results.append(result)
+                print(f"  remuxed outputs: {', '.join(result['passthrough']) or 'none'}")
+                print(f"  CPU: {result['cpu_seconds']:.2f} s ({result['cpu_percent_of_core']:.1f}% of one core)")
+    finally:
+        source.stop()
+
+    by_mode = {r["mode"]: r for r in results}
+    if "off" in by_mode and "auto" in by_mode and by_mode["off"]["cpu_seconds"] > 0:
+        saved = 1 - by_mode["auto"]["cpu_seconds"] / by_mode["off"]["cpu_seconds"]
+        print(f"\nPassthrough vs re-encode: {100 * saved:.1f}% less CPU per channel")
+    write_results(args.output, "passthrough", vars(args), results)
+
+def receive_gaps(port, duration, queue):
+    """Receiver process: inter-arrival gaps (seconds) of the datagrams on 127.0.0.1:port"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024 * 1024)
+    sock.bind(("127.0.0.1", port))
+    sock.settimeout(1.0)
+    buffer = bytearray(2048)
+    arrivals = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        try:
+            sock.recv_into(buffer)
+        except socket.timeout:
+            continue
+        arrivals.append(time.perf_counter())
+    sock.close()
+    queue.put([b - a for a, b in zip(arrivals, arrivals[1:])])
+
+def make_cbr_ts(source, rate_mbps, seconds, path):
+    """Constant-bitrate TS (padded with null packets) at rate_mbps from the first `seconds` of source"""
+    result = subprocess.run([
+        "ffmpeg", "-loglevel", "error", "-y", "-t", str(seconds), "-i", source,
+        "-map", "0:v:0", "-map", "0:a:0?", "-c", "copy",
+        "-f", "mpegts", "-muxrate", f"{rate_mbps}M", path,
+    ], stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode("utf-8", "replace").strip())
+
+def benchmark_sender(args):
+    """CPU and inter-packet jitter of the paced TS multicast sender at several bitrates"""
+    results = []
+    for rate in args.rates:
+        path = os.path.join(args.work_dir, f"sender_{rate}M.ts")
+        os.makedirs(args.work_dir, exist_ok=True)
+        make_cbr_ts(args.source, rate, args.clip_seconds, path)
+        queue = multiprocessing.Queue()
+        receiver = multiprocessing.Process(target=receive_gaps, args=(args.port, args.duration + 1, queue))
+        receiver.start()
+        time.sleep(0.5)
+        print(f"Sending {rate} Mbps for {args.duration} seconds...")
+        sender = server.PacedTSSender(path, "127.0.0.1", args.port, 1).start()
+        time.sleep(args.duration)
+        stats = sender.stats()
+        sender.terminate()
+        sender.wait(5)
+        gaps = queue.get()
+        receiver.join()
+
+        # Deviation of each inter-arrival gap from the nominal gap of a 1316-byte datagram at this rate
+        nominal = server.TS_PACKET_SIZE * server.TS_PACKETS_PER_DATAGRAM * 8 / (rate * 1e6)
+        jitter_ms = [abs(gap - nominal) * 1000 for gap in gaps]
+        result = {
+            "rate_mbps": rate,
+            "measured_mbps": stats["bitrate_kbps"] / 1000 if stats["bitrate_kbps"] else 0,
+            "sender_cpu_percent": stats["cpu_percent"],
+            "datagrams_sent": stats["datagrams"],
+            "datagrams_received": len(gaps) + 1 if gaps else 0,
+            "datagrams_per_syscall": stats["datagrams"] / stats["syscalls"] if stats["syscalls"] else 0,
+            "sendmmsg": stats["sendmmsg"],
+            "send_lateness_ms": stats.get("lateness_ms"),
+            "nominal_gap_ms": nominal * 1000,
+            "inter_packet_jitter": latency_summary(jitter_ms),
+        }
+        results.append(result)
+        print(f"  {result['measured_mbps']:.1f} Mbps | sender CPU {result['sender_cpu_percent']:.1f}% | "
+              f"{result['datagrams_per_syscall']:.1f} datagrams/syscall | "
+              f"jitter p50 {result['inter_packet_jitter']['p50_ms']:.3f} ms "
+              f"p99 {result['inter_packet_jitter']['p99_ms']:.3f} ms | "
+              f"received {result['datagrams_received']}/{result['datagrams_sent']}")
+    write_results(args.output, "sender", vars(args), results)
+
+def send_groups(groups, port, rate_mbps, duration, path):
+    """Sender process: the TS file to every group at rate_mbps each, one datagram per group per round"""
+    with open(path, "rb") as f:
+        data = f.read()
+    datagram = server.TS_PACKET_SIZE * server.TS_PACKETS_PER_DATAGRAM
+    chunks = [data[i:i + datagram] for i in range(0, len(data) - datagram + 1, datagram)]
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+    interval = datagram * 8 / (rate_mbps * 1e6)
+    start = time.monotonic()
+    rounds = 0
+    while time.monotonic() - start < duration:
+        chunk = chunks[rounds % len(chunks)]
+        for group in groups:
+            sock.sendto(chunk, (group, port))
+        rounds += 1
+        delay = start + rounds * interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    sock.close()
+
+def benchmark_groups(args):
+    """CPU of checkMulticast.py monitoring many multicast groups from one process"""
+    receiver_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkMulticast.py")
+    os.makedirs(args.work_dir, exist_ok=True)
+    path = os.path.join(args.work_dir, "groups.ts")
+    make_cbr_ts(args.source, args.rate, args.clip_seconds, path)
+    results = []
+    for count in args.counts:
+        groups = [str(ipaddress.IPv4Address(args.base_group) + i) for i in range(count)]
+        groups_file = os.path.join(args.work_dir, f"groups_{count}.txt")
+        report_file = os.path.join(args.work_dir, f"groups_{count}.json")
+        with open(groups_file, "w") as f:
+            f.write("".join(f"{group}:{args.port}\n" for group in groups))
+        print(f"Monitoring {count} groups at {args.rate} Mbps each for {args.duration} seconds...")
+        receiver = subprocess.Popen([sys.executable, receiver_script, "--groups-file", groups_file,
+                                     "--duration", str(args.duration), "--report", report_file],
+                                    stdout=subprocess.DEVNULL)
+        time.sleep(1)
+        sender = multiprocessing.Process(target=send_groups,
+                                         args=(groups, args.port, args.rate, args.duration - 2, path))
+        sender.start()
+        sender.join()
+        receiver.wait()
+        with open(report_file) as f:
+            report = json.load(f)
+        received = sum(g["bytes"] for g in report["groups"])
+        result = {
+            "groups": count,
+            "active_groups": report["active_groups"],
+            "received_mbps": received * 8 / (args.duration - 2) / 1e6,
+            "lost_ts_packets": sum(g["lost_ts_packets"] or 0 for g in report["groups"]),
+            "kernel_drops": sum(g["kernel_drops"] for g in report["groups"]),
+            "receiver_cpu_percent": report["cpu_percent"],
+            "cpu_percent_per_100_groups": report["cpu_percent_per_100_groups"],
+        }
+        results.append(result)
+        print(f"  {result['active_groups']}/{count} active | {result['received_mbps']:.1f} Mbps | "
+              f"receiver CPU {result['receiver_cpu_percent']:.1f}% "
+              f"({result['cpu_percent_per_100_groups']:.1f}% per 100 groups) | "
+              f"lost {result['lost_ts_packets']} | kernel drops {result['kernel_drops']}")
+    write_results(args.output, "groups", vars(args), results)
+
+def read_playlist_segments(playlist):
+    """Return {media_sequence: duration} for the segments listed in an HLS playlist (bytes or None)"""
+    if not playlist:
+        return {}
+    lines = playlist.decode("utf-8", "replace").splitlines()
+    sequence = 0
+    duration = None
+    segments = {}
+    for line in lines:
+        if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            sequence = int(line.split(":", 1)[1])
+        elif line.startswith("#EXTINF:"):
+            duration = float(line.split(":", 1)[1].split(",")[0])
+        elif line and not line.startswith("#") and duration is not None:
+            segments[sequence] = duration
+            sequence += 1
+            duration = None
+    return segments
+
+class SegmentRateTracker:
+    """Measures how fast a channel produces HLS media relative to real time"""
+
+    def __init__(self, channel):
+        # Read through the channel so both memory and disk HLS storage work
+        self.channel = channel
+        self.seen = set(read_playlist_segments(channel.read_hls("playlist.m3u8")))
+        self.first_time = None
+        self.last_time = None
+        self.media_seconds = 0.0
+
+    def poll(self):
+        now = time.monotonic()
+        for sequence, duration in read_playlist_segments(self.channel.read_hls("playlist.m3u8")).items():
+            if sequence in self.seen:
+                continue
+            self.seen.add(sequence)
+            if self.first_time is None:
+                # The first new segment only marks the start of the measurement
+                self.first_time = now
+            else:
+                self.media_seconds += duration
+                self.last_time = now
+
+    @property
+    def realtime_factor(self):
+        if self.first_time is None or self.last_time is None or self.last_time <= self.first_time:
+            return 0.0
+        return self.media_seconds / (self.last_time - self.first_time)
+
+def benchmark_channels(args):
+    """Add channels one by one until the machine can no longer keep every channel at real time"""
+    source = CountingSource(args.source).start()
+    steps = []
+    max_sustained = 0
+    refusal = None
+    started = []
+    try:
+        for count in range(1, args.max_channels + 1):
+            channel_id = f"bench{count}"
+            success, message = server.start_channel(channel_id, source.url, args.multicast_addr,
+                                                    int(args.base_port) + count - 1, server.DEFAULT_TTL,
+                                                    args.pipeline, not args.no_cache)
+            if not success and scheduler_refused(message):
+                # The scheduler's own capacity estimate, not a measured limit
+                refusal = {"channels": count, "message": message}
+                print(f"Channel {channel_id} refused by the CPU scheduler: {message}", file=sys.stderr)
+                break
+            if not success:
+                print(f"Channel {channel_id} failed to start: {message}", file=sys.stderr)
+                break
+            started.append(channel_id)
+            print(f"\n{count} channel(s) running, warming up {args.warmup}s...")
+            time.sleep(args.warmup)
+
+            trackers = {cid: SegmentRateTracker(server.get_channel(cid))
+                        for cid in started}
+            psutil.cpu_percent(interval=None)
+            end_time = time.monotonic() + args.window
+            while time.monotonic() < end_time:
+                time.sleep(0.5)
+                for tracker in trackers.values():
+                    tracker.poll()
+            cpu_percent = psutil.cpu_percent(interval=None)
+
+            factors = {cid: tracker.realtime_factor for cid, tracker in trackers.items()}
+            alive = all(server.get_channel(cid).status()["hls_alive"] for cid in started)
+            sustained = alive and min(factors.values()) >= args.min_realtime
+            step = {
+                "channels": count,
+                "cpu_percent": cpu_percent,
+                "memory_percent": psutil.virtual_memory().percent,
+                "min_realtime_factor": min(factors.values()),
+                "realtime_factors": factors,
+                "all_alive": alive,
+                "sustained": sustained,
+            }
+            steps.append(step)
+            print(f"  CPU: {cpu_percent:.1f}% | min realtime factor: {step['min_realtime_factor']:.2f} | "
+                  f"{'OK' if sustained else 'NOT SUSTAINED'}")
+            if not sustained:
+                break
+            max_sustained = count
+    finally:
+        for channel_id in started:
+            server.stop_channel(channel_id)
+        source.stop()
+
+    print(f"\nMaximum sustained channels: {max_sustained} (CPU cores: {psutil.cpu_count()})")
+    if refusal is not None:
+        print(f"Stopped by the CPU scheduler at channel {refusal['channels']}, not by a measured limit "
+              f"(set server.SCHEDULER_ENABLED = False to measure past it)")
+    write_results(args.output, "channels", vars(args),
+                  {"max_sustained_channels": max_sustained, "cpu_count": psutil.cpu_count(), "steps": steps,
+                   "scheduler_refusal": refusal})
+
+async def timed_get(connection, path, kind, results):
+    """GET one path and record its latency under results[kind]; returns (status, body) or (None, b"")"""
+    start = time.perf_counter()
+    try:
+        status, _, body = await connection.request(path)
+    except (ConnectionError, OSError, asyncio.IncompleteReadError):
+        results["errors"] += 1
+        await connection.close()
+        return None, b""
+    results[kind].append((time.perf_counter() - start) * 1000)
+    results["bytes"] += len(body)
+    if status != 200:
+        results["errors"] += 1
+    return status, body
+
+async def hls_viewer(base_url, playlist_path, deadline, think_time, results):
+    """One simulated viewer: fetch the playlist, then its newest segment, in a loop on one connection"""
+    parsed = urllib.parse.urlparse(base_url)
+    connection = AsyncHTTPConnection(parsed.hostname, parsed.port or 80)
+    directory = playlist_path.rsplit("/", 1)[0]
+    try:
+        while time.monotonic() < deadline:
+            status, body = await timed_get(connection, playlist_path, "playlist", results)
+            if status is None:
+                await asyncio.sleep(0.1)
+                continue
+            uris = segment_uris(body.decode("utf-8", "replace")) if status == 200 else []
+            if uris:
+                await timed_get(connection, f"{directory}/{uris[-1]}", "segment", results)
+            if think_time:
+                await asyncio.sleep(think_time)
+    finally:
+        await connection.close()
+
+async def run_hls_load(base_url, playlist_path, viewers, duration, think_time=0.0):
+    """Run `viewers` concurrent simulated viewers for `duration` seconds"""
+    results = {"playlist": [], "segment": [], "errors": 0, "bytes": 0}
+    deadline = time.monotonic() + duration
+    start = time.monotonic()
+    await asyncio.gather(*(hls_viewer(base_url, playlist_path, deadline, think_time, results)
+                           for _ in range(viewers)))
+    elapsed = time.monotonic() - start
+    all_latencies = results["playlist"] + results["segment"]
+    return {
+        "viewers": viewers,
+        "duration_s": elapsed,
+        "requests": len(all_latencies),
+        "requests_per_second": len(all_latencies) / elapsed,
+        "errors": results["errors"],
+        "throughput_bytes_per_second": results["bytes"] / elapsed,
+        "latency": latency_summary(all_latencies),
+        "playlist_latency": latency_summary(results["playlist"]),
+        "segment_latency": latency_summary(results["segment"]),
+    }
+
+def api_get(base_url, path):
+    with urllib.request.urlopen(f"{base_url}{path}", timeout=30) as response:
+        return json.loads(response.read())
+
+def wait_for_playlist(base_url, playlist_path, timeout=30):
+    """Wait until a channel's playlist lists at least one segment"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}{playlist_path}", timeout=5) as response:
+                if segment_uris(response.read().decode()):
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.5)
+    return False
+
+def start_remote_channel(args, channel_id, storage, port):
+    """Start a shared-pipeline channel on a running server and wait for its first segment"""
+    query = urllib.parse.urlencode({
+        "cdn_url": args.cdn_url,
+        "multicast_addr": args.multicast_addr,
+        "port": port,
+        "pipeline": "shared",
+        "storage": storage,
+    })
+    print(f"Starting channel {channel_id}...")
+    response = api_get(args.server, f"/channels/{channel_id}/start?{query}")
+    if not response["success"]:
+        outcome = "refused by the CPU scheduler" if scheduler_refused(response["message"]) else "failed"
+        print(f"  {outcome}: {response['message']}", file=sys.stderr)
+        return None
+    playlist_path = f"/hls/{channel_id}/playlist.m3u8"
+    if not wait_for_playlist(args.server, playlist_path):
+        print(f"  no segments produced for {channel_id}", file=sys.stderr)
+        api_get(args.server, f"/channels/{channel_id}/stop")
+        return None
+    return playlist_path
+
+def print_load_result(result):
+    print(f"  {result['viewers']:5d} viewers | {result['requests_per_second']:8.0f} req/s | "
+          f"p50 {result['latency']['p50_ms']:7.1f} ms | p99 {result['latency']['p99_ms']:7.1f} ms | "
+          f"errors {result['errors']}")
+
+def benchmark_hls_serving(args):
+    """Requests/sec and latency of /hls/ for the disk and memory segment stores on a running server"""
+    server.raise_open_file_limit(args.viewers + 256)
+    results = []
+    for index, storage in enumerate(args.storages):
+        channel_id = f"bench-{storage}"
+        playlist_path = start_remote_channel(args, channel_id, storage, args.base_port + index)
+        if playlist_path is None:
+            continue
+        try:
+            print(f"  {args.viewers} viewers for {args.duration}s ({storage})...")
+            result = asyncio.run(run_hls_load(args.server, playlist_path, args.viewers, args.duration, args.think))
+            result["storage"] = storage
+            results.append(result)
+            print_load_result(result)
+        finally:
+            api_get(args.server, f"/channels/{channel_id}/stop")
+    write_results(args.output, "hls-serving", vars(args), results)
+
+def benchmark_http_load(args):
+    """Connection scaling: run increasing numbers of concurrent viewers against a running server"""
+    server.raise_open_file_limit(max(args.levels) + 256)
+    results = []
+    playlist_path = start_remote_channel(args, "bench-load", args.storage, args.base_port)
+    if playlist_path is None:
+        return
+    try:
+        status = api_get(args.server, "/status")
+        for viewers in sorted(args.levels):
+            result = asyncio.run(run_hls_load(args.server, playlist_path, viewers, args.duration, args.think))
+            results.append(result)
+            print_load_result(result)
+            if result["requests"] and result["errors"] > args.max_error_rate * result["requests"]:
+                print(f"Error rate above {args.max_error_rate:.0%}, stopping the ramp")
+                break
+    finally:
+        api_get(args.server, "/channels/bench-load/stop")
+    write_results(args.output, "http-load", vars(args), {"server_status": status, "levels": results})
+
+def first_video_pts(data):
+    """Presentation time (seconds) of the first video PES in an MPEG-TS chunk, or None"""
+    for offset in range(0, len(data) - 187, 188):
+        packet = data[offset:offset + 188]
+        if packet[0] != 0x47 or not packet[1] & 0x40:
+            continue
+        start = 4
+        if packet[3] & 0x20:
+            start += 1 + packet[4]
+        pes = packet[start:]
+        if len(pes) < 14 or pes[:3] != b"\x00\x00\x01" or not 0xE0 <= pes[3] <= 0xEF or not pes[7] & 0x80:
+            continue
+        pts = ((pes[9] >> 1) & 0x07) << 30 | pes[10] << 22 | (pes[11] >> 1) << 15 | pes[12] << 7 | pes[13] >> 1
+        return pts / 90000.0
+    return None
+
+def playlist_value(playlist_text, tag, default=None):
+    for line in playlist_text.splitlines():
+        if line.startswith(tag + ":"):
+            return line[len(tag) + 1:]
+    return default
+
+class DeliveryClock:
+    """Maps media PTS to the wall-clock time it was produced (ffmpeg reads with -re from the channel start)"""
+
+    def __init__(self, started_at):
+        self.started_at = started_at
+        self.first_pts = None
+        self.samples = []
+
+    def record(self, data, arrived_at):
+        pts = first_video_pts(data)
+        if pts is None:
+            return
+        if self.first_pts is None:
+            self.first_pts = pts
+        produced_at = self.started_at + (pts - self.first_pts)
+        self.samples.append(arrived_at - produced_at)
+
+async def standard_latency_client(base_url, playlist_path, clock, deadline):
+    """Classic HLS player: poll the playlist every half target duration and fetch each new segment"""
+    parsed = urllib.parse.urlparse(base_url)
+    connection = AsyncHTTPConnection(parsed.hostname, parsed.port or 80)
+    directory = playlist_path.rsplit("/", 1)[0]
+    seen = set()
+    try:
+        while time.monotonic() < deadline:
+            status, _, body = await connection.request(playlist_path)
+            text = body.decode("utf-8", "replace")
+            target = float(playlist_value(text, "#EXT-X-TARGETDURATION", server.HLS_SEGMENT_TIME))
+            for uri in segment_uris(text) if status == 200 else []:
+                if uri not in seen:
+                    seen.add(uri)
+                    status, _, data = await connection.request(f"{directory}/{uri}")
+                    if status == 200:
+                        clock.record(data, time.time())
+            await asyncio.sleep(target / 2)
+    finally:
+        await connection.close()
+    return target
+
+async def ll_latency_client(base_url, playlist_path, clock, deadline):
+    """LL-HLS player: blocking playlist reload for the next part, then fetch every new part"""
+    parsed = urllib.parse.urlparse(base_url)
+    connection = AsyncHTTPConnection(parsed.hostname, parsed.port or 80)
+    directory = playlist_path.rsplit("/", 1)[0]
+    seen = set()
+    query = ""
+    part_hold_back = None
+    try:
+        while time.monotonic() < deadline:
+            status, _, body = await connection.request(playlist_path + query)
+            if status != 200:
+                query = ""
+                await asyncio.sleep(0.1)
+                continue
+            text = body.decode("utf-8", "replace")
+            control = playlist_value(text, "#EXT-X-SERVER-CONTROL", "")
+            part_hold_back = float(control.split("PART-HOLD-BACK=")[1].split(",")[0])
+            lines = text.splitlines()
+            parts = [line.split('URI="')[1].split('"')[0] for line in lines if line.startswith("#EXT-X-PART:")]
+            for uri in parts:
+                if uri not in seen:
+                    seen.add(uri)
+                    status, _, data = await connection.request(f"{directory}/{uri}")
+                    if status == 200:
+                        clock.record(data, time.time())
+            # Next part = part count after the last full segment of the playlist
+            next_msn = int(playlist_value(text, "#EXT-X-MEDIA-SEQUENCE", "0")) + len(segment_uris(text))
+            last_segment = max((i for i, line in enumerate(lines) if line.startswith("#EXTINF")), default=-1)
+            next_part = sum(1 for line in lines[last_segment + 1:] if line.startswith("#EXT-X-PART:"))
+            query = f"?_HLS_msn={next_msn}&_HLS_part={next_part}"
+    finally:
+        await connection.close()
+    return part_hold_back
+
+def start_latency_channel(args, channel_id, hls_mode, port):
+    query = urllib.parse.urlencode({
+        "cdn_url": args.cdn_url,
+        "multicast_addr": args.multicast_addr,
+        "port": port,
+        "pipeline": "shared",
+        "storage": "memory",
+        "hls_mode": hls_mode,
+    })
+    print(f"Starting {hls_mode} channel {channel_id}...")
+    response = api_get(args.server, f"/channels/{channel_id}/start?{query}")
+    if not response["success"]:
+        outcome = "refused by the CPU scheduler" if scheduler_refused(response["message"]) else "failed"
+        print(f"  {outcome}: {response['message']}", file=sys.stderr)
+        return False
+    return True
+
+def wait_for_started_at(base_url, channel_id, timeout=LAUNCH_TIMEOUT):
+    """started_at of a channel once its background start has launched ffmpeg, None if it failed"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = api_get(base_url, f"/channels/{channel_id}/status")
+        if status["started_at"] is not None:
+            return status["started_at"]
+        if status["state"] in ("failed", "stopped"):
+            print(f"  {channel_id} did not start: {status['state_message']}", file=sys.stderr)
+            return None
+        time.sleep(0.2)
+    print(f"  {channel_id} did not start within {timeout} s", file=sys.stderr)
+    return None
+
+def benchmark_latency(args):
+    """Glass-to-client latency of standard HLS vs LL-HLS channels on a running server"""
+    results = {}
+    for index, hls_mode in enumerate(args.modes):
+        channel_id = f"bench-latency-{hls_mode}"
+        if not start_latency_channel(args, channel_id, hls_mode, args.base_port + index):
+            continue
+        playlist_path = f"/hls/{channel_id}/playlist.m3u8"
+        try:
+            # started_at is set once the background start has launched ffmpeg
+            started_at = wait_for_started_at(args.server, channel_id)
+            if started_at is None:
+                continue
+            if not wait_for_playlist(args.server, playlist_path):
+                print(f"  no segments produced for {channel_id}", file=sys.stderr)
+                continue
+            clock = DeliveryClock(started_at)
+            client = ll_latency_client if hls_mode == "ll" else standard_latency_client
+            hold_back = asyncio.run(client(args.server, playlist_path, clock, time.monotonic() + args.duration))
+            if hls_mode != "ll":
+                # Players start 3 target durations behind the live edge
+                hold_back = 3 * hold_back
+        finally:
+            api_get(args.server, f"/channels/{channel_id}/stop")
+
+        delivery_ms = [sample * 1000 for sample in clock.samples[1:]]
+        summary = latency_summary(delivery_ms)
+        results[hls_mode] = {
+            "delivery_latency": summary,
+            "hold_back_s": hold_back,
+            # Playback starts hold_back behind the newest media the client has, on top of delivery latency
+            "estimated_player_latency_s": summary["p50_ms"] / 1000 + hold_back,
+        }
+        print(f"  {hls_mode:8s} | delivery p50 {summary['p50_ms']:7.0f} ms | p99 {summary['p99_ms']:7.0f} ms | "
+              f"hold-back {hold_back:.1f} s | player latency ~{results[hls_mode]['estimated_player_latency_s']:.1f} s")
+    write_results(args.output, "latency", vars(args), results)
+
+def make_test_media(path, width, height, bitrate_kbps, seconds, fps=24):
+    """Deterministic test clip (moving test pattern and a tone), generated once and reused"""
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        result = subprocess.run([
+            "ffmpeg", "-loglevel", "error", "-y",
+            "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}:duration={seconds}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:beep_factor=4:sample_rate=48000:duration={seconds}",
+            "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-g", str(2 * fps),
+            "-b:v", f"{bitrate_kbps}k", "-maxrate", f"{bitrate_kbps}k", "-bufsize", f"{2 * bitrate_kbps}k",
+            "-c:a", "aac", "-b:a", "128k",
+            "-map_metadata", "-1", "-fflags", "+bitexact", "-flags", "+bitexact", "-movflags", "+faststart",
+            path + ".tmp.mp4",
+        ], stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode("utf-8", "replace").strip())
+        os.replace(path + ".tmp.mp4", path)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return {"path": path, "sha256": digest.hexdigest(), "width": width, "height": height,
+            "bitrate_kbps": bitrate_kbps, "seconds": seconds, "fps": fps}
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_local_server(directory, port, timeout=30):
+    """server.py in its own working directory (fresh caches and HLS output), ready to take requests"""
+    log = open(os.path.join(directory, "server.log"), "w")
+    process = subprocess.Popen([sys.executable, os.path.join(SCRIPT_DIR, "server.py"),
+                                "--host", "127.0.0.1", "--port", str(port)],
+                               cwd=directory, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            api_get(base_url, "/status")
+            return process, base_url
+        except OSError:
+            time.sleep(0.5)
+    process.kill()
+    raise RuntimeError(f"server.py did not start, see {os.path.join(directory, 'server.log')}")
+
+def stop_local_server(process, timeout=15):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def encoder_speeds(stats):
+    """Realtime factor of every ffmpeg process from the server's /stats"""
+    speeds = []
+    for channel_id, channel in stats.items():
+        for process in channel.get("processes", []):
+            speeds.append({"channel": channel_id, "role": process.get("role"),
+                           "avg_speed": process.get("avg_speed"), "min_speed": process.get("min_speed")})
+    return speeds
+
+def run_local_scenario(args, scenario, media, directory):
+    """One scenario end to end on this machine: shaped local CDN, server.py, HLS monitor, viewers and receiver"""
+    import checkPerformanceHLS
+
+    os.makedirs(directory, exist_ok=True)
+    source = CountingSource(media["path"], bandwidth_mbps=args.cdn_bandwidth, latency_ms=args.cdn_latency).start()
+    process, base_url = start_local_server(directory, free_port())
+    channel_ids = [server.DEFAULT_CHANNEL_ID] + [f"local-{i}" for i in range(1, scenario["channels"])]
+    result = {"scenario": scenario, "media": media, "errors": [], "scheduler_refusals": []}
+    try:
+        for index, channel_id in enumerate(list(channel_ids)):
+            query = urllib.parse.urlencode({
+                "cdn_url": source.url,
+                "multicast_addr": args.multicast_addr,
+                "port": args.base_port + index,
+                "ttl": 0,                       # Never leaves this host
+                "pipeline": args.pipeline,
+            })
+            response = api_get(base_url, f"/channels/{channel_id}/start?{query}")
+            if not response["success"] and scheduler_refused(response["message"]):
+                # Reported on its own: the scenario runs with the channels the scheduler admitted
+                result["scheduler_refusals"].append({"channel": channel_id, "message": response["message"]})
+                channel_ids.remove(channel_id)
+            elif not response["success"]:
+                raise RuntimeError(f"{channel_id} failed to start: {response['message']}")
+        for channel_id in channel_ids:
+            if not wait_for_playlist(base_url, f"/hls/{channel_id}/playlist.m3u8", timeout=60):
+                raise RuntimeError(f"no segments produced for {channel_id}")
+
+        # The monitor, the viewers and the multicast receiver run side by side for the same window
+        duration = str(args.duration)
+        clients = {
+            "monitor": [os.path.join(SCRIPT_DIR, "checkPerformanceHLS.py"), "--server", base_url,
+                        "--cdn-url", source.url, "--duration", duration, "--report-interval", duration,
+                        "--stats-dir", "hls_stats"],
+            "viewers": [os.path.join(SCRIPT_DIR, "checkPerformanceHLS.py"), "--load", "--server", base_url,
+                        "--viewers", str(scenario["viewers"]), "--level-duration", duration,
+                        "--output", "viewers.json"],
+            "multicast": [os.path.join(SCRIPT_DIR, "checkMulticast.py"), "--latency", "--group", args.multicast_addr,
+                          "--port", str(args.base_port), "--duration", duration, "--report", "multicast.json"],
+        }
+        running = {}
+        for name, command in clients.items():
+            with open(os.path.join(directory, f"{name}.log"), "w") as log:
+                running[name] = subprocess.Popen([sys.executable, *command], cwd=directory,
+                                                 stdout=log, stderr=subprocess.STDOUT)
+        for name, client in running.items():
+            try:
+                if client.wait(args.duration + 120) != 0:
+                    result["errors"].append(f"{name} exited with status {client.returncode}, see {name}.log")
+            except subprocess.TimeoutExpired:
+                client.kill()
+                result["errors"].append(f"{name} timed out")
+        result["encoders"] = encoder_speeds(api_get(base_url, "/stats"))
+        for channel_id in channel_ids:
+            status = api_get(base_url, f"/channels/{channel_id}/status")
+            if status.get("state") != "ready":
+                result["errors"].append(f"{channel_id} {status.get('state')}: {status.get('state_message')}")
+            api_get(base_url, f"/channels/{channel_id}/stop")
+    except (OSError, RuntimeError) as e:
+        result["errors"].append(str(e))
+    finally:
+        stop_local_server(process)
+        source.stop()
+        # The receiver also saves the stream; only its report is kept
+        for name in os.listdir(directory):
+            if name.startswith("multicast_stream_") and name.endswith(".ts"):
+                os.remove(os.path.join(directory, name))
+
+    result["cdn"] = {"bandwidth_mbps": args.cdn_bandwidth, "latency_ms": args.cdn_latency,
+                     "bytes": source.bytes_sent, "requests": source.requests}
+    runs = sorted(glob.glob(os.path.join(directory, "hls_stats", "run-*")))
+    if runs:
+        samples = checkPerformanceHLS.load_run_metrics(runs[-1])
+        result["monitor"] = {name: checkPerformanceHLS.describe_group([values]) if len(values) else None
+                             for name, values in samples.items()}
+    for name, path in (("viewers", "viewers.json"), ("multicast", "multicast.json")):
+        try:
+            with open(os.path.join(directory, path)) as f:
+                report = json.load(f)
+            result[name] = report["levels"][0] if name == "viewers" else report
+        except (OSError, ValueError, IndexError):
+            result[name] = None
+    return result
+
+def benchmark_local(args):
+    """Reproducible end-to-end runs without network: generated media, shaped local CDN, every client on loopback"""
+    os.makedirs(args.work_dir, exist_ok=True)
+    scenarios = [
+        {"resolution": resolution, "bitrate_kbps": bitrate, "channels": channels, "viewers": viewers}
+        for resolution in args.resolutions for bitrate in args.bitrates
+        for channels in args.channels for viewers in args.viewers
+    ]
+    for scenario in scenarios:
+        name = f"{scenario['resolution']}-{scenario['bitrate_kbps']}k-{scenario['channels']}ch-{scenario['viewers']}v"
+        width, height = (int(v) for v in scenario["resolution"].split("x"))
+        media = make_test_media(os.path.join(args.work_dir, "media", f"testsrc-{scenario['resolution']}-"
+                                             f"{scenario['bitrate_kbps']}k-{args.clip_seconds}s.mp4"),
+                                width, height, scenario["bitrate_kbps"], args.clip_seconds)
+        print(f"Scenario {name}: {args.duration} s...")
+        result = run_local_scenario(args, scenario, media, os.path.join(args.work_dir, name))
+        speeds = [e["avg_speed"] for e in result.get("encoders", []) if e["avg_speed"] is not None]
+        viewers = result.get("viewers") or {}
+        multicast = (result.get("multicast") or {}).get("latency") or {}
+        live = (result.get("monitor") or {}).get("live_latency_ms") or {}
+        print(f"  slowest encoder {min(speeds) if speeds else float('nan'):.2f}x realtime | "
+              f"HLS live p50 {live.get('p50', float('nan')):.0f} ms | "
+              f"multicast p50 {multicast.get('p50_ms', float('nan')):.0f} ms | "
+              f"rebuffer {viewers.get('rebuffer_ratio', float('nan')):.2%} | "
+              f"CDN {result['cdn']['bytes'] / 1e6:.1f} MB | errors {len(result['errors'])} | "
+              f"refused by scheduler {len(result['scheduler_refusals'])}")
+        for error in result["errors"]:
+            print(f"  {error}", file=sys.stderr)
+        for refusal in result["scheduler_refusals"]:
+            print(f"  {refusal['channel']} refused by the CPU scheduler: {refusal['message']}", file=sys.stderr)
+        write_results(os.path.join(args.work_dir, f"{name}.json"), "local", vars(args), result)
+
+SWEEP_CPU_HEADROOM = 0.8            # Share of the cores a suggested profile may use (rest for muxing, HTTP, spikes)
+
+def sweep_configs(args):
+    """Encoder settings to measure: every combination of the sweep options, plus the current multicast settings"""
+    current = server.MULTICAST_ENCODE_ARGS
+    configs = [{"name": f"current-t{threads}", "preset": None, "gop": int(current[current.index("-g") + 1]),
+                "bitrate_kbps": int(current[current.index("-b:v") + 1].rstrip("k")), "threads": threads}
+               for threads in args.threads]
+    for preset in args.presets:
+        for gop in args.gops:
+            for bitrate in args.bitrates:
+                for threads in args.threads:
+                    configs.append({"name": f"{preset}-g{gop}-{bitrate}k-t{threads}", "preset": preset, "gop": gop,
+                                    "bitrate_kbps": bitrate, "threads": threads})
+    return configs
+
+def sweep_encode_args(config, profile):
+    """Video encoder arguments of one sweep config (audio is left out, it costs the same in every config)"""
+    if config["preset"] is None:
+        video = server.MULTICAST_ENCODE_ARGS[:server.MULTICAST_ENCODE_ARGS.index("-c:a")]
+    else:
+        bitrate = config["bitrate_kbps"]
+        video = [
+            "-c:v", "libx264",
+            "-preset", config["preset"],
+            "-tune", "zerolatency",         # Live output: no lookahead or frame delay, like the multicast encode
+            "-profile:v", profile,
+            "-b:v", f"{bitrate}k", "-maxrate", f"{bitrate * 5 // 4}k", "-bufsize", f"{bitrate * 5 // 4}k",
+            "-g", str(config["gop"]), "-keyint_min", str(config["gop"]), "-sc_threshold", "0",
+        ]
+    return [*video, "-threads", str(config["threads"]), "-an"]
+
+def measure_quality(encoded, reference, vmaf):
+    """PSNR, SSIM and (if FFmpeg has libvmaf) VMAF of an encode against its source"""
+    outputs = 3 if vmaf else 2
+    graph = (f"[0:v]setpts=PTS-STARTPTS,split={outputs}[d0][d1]{'[d2]' if vmaf else ''};"
+             f"[1:v]setpts=PTS-STARTPTS,split={outputs}[r0][r1]{'[r2]' if vmaf else ''};"
+             "[d0][r0]psnr[p];[d1][r1]ssim[s]" + (";[d2][r2]libvmaf[v]" if vmaf else ""))
+    command = ["ffmpeg", "-hide_banner", "-nostats", "-i", encoded, "-i", reference, "-filter_complex", graph]
+    for label in ("p", "s", "v")[:outputs]:
+        command += ["-map", f"[{label}]", "-f", "null", "-"]
+    log = subprocess.run(command, stderr=subprocess.PIPE).stderr.decode("utf-8", "replace")
+    quality = {"psnr_db": None, "ssim": None, "vmaf": None}
+    for line in log.splitlines():
+        if "PSNR" in line and "average:" in line:
+            value = line.split("average:")[1].split()[0]
+            quality["psnr_db"] = float(value) if value != "inf" else None
+        elif "SSIM" in line and "All:" in line:
+            quality["ssim"] = float(line.split("All:")[1].split()[0])
+        elif "VMAF score:" in line:
+            quality["vmaf"] = float(line.split("VMAF score:")[1].split()[0])
+    return quality
+
+def run_sweep_encode(config, source, seconds, path, profile):
+    """Encode the clip as fast as possible with one config; speed, CPU per output second and bitrate
+
+    The output is Matroska: its overhead is negligible, so the bitrate is the one of the video stream.
+    """
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    result = subprocess.run(["ffmpeg", "-loglevel", "error", "-y", "-i", source, "-map", "0:v:0",
+                             *sweep_encode_args(config, profile), "-f", "matroska", path], stderr=subprocess.PIPE)
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode("utf-8", "replace").strip())
+    cpu_seconds = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return {
+        "realtime_factor": seconds / elapsed,
+        "cpu_seconds_per_second": cpu_seconds / seconds,
+        "output_kbps": os.path.getsize(path) * 8 / seconds / 1000,
+    }
+
+def suggest_profiles(results, channel_counts, cores):
+    """Best quality config per target bitrate for N channels on this many cores
+
+    A config fits when N encodes use at most SWEEP_CPU_HEADROOM of the cores and one encode alone is faster than
+    realtime. VMAF decides when measured, else SSIM; less CPU breaks ties.
+    """
+    metric = "vmaf" if all(r["vmaf"] is not None for r in results) else "ssim"
+    suggestions = []
+    bitrates = sorted({r["bitrate_kbps"] for r in results if r["bitrate_kbps"] is not None})
+    for channels in channel_counts:
+        for bitrate in bitrates:
+            fitting = [r for r in results
+                       if r["bitrate_kbps"] == bitrate and r["realtime_factor"] >= 1.0
+                       and channels * r["cpu_seconds_per_second"] <= SWEEP_CPU_HEADROOM * cores]
+            best = max(fitting, key=lambda r: (r[metric] or 0, -r["cpu_seconds_per_second"]), default=None)
+            suggestions.append({
+                "channels": channels,
+                "cores": cores,
+                "bitrate_kbps": bitrate,
+                "config": best["name"] if best else None,
+                metric: best[metric] if best else None,
+                "cpu_cores_used": channels * best["cpu_seconds_per_second"] if best else None,
+            })
+    return metric, suggestions
+
+def benchmark_encoder_sweep(args):
+    """Encode speed, CPU cost, bitrate and quality of encoder settings, and the best profile per CPU budget"""
+    os.makedirs(args.work_dir, exist_ok=True)
+    if args.source:
+        source, seconds = args.source, args.seconds
+        trimmed = os.path.join(args.work_dir, "source.mp4")
+        # Every config encodes the same first `seconds` of the source
+        subprocess.run(["ffmpeg", "-loglevel", "error", "-y", "-t", str(seconds), "-i", source,
+                        "-map", "0:v:0", "-c", "copy", trimmed], check=True)
+        source = trimmed
+    else:
+        width, height = (int(v) for v in args.resolution.split("x"))
+        media = make_test_media(os.path.join(args.work_dir, f"testsrc-{args.resolution}-{args.seconds}s.mp4"),
+                                width, height, 8000, args.seconds)
+        source, seconds = media["path"], args.seconds
+    vmaf = "libvmaf" in subprocess.run(["ffmpeg", "-hide_banner", "-filters"],
+                                       stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode()
+    print(f"Sweeping encoder settings on {source} ({seconds} s, quality: PSNR, SSIM{', VMAF' if vmaf else ''})")
+
+    results = []
+    for config in sweep_configs(args):
+        path = os.path.join(args.work_dir, f"{config['name']}.mkv")
+        try:
+            measured = run_sweep_encode(config, source, seconds, path, args.profile)
+            measured.update(measure_quality(path, source, vmaf))
+        except RuntimeError as e:
+            print(f"  {config['name']}: failed: {e}", file=sys.stderr)
+            continue
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        result = {**config, **measured}
+        results.append(result)
+        print(f"  {config['name']:26s} | {measured['realtime_factor']:6.1f}x realtime | "
+              f"{measured['cpu_seconds_per_second']:5.2f} CPU-s/s | {measured['output_kbps']:6.0f} kbps | "
+              f"PSNR {measured['psnr_db'] or float('nan'):5.2f} dB | SSIM {measured['ssim'] or float('nan'):.4f}"
+              + (f" | VMAF {measured['vmaf']:5.1f}" if measured["vmaf"] is not None else ""))
+
+    cores = args.cores or os.cpu_count()
+    metric, suggestions = suggest_profiles(results, args.target_channels, cores)
+    print(f"\nBest profile by {metric.upper()} on {cores} cores (at most {SWEEP_CPU_HEADROOM:.0%} CPU):")
+    for suggestion in suggestions:
+        if suggestion["config"]:
+            print(f"  {suggestion['channels']:3d} channels @ {suggestion['bitrate_kbps']} kbps: {suggestion['config']} "
+                  f"({metric.upper()} {suggestion[metric]:.3f}, {suggestion['cpu_cores_used']:.2f} cores)")
+        else:
+            print(f"  {suggestion['channels']:3d} channels @ {suggestion['bitrate_kbps']} kbps: nothing fits")
+    write_results(args.output, "encoder-sweep", vars(args), {"configs": results, "quality_metric": metric,
+                                                              "suggestions": suggestions})
+
+def run_fec_receivers(args, directory, matrix):
+    """One checkMulticast.py --fec receiver per injected loss rate, all on the same group at the same time"""
+    running = {}
+    for index, rate in enumerate(args.loss_rates):
+        command = [os.path.join(SCRIPT_DIR, "checkMulticast.py"), "--fec", "--group", args.multicast_addr,
+                   "--port", str(args.port), "--duration", str(args.duration), "--drop-rate", str(rate),
+                   "--drop-burst", str(args.burst), "--seed", str(args.seed + index),
+                   "--report", f"fec-{rate}.json"]
+        with open(os.path.join(directory, f"receiver-{rate}.log"), "w") as log:
+            running[rate] = subprocess.Popen([sys.executable, *command], cwd=directory,
+                                             stdout=log, stderr=subprocess.STDOUT)
+    reports = {}
+    for rate, receiver in running.items():
+        try:
+            receiver.wait(args.duration + 60)
+            with open(os.path.join(directory, f"fec-{rate}.json")) as f:
+                reports[rate] = json.load(f)["fec"]
+        except (subprocess.TimeoutExpired, OSError, ValueError, KeyError):
+            receiver.kill()
+            print(f"  {matrix} @ {rate:.2%}: receiver failed, see receiver-{rate}.log", file=sys.stderr)
+    # The receivers also save the stream; only their reports are kept
+    for name in os.listdir(directory):
+        if name.startswith("multicast_stream_") and name.endswith(".ts"):
+            os.remove(os.path.join(directory, name))
+    return reports
+
+def benchmark_fec(args):
+    """Bandwidth and CPU overhead of SMPTE 2022-1 FEC matrices, and residual loss at injected loss rates"""
+    os.makedirs(args.work_dir, exist_ok=True)
+    width, height = (int(v) for v in args.resolution.split("x"))
+    media = make_test_media(os.path.join(args.work_dir, "media", f"testsrc-{args.resolution}-{args.bitrate}k-"
+                                         f"{args.clip_seconds}s.mp4"), width, height, args.bitrate, args.clip_seconds)
+    source = CountingSource(media["path"]).start()
+    process, base_url = start_local_server(args.work_dir, free_port())
+    results = []
+    try:
+        for matrix in args.matrices:
+            directory = os.path.join(args.work_dir, matrix)
+            os.makedirs(directory, exist_ok=True)
+            query = urllib.parse.urlencode({"cdn_url": source.url, "multicast_addr": args.multicast_addr,
+                                            "port": args.port, "ttl": 0, "fec": matrix})
+            response = api_get(base_url, f"/channels/fec/start?{query}")
+            if not response["success"] or not wait_for_playlist(base_url, "/hls/fec/playlist.m3u8", timeout=60):
+                print(f"  {matrix}: failed to start: {response['message']}", file=sys.stderr)
+                api_get(base_url, "/channels/fec/stop")
+                continue
+            processes = api_get(base_url, "/processes")["channels"]["fec"]["processes"]
+            pids = [p["pid"] for p in processes if p["role"] in ("multicast", "shared")]
+            cpu_start, start_time = process_cpu_seconds(pids), time.monotonic()
+            print(f"FEC {matrix}: {args.duration} s...")
+            if matrix == server.MULTICAST_FEC_OFF:
+                # Plain UDP cannot be checked for recovery: only the CPU baseline
+                time.sleep(args.duration)
+                reports = {}
+            else:
+                reports = run_fec_receivers(args, directory, matrix)
+            cpu_percent = 100.0 * (process_cpu_seconds(pids) - cpu_start) / (time.monotonic() - start_time)
+            api_get(base_url, "/channels/fec/stop")
+            if not reports:
+                results.append({"matrix": matrix, "multicast_cpu_percent": cpu_percent})
+                print(f"  multicast encoder CPU {cpu_percent:.1f}%")
+                continue
+            for rate, report in reports.items():
+                results.append({"matrix": matrix, "drop_rate": rate, "burst": args.burst,
+                                "multicast_cpu_percent": cpu_percent, **report})
+                print(f"  drop {rate:6.2%}: overhead {report['overhead'] or 0:5.1%} | "
+                      f"loss {report['loss_before_fec'] or 0:6.3%} -> {report['loss_after_fec'] or 0:6.3%} | "
+                      f"recovered {report['recovered']}/{report['missing_before_fec']} | "
+                      f"multicast encoder CPU {cpu_percent:.1f}%")
+    finally:
+        stop_local_server(process)
+        source.stop()
+    write_results(args.output, "fec", vars(args), results)
+
+def write_results(path, benchmark, params, results):
+    """Save benchmark results as JSON"""
+    params = {k: v for k, v in params.items() if k != "func"}
+    with open(path, "w") as f:
+        json.dump({
+            "benchmark": benchmark,
+            "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "params": params,
+            "results": results,
+        }, f, indent=4)
+    print(f"\nResults saved to {path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the streaming server")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    pipeline = subparsers.add_parser("pipeline", help="CPU and CDN bytes per channel: separate vs shared encode")
+    pipeline.add_argument("--source", default=server.DEFAULT_CDN_URL,
+                          help="local video file or CDN URL to serve through the counting proxy")
+    pipeline.add_argument("--multicast-addr", default=server.DEFAULT_MULTICAST_ADDR)
+    pipeline.add_argument("--port", default=server.DEFAULT_PORT)
+    pipeline.add_argument("--duration", type=int, default=30, help="seconds per mode")
+    pipeline.add_argument("--modes", nargs="+", default=list(server.PIPELINE_MODES), choices=server.PIPELINE_MODES)
+    pipeline.add_argument("--no-cache", action="store_true", help="read the source directly instead of via the cache")
+    pipeline.add_argument("--output", default="benchmark_pipeline.json")
+    pipeline.set_defaults(func=benchmark_pipeline)
+
+    passthrough = subparsers.add_parser("passthrough", help="CPU per channel: re-encode vs remux-only passthrough")
+    passthrough.add_argument("--source", default=server.DEFAULT_CDN_URL,
+                             help="H.264/AAC source with short GOPs (local file or CDN URL)")
+    passthrough.add_argument("--multicast-addr", default=server.DEFAULT_MULTICAST_ADDR)
+    passthrough.add_argument("--port", default=server.DEFAULT_PORT)
+    passthrough.add_argument("--pipeline", default=server.DEFAULT_PIPELINE, choices=server.PIPELINE_MODES)
+    passthrough.add_argument("--duration", type=int, default=30, help="seconds per mode")
+    passthrough.add_argument("--no-cache", action="store_true", help="read the source directly instead of via the cache")
+    passthrough.add_argument("--output", default="benchmark_passthrough.json")
+    passthrough.set_defaults(func=benchmark_passthrough)
+
+    sender = subparsers.add_parser("sender", help="CPU and inter-packet jitter of the paced TS multicast sender")
+    sender.add_argument("--source", default=server.DEFAULT_CDN_URL,
+                        help="H.264/AAC source, remuxed into constant-bitrate TS files")
+    sender.add_argument("--rates", type=int, nargs="+", default=[10, 20, 50], help="bitrates in Mbps")
+    sender.add_argument("--clip-seconds", type=int, default=10, help="length of the TS file (it is looped)")
+    sender.add_argument("--port", type=int, default=5500, help="local UDP port of the receiver")
+    sender.add_argument("--duration", type=int, default=15, help="seconds per bitrate")
+    sender.add_argument("--work-dir", default="benchmark_sender")
+    sender.add_argument("--output", default="benchmark_sender.json")
+    sender.set_defaults(func=benchmark_sender)
+
+    groups = subparsers.add_parser("groups", help="receiver CPU per 100 multicast groups monitored from one process")
+    groups.add_argument("--source", default=server.DEFAULT_CDN_URL,
+                        help="H.264/AAC source, remuxed into a constant-bitrate TS file")
+    groups.add_argument("--counts", type=int, nargs="+", default=[10, 50, 100], help="numbers of groups")
+    groups.add_argument("--rate", type=int, default=1, help="Mbps per group")
+    groups.add_argument("--base-group", default="239.255.10.1", help="first multicast group")
+    groups.add_argument("--port", type=int, default=5600)
+    groups.add_argument("--clip-seconds", type=int, default=10, help="length of the TS file (it is looped)")
+    groups.add_argument("--duration", type=int, default=15, help="seconds per group count")
+    groups.add_argument("--work-dir", default="benchmark_groups")
+    groups.add_argument("--output", default="benchmark_groups.json")
+    groups.set_defaults(func=benchmark_groups)
+
+    ladder = subparsers.add_parser("ladder", help="encode CPU per ABR rendition and for the whole ladder")
+    ladder.add_argument("--source", default=server.DEFAULT_CDN_URL, help="local video file or CDN URL")
+    ladder.add_argument("--ladder", default="1080p,720p,480p,audio",
+                        help=f"comma-separated renditions ({', '.join(server.HLS_RENDITIONS)})")
+    ladder.add_argument("--multicast-addr", default="127.0.0.1")
+    ladder.add_argument("--port", default=server.DEFAULT_PORT)
+    ladder.add_argument("--duration", type=int, default=20, help="seconds per measurement")
+    ladder.add_argument("--output", default="benchmark_ladder.json")
+    ladder.set_defaults(func=benchmark_ladder)
+
+    channels = subparsers.add_parser("channels", help="how many concurrent channels this machine sustains")
+    channels.add_argument("--source", default=server.DEFAULT_CDN_URL,
+                          help="local video file or CDN URL to serve through the counting proxy")
+    channels.add_argument("--multicast-addr", default=server.DEFAULT_MULTICAST_ADDR)
+    channels.add_argument("--base-port", type=int, default=5000, help="channel N uses base-port + N - 1")
+    channels.add_argument("--pipeline", default=server.DEFAULT_PIPELINE, choices=server.PIPELINE_MODES)
+    channels.add_argument("--max-channels", type=int, default=64)
+    channels.add_argument("--warmup", type=int, default=10, help="seconds to wait after adding a channel")
+    channels.add_argument("--window", type=int, default=20, help="measurement window per step in seconds")
+    channels.add_argument("--min-realtime", type=float, default=0.95,
+                          help="every channel must produce HLS at least this fast relative to real time")
+    channels.add_argument("--no-cache", action="store_true", help="read the source directly instead of via the cache")
+    channels.add_argument("--output", default="benchmark_channels.json")
+    channels.set_defaults(func=benchmark_channels)
+
+    serving = subparsers.add_parser("hls-serving",
+                                    help="requests/sec and p99 latency of /hls/ (disk vs memory) on a running server")
+    serving.add_argument("--server", default="http://127.0.0.1:3000")
+    serving.add_argument("--cdn-url", default=server.DEFAULT_CDN_URL)
+    serving.add_argument("--multicast-addr", default=server.DEFAULT_MULTICAST_ADDR)
+    serving.add_argument("--base-port", type=int, default=5100)
+    serving.add_argument("--viewers", type=int, default=1000)
+    serving.add_argument("--duration", type=int, default=30)
+    serving.add_argument("--think", type=float, default=0.0, help="seconds each viewer waits between rounds")
+    serving.add_argument("--storages", nargs="+", default=["disk", "memory"], choices=server.HLS_STORAGE_MODES)
+    serving.add_argument("--output", default="benchmark_hls_serving.json")
+    serving.set_defaults(func=benchmark_hls_serving)
+
+    load = subparsers.add_parser("http-load", help="connection scaling of a running server (rising viewer counts)")
+    load.add_argument("--server", default="http://127.0.0.1:3000")
+    load.add_argument("--cdn-url", default=server.DEFAULT_CDN_URL)
+    load.add_argument("--multicast-addr", default=server.DEFAULT_MULTICAST_ADDR)
+    load.add_argument("--base-port", type=int, default=5200)
+    load.add_argument("--storage", default=server.HLS_STORAGE, choices=server.HLS_STORAGE_MODES)
+    load.add_argument("--levels", type=int, nargs="+", default=[10, 50, 100, 250, 500, 1000, 2000])
+    load.add_argument("--duration", type=int, default=20, help="seconds per level")
+    load.add_argument("--think", type=float, default=0.0, help="seconds each viewer waits between rounds")
+    load.add_argument("--max-error-rate", type=float, default=0.01)
+    load.add_argument("--output", default="benchmark_http_load.json")
+    load.set_defaults(func=benchmark_http_load)
+
+    latency = subparsers.add_parser("latency", help="live latency of standard HLS vs LL-HLS on a running server")
+    latency.add_argument("--server", default="http://127.0.0.1:3000")
+    latency.add_argument("--cdn-url", default=server.DEFAULT_CDN_URL)
+    latency.add_argument("--multicast-addr", default=server.DEFAULT_MULTICAST_ADDR)
+    latency.add_argument("--base-port", type=int, default=5300)
+    latency.add_argument("--modes", nargs="+", default=list(server.HLS_MODES), choices=server.HLS_MODES)
+    latency.add_argument("--duration", type=int, default=30, help="seconds per mode")
+    latency.add_argument("--output", default="benchmark_latency.json")
+    latency.set_defaults(func=benchmark_latency)
+
+    local = subparsers.add_parser("local", help="end-to-end scenarios without network: generated media, "
+                                                 "shaped local CDN, server.py and all clients on this host")
+    local.add_argument("--resolutions", nargs="+", default=["1280x720"], help="WIDTHxHEIGHT of the test media")
+    local.add_argument("--bitrates", type=int, nargs="+", default=[2000], help="test media bitrates in kbps")
+    local.add_argument("--channels", type=int, nargs="+", default=[1, 2], help="concurrent channel counts")
+    local.add_argument("--viewers", type=int, nargs="+", default=[10, 100], help="simulated HLS viewer counts")
+    local.add_argument("--clip-seconds", type=int, default=120,
+                       help="length of the test media; should outlast the run (only the multicast encode loops it)")
+    local.add_argument("--duration", type=int, default=30, help="measurement seconds per scenario")
+    local.add_argument("--cdn-bandwidth", type=float, help="Mbps of the local CDN link (default unlimited)")
+    local.add_argument("--cdn-latency", type=float, default=0.0, help="ms added to every CDN response")
+    local.add_argument("--pipeline", default=server.DEFAULT_PIPELINE, choices=server.PIPELINE_MODES)
+    local.add_argument("--multicast-addr", default="239.255.42.1")
+    local.add_argument("--base-port", type=int, default=5400, help="channel N uses base-port + N")
+    local.add_argument("--work-dir", default="benchmark_local", help="media, per-scenario logs and results")
+    local.set_defaults(func=benchmark_local)
+
+    sweep = subparsers.add_parser("encoder-sweep", help="speed, CPU, bitrate and quality of x264 settings, and "
+                                                        "the best profile for N channels per core count")
+    sweep.add_argument("--source", help="local clip (default: a generated test clip)")
+    sweep.add_argument("--resolution", default="1280x720", help="WIDTHxHEIGHT of the generated clip")
+    sweep.add_argument("--seconds", type=int, default=20, help="seconds of the clip to encode")
+    sweep.add_argument("--presets", nargs="+", default=["ultrafast", "superfast", "veryfast", "faster"])
+    sweep.add_argument("--gops", type=int, nargs="+", default=[12, 48], help="keyframe intervals in frames")
+    sweep.add_argument("--bitrates", type=int, nargs="+", default=[800, 2000], help="video bitrates in kbps")
+    sweep.add_argument("--threads", type=int, nargs="+", default=[1, 2], help="x264 thread counts")
+    sweep.add_argument("--profile", default="baseline", help="H.264 profile of the swept configs")
+    sweep.add_argument("--target-channels", type=int, nargs="+", default=[1, 2, 4, 8],
+                       help="channel counts to suggest a profile for")
+    sweep.add_argument("--cores", type=int, help="cores of the target machine (default: this machine)")
+    sweep.add_argument("--work-dir", default="benchmark_encoder_sweep")
+    sweep.add_argument("--output", default="benchmark_encoder_sweep.json")
+    sweep.set_defaults(func=benchmark_encoder_sweep)
+
+    fec = subparsers.add_parser("fec", help="bandwidth/CPU overhead of SMPTE 2022-1 FEC and recovery at injected "
+                                            "loss rates, on this host")
+    fec.add_argument("--matrices", nargs="+", default=["off", "5x5", "10x5", "10x10"],
+                     help="FEC matrices LxD (\"off\" measures the CPU baseline)")
+    fec.add_argument("--loss-rates", type=float, nargs="+", default=[0.001, 0.0025, 0.005, 0.01, 0.02],
+                     help="fractions of datagrams dropped by the receivers")
+    fec.add_argument("--burst", type=int, default=1, help="consecutive datagrams lost per loss event")
+    fec.add_argument("--seed", type=int, default=1, help="random seed of the first receiver")
+    fec.add_argument("--resolution", default="1280x720", help="WIDTHxHEIGHT of the test media")
+    fec.add_argument("--bitrate", type=int, default=2000, help="test media bitrate in kbps")
+    fec.add_argument("--clip-seconds", type=int, default=120, help="length of the test media")
+    fec.add_argument("--duration", type=int, default=60, help="measurement seconds per matrix")
+    fec.add_argument("--multicast-addr", default="239.255.43.1")
+    fec.add_argument("--port", type=int, default=5700, help="media port (FEC uses port+2 and port+4)")
+    fec.add_argument("--work-dir", default="benchmark_fec")
+    fec.add_argument("--output", default="benchmark_fec.json")
+    fec.set_defaults(func=benchmark_fec)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
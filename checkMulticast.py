@@ -3,11 +3,1148 @@ import struct
 import time
 import os
 import sys
+import argparse
+import ctypes
+import errno
+import select
+import selectors
+import resource
+import json
+import random
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # Cấu hình địa chỉ multicast và cổng
 MCAST_GRP = '239.255.0.1'  # Địa chỉ multicast
 MCAST_PORT = 1234          # Cổng phát
 
+# Chế độ nhanh (--fast)
+FAST_RCVBUF = 32 * 1024 * 1024      # SO_RCVBUF yêu cầu (Linux giới hạn bởi net.core.rmem_max)
+FAST_BATCH = 64                     # Số datagram tối đa mỗi lần recvmmsg
+FAST_SLOT_SIZE = 65536              # Kích thước mỗi ô nhận (đủ cho datagram UDP lớn nhất)
+FAST_WRITE_BUFFER = 4 * 1024 * 1024 # Bộ đệm ghi file
+MSG_DONTWAIT = 0x40
+SO_TIMESTAMPNS = 35                 # Linux: kernel gắn thời điểm nhận vào từng datagram
+TIMESTAMP_CONTROL_SIZE = 32         # CMSG_SPACE(sizeof(struct timespec)) trên 64-bit
+
+# Chế độ phân tích MPEG-TS (--analyze)
+TS_PACKET_SIZE = 188
+ANALYZE_CHUNK = 1024                # Số datagram gom lại trước mỗi lần phân tích bằng NumPy
+PCR_MAX_INTERVAL = 0.04             # ETSI TR 101 290: PCR lặp lại tối đa mỗi 40 ms
+PAT_MAX_INTERVAL = 0.5              # ETSI TR 101 290: PAT/PMT lặp lại tối đa mỗi 0.5 giây
+DATAGRAM_GAP_THRESHOLD = 0.05       # Khoảng lặng giữa hai datagram được tính là gap (giây)
+ANALYZER_SAMPLES = 100000           # Số mẫu PCR giữ lại cho báo cáo cuối
+TS_CLOCK_PERIOD = 2 ** 33 / 90000   # Chu kỳ quay vòng của PTS/DTS (33 bit, 90 kHz)
+
+# Chế độ nhiều nhóm (--groups / --groups-file)
+GROUP_RCVBUF = 4 * 1024 * 1024      # SO_RCVBUF của mỗi socket
+GROUP_STALE_AFTER = 2.0             # Nhóm không có dữ liệu quá số giây này bị coi là mất tín hiệu
+IP_MULTICAST_ALL = 49               # Linux
+IP_ADD_SOURCE_MEMBERSHIP = getattr(socket, 'IP_ADD_SOURCE_MEMBERSHIP', 39)
+IP_DROP_SOURCE_MEMBERSHIP = getattr(socket, 'IP_DROP_SOURCE_MEMBERSHIP', 40)
+
+# Chế độ FEC SMPTE 2022-1 / Pro-MPEG (--fec)
+RTP_HEADER_SIZE = 12
+FEC_HEADER_SIZE = 16
+FEC_COLUMN_PORT_OFFSET = 2          # FEC cột ở cổng media + 2, FEC hàng ở cổng media + 4
+FEC_ROW_PORT_OFFSET = 4
+FEC_HOLD_MATRICES = 3               # Giữ gói media 3 ma trận L x D để chờ FEC (FEC cột đến sau cả ma trận)
+FEC_DEFAULT_MATRIX = 100            # L x D giả định trước khi nhận gói FEC đầu tiên
+
+parser = argparse.ArgumentParser(description="Multicast stream receiver")
+parser.add_argument("--group", default=MCAST_GRP, help="multicast group")
+parser.add_argument("--port", type=int, default=MCAST_PORT)
+parser.add_argument("--fast", action="store_true",
+                    help="high-throughput mode: batched receive, large SO_RCVBUF, buffered writes, 1 s status line")
+parser.add_argument("--rcvbuf", type=int, default=FAST_RCVBUF, help="SO_RCVBUF in bytes for --fast")
+parser.add_argument("--duration", type=float, default=0,
+                    help="with --fast or multi-group mode: stop after this many seconds (0 = until Ctrl+C)")
+parser.add_argument("--analyze", action="store_true",
+                    help="analyze the MPEG-TS stream (CC errors, PCR, per-PID bitrate, PAT/PMT, gaps); implies --fast")
+parser.add_argument("--latency", action="store_true",
+                    help="end-to-end latency from wall-clock PTS/DTS stamped by the server (same clock: same host "
+                         "or NTP/PTP); implies --analyze")
+parser.add_argument("--fec", action="store_true",
+                    help="RTP stream with SMPTE 2022-1 row/column FEC on port+2/port+4 (server fec=LxD): "
+                         "rebuild lost datagrams and report recovered vs lost")
+parser.add_argument("--drop-rate", type=float, default=0.0,
+                    help="with --fec: drop this fraction of the received datagrams (media and FEC) to simulate loss")
+parser.add_argument("--drop-burst", type=int, default=1, help="with --drop-rate: consecutive datagrams per loss event")
+parser.add_argument("--seed", type=int, help="random seed for --drop-rate")
+parser.add_argument("--report", help="JSON report path for --analyze, --fec or multi-group mode")
+parser.add_argument("--groups", nargs="+", metavar="[SOURCE@]GROUP:PORT[%IFACE]",
+                    help="monitor several groups from one process (no file is saved); "
+                         "SOURCE joins source-specific, IFACE is an interface name or address")
+parser.add_argument("--groups-file", help="file with one [SOURCE@]GROUP:PORT[%%IFACE] entry per line")
+args = parser.parse_args()
+if args.latency:
+    args.analyze = True
+if args.drop_rate and not args.fec:
+    parser.error("--drop-rate requires --fec")
+if args.analyze:
+    if np is None:
+        parser.error("--analyze requires numpy")
+    args.fast = True
+MCAST_GRP = args.group
+MCAST_PORT = args.port
+
+class IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(IOVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", MsgHdr), ("msg_len", ctypes.c_uint)]
+
+def load_recvmmsg():
+    """Hàm recvmmsg của libc (Linux), None nếu không có"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        recvmmsg = ctypes.CDLL(None, use_errno=True).recvmmsg
+    except (OSError, AttributeError):
+        return None
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    return recvmmsg
+
+def make_messages(buffer):
+    """Mảng mmsghdr cho recvmmsg: mỗi message nhận vào một ô FAST_SLOT_SIZE của buffer"""
+    address = ctypes.addressof((ctypes.c_char * len(buffer)).from_buffer(buffer))
+    iovecs = (IOVec * FAST_BATCH)()
+    messages = (MMsgHdr * FAST_BATCH)()
+    for i in range(FAST_BATCH):
+        iovecs[i].iov_base = address + i * FAST_SLOT_SIZE
+        iovecs[i].iov_len = FAST_SLOT_SIZE
+        messages[i].msg_hdr.msg_iov = ctypes.pointer(iovecs[i])
+        messages[i].msg_hdr.msg_iovlen = 1
+    return messages, iovecs
+
+def read_udp_drops():
+    """{inode: số datagram kernel đã bỏ} của mọi socket UDP (/proc/net/udp), None nếu không đọc được"""
+    try:
+        drops = {}
+        with open('/proc/net/udp') as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                drops[int(fields[9])] = int(fields[12])
+        return drops
+    except (OSError, ValueError, IndexError, StopIteration):
+        return None
+
+def read_socket_drops(sock):
+    """Số datagram kernel đã bỏ của socket này (cột drops trong /proc/net/udp), None nếu không đọc được"""
+    drops = read_udp_drops()
+    if drops is None:
+        return None
+    return drops.get(os.fstat(sock.fileno()).st_ino)
+
+def read_rcvbuf_errors():
+    """RcvbufErrors của UDP trên toàn máy (/proc/net/snmp), None nếu không đọc được"""
+    try:
+        with open('/proc/net/snmp') as f:
+            rows = [line.split() for line in f if line.startswith('Udp:')]
+        return int(rows[1][rows[0].index('RcvbufErrors')])
+    except (OSError, ValueError, IndexError):
+        return None
+
+def set_receive_buffer(sock, size):
+    """Tăng SO_RCVBUF và cảnh báo nếu kernel cấp ít hơn yêu cầu"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+    actual = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    # Linux trả về gấp đôi giá trị đã đặt (phần dư cho metadata của kernel)
+    if sys.platform.startswith('linux'):
+        actual //= 2
+    print(f"SO_RCVBUF: requested {size/1024/1024:.1f} MB, got {actual/1024/1024:.1f} MB")
+    if actual < size and sys.platform.startswith('linux'):
+        print(f"  Raise the limit with: sudo sysctl -w net.core.rmem_max={size}")
+
+class TSAnalyzer:
+    """Phân tích chất lượng luồng MPEG-TS: continuity counter, PCR, bitrate theo PID, PAT/PMT, khoảng trống datagram
+
+    Datagram được gom lại rồi xử lý bằng NumPy theo từng lô (ANALYZE_CHUNK datagram hoặc mỗi lần in trạng thái).
+    """
+
+    def __init__(self, latency=False):
+        self.latency_enabled = latency
+        self.latency = deque(maxlen=ANALYZER_SAMPLES)   # arrival - giờ capture của từng khung hình video
+        self.pending = []               # Dữ liệu datagram (đã cắt theo bội số 188) chờ phân tích
+        self.pending_lengths = []
+        self.pending_arrivals = []
+        self.start_time = None
+        self.period_start = None
+        self.last_arrival = None
+        self.datagrams = 0
+        self.misaligned_datagrams = 0
+        self.sync_errors = 0
+        self.tei_errors = 0
+        self.pids = {}                  # pid -> thống kê
+        self.pmt_pids = set()
+        self.stream_types = {}          # pid -> stream_type trong PMT
+        self.pcr_pid = None
+        self.last_pcr = None
+        self.pcr_offset_min = None      # min(arrival - PCR) kể từ lần reset, làm mốc tính jitter
+        self.pcr_intervals = deque(maxlen=ANALYZER_SAMPLES)
+        self.pcr_jitter = deque(maxlen=ANALYZER_SAMPLES)
+        self.pcr_discontinuities = 0
+        self.table_seen = {}            # pid của PAT/PMT -> lần cuối thấy đầu section
+        self.table_max_interval = {}
+        self.gaps = 0
+        self.max_gap = 0.0
+        self._reset_period()
+
+    def _reset_period(self):
+        self.period = {"cc_errors": 0, "gaps": 0, "max_gap": 0.0, "pcr_intervals": [], "pcr_jitter": [],
+                       "latency": [], "tables": {}, "packets": {}}
+
+    def _pid(self, pid):
+        if pid not in self.pids:
+            self.pids[pid] = {"packets": 0, "cc_errors": 0, "duplicates": 0, "last_cc": None}
+        return self.pids[pid]
+
+    def add(self, datagrams, arrivals):
+        """Thêm các datagram vừa nhận (memoryview/bytes) cùng thời điểm đến của từng datagram"""
+        for data, arrival in zip(datagrams, arrivals):
+            usable = len(data) - len(data) % TS_PACKET_SIZE
+            if usable != len(data):
+                self.misaligned_datagrams += 1
+            self.pending.append(bytes(data[:usable]))
+            self.pending_lengths.append(usable // TS_PACKET_SIZE)
+            self.pending_arrivals.append(arrival)
+        if len(self.pending) >= ANALYZE_CHUNK:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        data = np.frombuffer(b"".join(self.pending), dtype=np.uint8).reshape(-1, TS_PACKET_SIZE)
+        arrivals = np.array(self.pending_arrivals)
+        counts = np.array(self.pending_lengths)
+        self.pending, self.pending_lengths, self.pending_arrivals = [], [], []
+        self._analyze(data, arrivals, counts)
+
+    def _analyze(self, packets, arrivals, counts):
+        if self.start_time is None:
+            self.start_time = self.period_start = arrivals[0]
+        self.datagrams += len(arrivals)
+
+        # Khoảng trống giữa các datagram liên tiếp
+        previous = arrivals[0] if self.last_arrival is None else self.last_arrival
+        gaps = np.diff(np.concatenate(([previous], arrivals)))
+        big = gaps > DATAGRAM_GAP_THRESHOLD
+        self.gaps += int(big.sum())
+        self.period["gaps"] += int(big.sum())
+        if len(gaps):
+            self.max_gap = max(self.max_gap, float(gaps.max()))
+            self.period["max_gap"] = max(self.period["max_gap"], float(gaps.max()))
+        self.last_arrival = arrivals[-1]
+
+        packet_arrivals = np.repeat(arrivals, counts)
+        sync = packets[:, 0] == 0x47
+        self.sync_errors += int((~sync).sum())
+        packets, packet_arrivals = packets[sync], packet_arrivals[sync]
+        if not len(packets):
+            return
+        self.tei_errors += int((packets[:, 1] & 0x80 != 0).sum())
+        pid = ((packets[:, 1].astype(np.int32) & 0x1F) << 8) | packets[:, 2]
+        pusi = packets[:, 1] & 0x40 != 0
+        afc = (packets[:, 3] >> 4) & 0x03
+        cc = (packets[:, 3] & 0x0F).astype(np.int16)
+        has_adaptation = (afc & 0x02 != 0) & (packets[:, 4] > 0)
+        discontinuity = has_adaptation & (packets[:, 5] & 0x80 != 0)
+        has_payload = afc & 0x01 != 0
+
+        unique, per_pid = np.unique(pid, return_counts=True)
+        for p, count in zip(unique.tolist(), per_pid.tolist()):
+            stats = self._pid(p)
+            stats["packets"] += count
+            self.period["packets"][p] = self.period["packets"].get(p, 0) + count
+            if p == 0x1FFF:
+                continue
+            # Continuity counter: tăng 1 (mod 16) giữa các gói có payload, trừ khi có discontinuity_indicator
+            mask = (pid == p) & has_payload
+            ccs = cc[mask]
+            if not len(ccs):
+                continue
+            flags = discontinuity[mask]
+            if stats["last_cc"] is not None:
+                steps = (ccs - np.concatenate(([stats["last_cc"]], ccs[:-1]))) % 16
+            else:
+                steps = np.concatenate(([1], (ccs[1:] - ccs[:-1]) % 16))
+            duplicates = int(((steps == 0) & ~flags).sum())
+            errors = int(((steps != 1) & (steps != 0) & ~flags).sum())
+            stats["duplicates"] += duplicates
+            stats["cc_errors"] += errors
+            self.period["cc_errors"] += errors
+            stats["last_cc"] = int(ccs[-1])
+
+        self._analyze_tables(packets, pid, pusi, has_adaptation, packet_arrivals)
+        self._analyze_pcr(packets, pid, has_adaptation, discontinuity, packet_arrivals)
+        if self.latency_enabled:
+            self._analyze_latency(packets, pusi & has_payload, afc, packet_arrivals)
+
+    def _section(self, packet):
+        """Phần section PSI trong một gói có payload_unit_start"""
+        start = 4
+        if packet[3] & 0x20:
+            start += 1 + packet[4]
+        if start >= TS_PACKET_SIZE:
+            return None
+        pointer = packet[start]
+        section = bytes(packet[start + 1 + pointer:])
+        if len(section) < 3:
+            return None
+        length = ((section[1] & 0x0F) << 8) | section[2]
+        return section[:3 + length]
+
+    def _analyze_tables(self, packets, pid, pusi, has_adaptation, packet_arrivals):
+        if self.pmt_pids:
+            starts = pusi & np.isin(pid, [0] + sorted(self.pmt_pids))
+        else:
+            # Chưa biết PID của PMT: xét mọi đầu section, PMT có thể nằm ngay sau PAT trong cùng lô
+            starts = pusi & (pid < 0x1FFF)
+        for index in np.flatnonzero(starts).tolist():
+            p = int(pid[index])
+            if p != 0 and p not in self.pmt_pids:
+                continue
+            arrival = float(packet_arrivals[index])
+            if p in self.table_seen:
+                interval = arrival - self.table_seen[p]
+                self.table_max_interval[p] = max(self.table_max_interval.get(p, 0.0), interval)
+                period = self.period["tables"].setdefault(p, {"count": 0, "max_interval": 0.0})
+                period["max_interval"] = max(period["max_interval"], interval)
+            self.period["tables"].setdefault(p, {"count": 0, "max_interval": 0.0})["count"] += 1
+            self.table_seen[p] = arrival
+            section = self._section(packets[index])
+            if section is None or len(section) < 12:
+                continue
+            if p == 0 and section[0] == 0x00:
+                # PAT: danh sách program -> PID của PMT
+                for i in range(8, len(section) - 4, 4):
+                    program = (section[i] << 8) | section[i + 1]
+                    if program != 0:
+                        self.pmt_pids.add(((section[i + 2] & 0x1F) << 8) | section[i + 3])
+            elif p in self.pmt_pids and section[0] == 0x02:
+                # PMT: PID mang PCR và loại của từng elementary stream
+                self.pcr_pid = ((section[8] & 0x1F) << 8) | section[9]
+                i = 12 + (((section[10] & 0x0F) << 8) | section[11])
+                while i + 5 <= len(section) - 4:
+                    stream_pid = ((section[i + 1] & 0x1F) << 8) | section[i + 2]
+                    self.stream_types[stream_pid] = section[i]
+                    i += 5 + (((section[i + 3] & 0x0F) << 8) | section[i + 4])
+
+    def _analyze_pcr(self, packets, pid, has_adaptation, discontinuity, packet_arrivals):
+        has_pcr = has_adaptation & (packets[:, 5] & 0x10 != 0)
+        if self.pcr_pid is None:
+            # Chưa có PMT: dùng PID đầu tiên mang PCR
+            candidates = pid[has_pcr]
+            if not len(candidates):
+                return
+            self.pcr_pid = int(candidates[0])
+        mask = has_pcr & (pid == self.pcr_pid)
+        if not mask.any():
+            return
+        b = packets[mask, 6:12].astype(np.int64)
+        base = (b[:, 0] << 25) | (b[:, 1] << 17) | (b[:, 2] << 9) | (b[:, 3] << 1) | (b[:, 4] >> 7)
+        pcr = (base * 300 + (((b[:, 4] & 0x01) << 8) | b[:, 5])) / 27000000.0
+        arrivals = packet_arrivals[mask]
+        flags = discontinuity[mask]
+        previous = self.last_pcr if self.last_pcr is not None else pcr[0]
+        intervals = np.diff(np.concatenate(([previous], pcr)))
+        # PCR quay về, nhảy xa hoặc có discontinuity_indicator: bắt đầu lại mốc tính jitter
+        resets = flags | (intervals < 0) | (intervals > 1.0)
+        if self.last_pcr is None:
+            resets[0] = True
+        self.pcr_discontinuities += int(resets.sum()) - (1 if self.last_pcr is None else 0)
+        valid = intervals[~resets]
+        self.pcr_intervals.extend(valid.tolist())
+        self.period["pcr_intervals"].extend(valid.tolist())
+
+        offsets = arrivals - pcr
+        boundaries = np.flatnonzero(resets).tolist() + [len(pcr)]
+        start = 0
+        for boundary in boundaries:
+            # Mỗi đoạn không có reset: jitter = độ trễ so với min(arrival - PCR) tích lũy (gói chỉ có thể đến muộn)
+            if boundary > start:
+                segment = offsets[start:boundary]
+                if self.pcr_offset_min is not None:
+                    segment_min = np.minimum.accumulate(np.concatenate(([self.pcr_offset_min], segment)))[1:]
+                else:
+                    segment_min = np.minimum.accumulate(segment)
+                jitter = (segment - segment_min).tolist()
+                self.pcr_jitter.extend(jitter)
+                self.period["pcr_jitter"].extend(jitter)
+                self.pcr_offset_min = float(segment_min[-1])
+            if boundary < len(pcr):
+                self.pcr_offset_min = None
+            start = boundary
+        self.last_pcr = float(pcr[-1])
+
+    def _analyze_latency(self, packets, starts, afc, packet_arrivals):
+        """Độ trễ đầu-cuối theo từng khung hình video: arrival - DTS (hoặc PTS) đã quy về giờ hệ thống
+
+        Server đặt -output_ts_offset để timestamp = giờ Unix lúc khung hình được đọc (modulo 2^33 / 90 kHz).
+        """
+        index = np.flatnonzero(starts)
+        if not len(index):
+            return
+        start = 4 + np.where(afc[index] & 0x02 != 0, 1 + packets[index, 4].astype(np.int32), 0)
+        index, start = index[start <= TS_PACKET_SIZE - 19], start[start <= TS_PACKET_SIZE - 19]
+        header = packets[index[:, None], start[:, None] + np.arange(19)].astype(np.int64)
+        # Đầu PES video (00 00 01 E0-EF) có PTS
+        video = ((header[:, 0] == 0) & (header[:, 1] == 0) & (header[:, 2] == 1) & (header[:, 3] & 0xF0 == 0xE0)
+                 & (header[:, 7] & 0x80 != 0))
+        header, arrivals = header[video], packet_arrivals[index[video]]
+        if not len(header):
+            return
+        # DTS (thứ tự đọc/giải mã) nếu có, không thì PTS
+        b = np.where((header[:, 7] & 0x40 != 0)[:, None], header[:, 14:19], header[:, 9:14])
+        ts = (((b[:, 0] >> 1) & 0x07) << 30 | b[:, 1] << 22 | (b[:, 2] >> 1) << 15 | b[:, 3] << 7 | b[:, 4] >> 1) / 90000.0
+        captured = ts + TS_CLOCK_PERIOD * np.round((arrivals - ts) / TS_CLOCK_PERIOD)
+        latency = (arrivals - captured).tolist()
+        self.latency.extend(latency)
+        self.period["latency"].extend(latency)
+
+    def summary_line(self, now):
+        """Tóm tắt một dòng cho khoảng thời gian vừa qua rồi bắt đầu khoảng mới"""
+        self.flush()
+        period = self.period
+        elapsed = max(now - (self.period_start or now), 1e-6)
+        intervals = period["pcr_intervals"]
+        jitter = sorted(period["pcr_jitter"])
+        parts = [f"CC errors {period['cc_errors']}"]
+        if intervals:
+            parts.append(f"PCR max interval {1000 * max(intervals):.1f} ms, "
+                         f"jitter p99 {1000 * jitter[min(len(jitter) - 1, int(len(jitter) * 0.99))]:.2f} ms")
+        else:
+            parts.append("no PCR")
+        pat = period["tables"].get(0, {}).get("count", 0)
+        pmt = sum(period["tables"].get(p, {}).get("count", 0) for p in self.pmt_pids)
+        parts.append(f"PAT {pat} PMT {pmt}")
+        parts.append(f"gaps {period['gaps']} (max {1000 * period['max_gap']:.1f} ms)")
+        if self.latency_enabled:
+            latency = sorted(period["latency"])
+            if latency:
+                parts.append(f"latency p50 {1000 * latency[len(latency) // 2]:.0f} ms, "
+                             f"p95 {1000 * latency[min(len(latency) - 1, int(len(latency) * 0.95))]:.0f} ms")
+            else:
+                parts.append("no latency")
+        rates = ", ".join(f"0x{p:x} {count * TS_PACKET_SIZE * 8 / elapsed / 1000:.0f}k"
+                          for p, count in sorted(period["packets"].items()))
+        parts.append(rates)
+        self._reset_period()
+        self.period_start = now
+        return "   TS: " + " | ".join(parts)
+
+    def report(self):
+        """Báo cáo cuối (JSON) cho kiểm tra trước triển khai và so sánh giữa các lần chạy"""
+        self.flush()
+        duration = (self.last_arrival - self.start_time) if self.start_time is not None else 0
+        intervals = sorted(self.pcr_intervals)
+        jitter = sorted(self.pcr_jitter)
+
+        def percentiles(values):
+            if not values:
+                return None
+            return {
+                "avg_ms": 1000 * sum(values) / len(values),
+                "p50_ms": 1000 * values[len(values) // 2],
+                "p95_ms": 1000 * values[min(len(values) - 1, int(len(values) * 0.95))],
+                "p99_ms": 1000 * values[min(len(values) - 1, int(len(values) * 0.99))],
+                "max_ms": 1000 * values[-1],
+            }
+
+        tables = {}
+        for p in [0] + sorted(self.pmt_pids):
+            tables["PAT" if p == 0 else f"PMT 0x{p:x}"] = {
+                "seen": p in self.table_seen,
+                "max_interval_ms": 1000 * self.table_max_interval[p] if p in self.table_max_interval else None,
+                "ok": p in self.table_seen and self.table_max_interval.get(p, 0.0) <= PAT_MAX_INTERVAL,
+            }
+        pids = {}
+        for p, stats in sorted(self.pids.items()):
+            pids[f"0x{p:x}"] = {
+                "packets": stats["packets"],
+                "bitrate_kbps": stats["packets"] * TS_PACKET_SIZE * 8 / duration / 1000 if duration > 0 else None,
+                "cc_errors": stats["cc_errors"],
+                "duplicates": stats["duplicates"],
+                "stream_type": self.stream_types.get(p),
+            }
+        cc_errors = sum(s["cc_errors"] for s in self.pids.values())
+        pcr_ok = bool(intervals) and intervals[-1] <= PCR_MAX_INTERVAL
+        report = {
+            "duration_s": duration,
+            "datagrams": self.datagrams,
+            "misaligned_datagrams": self.misaligned_datagrams,
+            "sync_errors": self.sync_errors,
+            "transport_errors": self.tei_errors,
+            "cc_errors": cc_errors,
+            "pids": pids,
+            "tables": tables,
+            "pcr": {
+                "pid": f"0x{self.pcr_pid:x}" if self.pcr_pid is not None else None,
+                "interval": percentiles(intervals),
+                "jitter": percentiles(jitter),
+                "discontinuities": self.pcr_discontinuities,
+                "interval_ok": pcr_ok,
+            },
+            "datagram_gaps": {
+                "threshold_ms": 1000 * DATAGRAM_GAP_THRESHOLD,
+                "count": self.gaps,
+                "max_ms": 1000 * self.max_gap,
+            },
+            "ok": cc_errors == 0 and self.sync_errors == 0 and pcr_ok and all(t["ok"] for t in tables.values()),
+        }
+        if self.latency_enabled:
+            latency = percentiles(sorted(self.latency))
+            if latency is not None:
+                latency["frames"] = len(self.latency)
+            report["latency"] = latency
+        return report
+
+def read_timestamp(message, control):
+    """Thời điểm kernel nhận datagram (SO_TIMESTAMPNS), None nếu không có"""
+    if message.msg_hdr.msg_controllen < TIMESTAMP_CONTROL_SIZE:
+        return None
+    length, level, kind = struct.unpack_from('Nii', control)
+    if level != socket.SOL_SOCKET or kind != SO_TIMESTAMPNS:
+        return None
+    seconds, nanoseconds = struct.unpack_from('qq', control, 16)
+    return seconds + nanoseconds / 1e9
+
+def receive_fast(sock, f, duration, analyzer=None):
+    """Vòng nhận nhanh: recvmmsg vào bộ đệm cấp sẵn, ghi file có đệm, in trạng thái mỗi giây
+
+    Trả về (số gói, số byte) khi hết duration hoặc khi nhấn Ctrl+C.
+    Nếu có analyzer, từng datagram được chuyển cho nó cùng thời điểm nhận.
+    """
+    recvmmsg = load_recvmmsg()
+    buffer = bytearray(FAST_BATCH * FAST_SLOT_SIZE)
+    view = memoryview(buffer)
+    if recvmmsg is not None:
+        messages, iovecs = make_messages(buffer)
+        if analyzer is not None and sys.platform.startswith('linux'):
+            sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+            controls = [ctypes.create_string_buffer(TIMESTAMP_CONTROL_SIZE) for _ in range(FAST_BATCH)]
+        else:
+            controls = None
+    print(f"Fast mode: {'recvmmsg' if recvmmsg else 'recv_into'} (batch {FAST_BATCH}), "
+          f"buffered writes ({FAST_WRITE_BUFFER/1024/1024:.0f} MB)")
+    sock.setblocking(False)
+    fd = sock.fileno()
+
+    packet_count = total_bytes = 0
+    calls = 0
+    drops_start = read_socket_drops(sock)
+    rcvbuf_errors_start = read_rcvbuf_errors()
+    start_time = last_status = time.time()
+    last_bytes = last_packets = 0
+    try:
+        while not duration or time.time() - start_time < duration:
+            readable, _, _ = select.select([sock], [], [], 0.2)
+            if readable:
+                if recvmmsg is not None:
+                    # Lấy tối đa FAST_BATCH datagram trong một lời gọi hệ thống
+                    while True:
+                        if controls is not None:
+                            # Kernel ghi đè msg_controllen nên phải đặt lại trước mỗi lần gọi
+                            for i in range(FAST_BATCH):
+                                messages[i].msg_hdr.msg_control = ctypes.addressof(controls[i])
+                                messages[i].msg_hdr.msg_controllen = TIMESTAMP_CONTROL_SIZE
+                        count = recvmmsg(fd, messages, FAST_BATCH, MSG_DONTWAIT, None)
+                        calls += 1
+                        if count < 0:
+                            error = ctypes.get_errno()
+                            if error in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                                break
+                            raise OSError(error, os.strerror(error))
+                        for i in range(count):
+                            length = messages[i].msg_len
+                            f.write(view[i * FAST_SLOT_SIZE:i * FAST_SLOT_SIZE + length])
+                            total_bytes += length
+                        if analyzer is not None and count > 0:
+                            received = time.time()
+                            stamps = [read_timestamp(messages[i], controls[i]) if controls else None
+                                      for i in range(count)]
+                            analyzer.add([view[i * FAST_SLOT_SIZE:i * FAST_SLOT_SIZE + messages[i].msg_len]
+                                          for i in range(count)],
+                                         [stamp or received for stamp in stamps])
+                        packet_count += count
+                        if count < FAST_BATCH:
+                            break
+                else:
+                    while True:
+                        try:
+                            length = sock.recv_into(view)
+                        except (BlockingIOError, InterruptedError):
+                            break
+                        calls += 1
+                        f.write(view[:length])
+                        if analyzer is not None:
+                            analyzer.add([view[:length]], [time.time()])
+                        packet_count += 1
+                        total_bytes += length
+
+            now = time.time()
+            if now - last_status >= 1:
+                drops = read_socket_drops(sock)
+                rate = (total_bytes - last_bytes) * 8 / (now - last_status) / 1e6
+                print(f"[{now - start_time:6.0f}s] {packet_count} packets | {total_bytes/1024/1024:.2f} MB | "
+                      f"{rate:.1f} Mbps | {packet_count - last_packets} pkt/s | "
+                      f"kernel drops: {drops - drops_start if drops is not None else 'n/a'}")
+                if analyzer is not None:
+                    print(analyzer.summary_line(now))
+                last_status, last_bytes, last_packets = now, total_bytes, packet_count
+    except KeyboardInterrupt:
+        pass
+
+    elapsed = time.time() - start_time
+    drops = read_socket_drops(sock)
+    rcvbuf_errors = read_rcvbuf_errors()
+    print(f"\nAverage rate: {total_bytes * 8 / elapsed / 1e6:.1f} Mbps over {elapsed:.1f} s, "
+          f"{packet_count / max(calls, 1):.1f} datagrams per receive call")
+    if drops is not None:
+        print(f"Kernel drops on this socket: {drops - drops_start}")
+    if rcvbuf_errors is not None:
+        print(f"UDP RcvbufErrors (whole host): {rcvbuf_errors - rcvbuf_errors_start}")
+    return packet_count, total_bytes
+
+class FecDecoder:
+    """Giải mã FEC hàng/cột SMPTE 2022-1: sắp xếp gói RTP theo số thứ tự và dựng lại gói mất bằng XOR
+
+    Gói media được giữ FEC_HOLD_MATRICES ma trận để chờ FEC rồi trả về theo thứ tự;
+    gói vẫn thiếu lúc đó (không dựng lại được) được tính là mất.
+    """
+
+    def __init__(self):
+        self.media = {}             # số thứ tự (đã mở rộng qua vòng 16 bit) -> (payload, thời điểm nhận)
+        self.fec = {}               # (hàng?, SNBase) -> (offset, NA, length recovery, payload)
+        self.highest = None         # Số thứ tự lớn nhất đã nhận
+        self.next_sn = None         # Gói tiếp theo sẽ trả về
+        self.columns = self.rows = None
+        self.counts = {"media_packets": 0, "media_bytes": 0, "column_packets": 0, "row_packets": 0,
+                       "fec_bytes": 0, "invalid": 0, "duplicates": 0, "late": 0,
+                       "released": 0, "recovered": 0, "lost": 0}
+
+    def _extend(self, sn):
+        """Số thứ tự 16 bit -> số thứ tự tăng liên tục, gần với gói lớn nhất đã nhận"""
+        if self.highest is None:
+            return sn
+        value = (self.highest & ~0xFFFF) | sn
+        if value - self.highest > 0x8000:
+            value -= 0x10000
+        elif self.highest - value > 0x8000:
+            value += 0x10000
+        return value
+
+    def count(self, kind, length):
+        """Đếm datagram trên đường truyền ("media", "column" hoặc "row"), trước khi giả lập mất gói"""
+        if kind == "media":
+            self.counts["media_packets"] += 1
+            self.counts["media_bytes"] += length
+        else:
+            self.counts[f"{kind}_packets"] += 1
+            self.counts["fec_bytes"] += length
+
+    def add_media(self, datagram, arrival):
+        """Thêm một gói RTP media; trả về các (payload TS, thời điểm nhận) đã sẵn sàng theo thứ tự"""
+        if len(datagram) < RTP_HEADER_SIZE or datagram[0] >> 6 != 2:
+            self.counts["invalid"] += 1
+            return []
+        header_size = RTP_HEADER_SIZE + 4 * (datagram[0] & 0x0F)
+        sn = self._extend(struct.unpack_from('!H', datagram, 2)[0])
+        if self.next_sn is None:
+            self.next_sn = sn
+        if sn < self.next_sn:
+            self.counts["late"] += 1
+            return []
+        if sn in self.media:
+            self.counts["duplicates"] += 1
+            return []
+        self.media[sn] = (bytes(datagram[header_size:]), arrival)
+        self.highest = sn if self.highest is None else max(self.highest, sn)
+        return self._release()
+
+    def add_fec(self, datagram):
+        """Thêm một gói FEC (cột hoặc hàng, phân biệt bằng bit D); trả về các gói media sẵn sàng"""
+        if len(datagram) < RTP_HEADER_SIZE + FEC_HEADER_SIZE or datagram[0] >> 6 != 2:
+            self.counts["invalid"] += 1
+            return []
+        if self.highest is None:
+            return []
+        header = datagram[RTP_HEADER_SIZE:RTP_HEADER_SIZE + FEC_HEADER_SIZE]
+        sn_base, length_recovery = struct.unpack_from('!HH', header)
+        row, offset, na = bool(header[12] & 0x40), header[13], header[14]
+        if offset == 0 or na == 0:
+            self.counts["invalid"] += 1
+            return []
+        # Hàng: offset 1, NA = L; cột: offset L, NA = D
+        if row:
+            self.columns = na
+        else:
+            self.columns, self.rows = offset, na
+        self.fec[(row, self._extend(sn_base))] = (offset, na, length_recovery,
+                                                  bytes(datagram[RTP_HEADER_SIZE + FEC_HEADER_SIZE:]))
+        return self._release()
+
+    def _recover(self):
+        """Dựng lại mọi gói có thể (mỗi gói FEC cứu được đúng một gói thiếu); lặp vì hàng và cột bổ sung nhau"""
+        progress = True
+        while progress:
+            progress = False
+            for key, (offset, na, length_recovery, payload) in list(self.fec.items()):
+                protected = [key[1] + i * offset for i in range(na)]
+                missing = [sn for sn in protected if sn not in self.media]
+                if len(missing) != 1:
+                    if not missing:
+                        del self.fec[key]
+                    continue
+                sn = missing[0]
+                del self.fec[key]
+                if sn < self.next_sn:
+                    continue                # Đã tính là mất
+                size = len(payload)
+                bits = int.from_bytes(payload, 'big')
+                length = length_recovery
+                for other in protected:
+                    if other != sn:
+                        data = self.media[other][0]
+                        bits ^= int.from_bytes(data[:size].ljust(size, b'\0'), 'big')
+                        length ^= len(data)
+                if length > size:
+                    continue
+                # Gói dựng lại lấy thời điểm nhận của gói liền trước để phân tích TS thấy dòng thời gian liên tục
+                previous = self.media.get(sn - 1)
+                self.media[sn] = (bits.to_bytes(size, 'big')[:length], previous[1] if previous else time.time())
+                self.counts["recovered"] += 1
+                progress = True
+
+    def _release(self, flush=False):
+        matrix = self.columns * self.rows if self.columns and self.rows else FEC_DEFAULT_MATRIX
+        hold = 0 if flush else FEC_HOLD_MATRICES * matrix
+        released = []
+        while self.next_sn is not None and self.next_sn <= self.highest - hold:
+            if self.next_sn not in self.media:
+                self._recover()
+            entry = self.media.get(self.next_sn)
+            if entry is None:
+                self.counts["lost"] += 1
+            else:
+                released.append(entry)
+                self.counts["released"] += 1
+            self.next_sn += 1
+        if len(self.media) > 2 * FEC_HOLD_MATRICES * matrix:
+            # Gói đã trả về chỉ còn dùng để dựng lại gói khác trong cùng ma trận
+            keep_from = self.next_sn - FEC_HOLD_MATRICES * matrix
+            self.media = {sn: entry for sn, entry in self.media.items() if sn >= keep_from}
+            self.fec = {key: entry for key, entry in self.fec.items()
+                        if key[1] + (entry[1] - 1) * entry[0] >= keep_from}
+        return released
+
+    def flush(self):
+        """Trả về mọi gói còn giữ (khi dừng nhận)"""
+        if self.next_sn is None:
+            return []
+        self._recover()
+        return self._release(flush=True)
+
+    def summary_line(self):
+        c = self.counts
+        matrix = f"{self.columns}x{self.rows}" if self.columns and self.rows else "?"
+        overhead = c["fec_bytes"] / c["media_bytes"] if c["media_bytes"] else 0
+        return (f"FEC {matrix}: media {c['media_packets']} | FEC {c['column_packets'] + c['row_packets']} "
+                f"({overhead:.1%}) | recovered {c['recovered']} | lost {c['lost']}")
+
+    def report(self):
+        c = self.counts
+        expected = c["released"] + c["lost"]
+        missing = c["recovered"] + c["lost"]
+        return {
+            "columns": self.columns,
+            "rows": self.rows,
+            **c,
+            "fec_packets": c["column_packets"] + c["row_packets"],
+            "overhead": c["fec_bytes"] / c["media_bytes"] if c["media_bytes"] else None,
+            "expected_packets": expected,
+            "missing_before_fec": missing,
+            "loss_before_fec": missing / expected if expected else None,
+            "loss_after_fec": c["lost"] / expected if expected else None,
+            "recovery_ratio": c["recovered"] / missing if missing else None,
+        }
+
+class LossInjector:
+    """Bỏ ngẫu nhiên datagram đã nhận để giả lập mất gói (mỗi luồng độc lập, mỗi lần mất burst gói liên tiếp)"""
+
+    def __init__(self, rate, burst=1, seed=None):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.random = random.Random(seed)
+        self.remaining = {}
+        self.dropped = {}
+
+    def drop(self, kind):
+        if self.remaining.get(kind, 0) > 0:
+            self.remaining[kind] -= 1
+        elif self.random.random() < self.rate / self.burst:
+            self.remaining[kind] = self.burst - 1
+        else:
+            return False
+        self.dropped[kind] = self.dropped.get(kind, 0) + 1
+        return True
+
+def open_fec_socket(group, port):
+    """Socket đã tham gia nhóm multicast cho một luồng FEC"""
+    fec_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    fec_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if sys.platform == 'darwin':
+        fec_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    set_receive_buffer(fec_sock, GROUP_RCVBUF)
+    fec_sock.bind(('', port))
+    fec_sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                        struct.pack('4sL', socket.inet_aton(group), socket.INADDR_ANY))
+    return fec_sock
+
+def receive_fec(sock, fec_sockets, f, duration, decoder, analyzer=None, injector=None):
+    """Nhận media RTP và 2 luồng FEC, dựng lại gói mất, ghi payload TS theo thứ tự RTP, in trạng thái mỗi giây
+
+    Trả về (số gói media đã ghi, số byte TS) khi hết duration hoặc khi nhấn Ctrl+C.
+    """
+    kinds = {sock: "media", fec_sockets[0]: "column", fec_sockets[1]: "row"}
+    for s in kinds:
+        s.setblocking(False)
+    buffer = bytearray(FAST_SLOT_SIZE)
+    view = memoryview(buffer)
+    total_bytes = 0
+
+    def write(released):
+        nonlocal total_bytes
+        for payload, _ in released:
+            f.write(payload)
+            total_bytes += len(payload)
+        if analyzer is not None and released:
+            analyzer.add([payload for payload, _ in released], [arrival for _, arrival in released])
+
+    print(f"FEC mode: media on port {MCAST_PORT}, columns on {MCAST_PORT + FEC_COLUMN_PORT_OFFSET}, "
+          f"rows on {MCAST_PORT + FEC_ROW_PORT_OFFSET}"
+          + (f", dropping {injector.rate:.2%} (bursts of {injector.burst})" if injector else ""))
+    start_time = last_status = time.time()
+    try:
+        while not duration or time.time() - start_time < duration:
+            readable, _, _ = select.select(list(kinds), [], [], 0.2)
+            for s in readable:
+                kind = kinds[s]
+                while True:
+                    try:
+                        length = s.recv_into(view)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    decoder.count(kind, length)
+                    if injector is not None and injector.drop(kind):
+                        continue
+                    datagram = bytes(view[:length])
+                    write(decoder.add_media(datagram, time.time()) if kind == "media" else decoder.add_fec(datagram))
+            now = time.time()
+            if now - last_status >= 1:
+                print(f"[{now - start_time:6.0f}s] {decoder.summary_line()}")
+                if analyzer is not None:
+                    print(analyzer.summary_line(now))
+                last_status = now
+    except KeyboardInterrupt:
+        pass
+    write(decoder.flush())
+    return decoder.counts["released"], total_bytes
+
+def parse_group_entry(entry):
+    """'[source@]group:port[%interface]' -> (group, port, source, interface)"""
+    source = interface = None
+    if '%' in entry:
+        entry, interface = entry.rsplit('%', 1)
+    if '@' in entry:
+        source, entry = entry.split('@', 1)
+    group, separator, port = entry.rpartition(':')
+    if not separator:
+        group, port = entry, MCAST_PORT
+    socket.inet_aton(group)
+    if source:
+        socket.inet_aton(source)
+    return group, int(port), source or None, interface or None
+
+def read_group_entries(values, path):
+    """Danh sách nhóm từ --groups và --groups-file (mỗi dòng một nhóm, # là chú thích)"""
+    entries = list(values or [])
+    if path:
+        with open(path) as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if line:
+                    entries.extend(line.split())
+    return [parse_group_entry(entry) for entry in entries]
+
+def interface_address(interface):
+    """Địa chỉ IPv4 của interface (tên hoặc địa chỉ IP), INADDR_ANY nếu không chỉ định"""
+    if not interface:
+        return '0.0.0.0'
+    try:
+        socket.inet_aton(interface)
+        return interface
+    except OSError:
+        pass
+    import fcntl
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # SIOCGIFADDR: địa chỉ IPv4 của interface theo tên
+        result = fcntl.ioctl(probe.fileno(), 0x8915, struct.pack('256s', interface.encode()[:15]))
+    finally:
+        probe.close()
+    return socket.inet_ntoa(result[20:24])
+
+def continuity_loss(data, last_cc):
+    """Ước lượng số gói TS bị mất theo continuity counter của từng PID
+
+    last_cc ({pid: cc}) được cập nhật để nối tiếp giữa các lần gọi.
+    """
+    packets = np.frombuffer(data, dtype=np.uint8).reshape(-1, TS_PACKET_SIZE)
+    packets = packets[packets[:, 0] == 0x47]
+    pid = ((packets[:, 1].astype(np.int32) & 0x1F) << 8) | packets[:, 2]
+    keep = (packets[:, 3] & 0x10 != 0) & (pid != 0x1FFF)
+    discontinuity = (packets[:, 3] & 0x20 != 0) & (packets[:, 4] > 0) & (packets[:, 5] & 0x80 != 0)
+    order = np.argsort(pid[keep], kind='stable')
+    pid = pid[keep][order]
+    cc = (packets[keep, 3] & 0x0F).astype(np.int16)[order]
+    discontinuity = discontinuity[keep][order]
+    if not len(pid):
+        return 0
+    first = np.concatenate(([True], pid[1:] != pid[:-1]))
+    previous = np.concatenate(([0], cc[:-1]))
+    known = np.ones(len(pid), dtype=bool)
+    for index in np.flatnonzero(first).tolist():
+        p = int(pid[index])
+        if p in last_cc:
+            previous[index] = last_cc[p]
+        else:
+            known[index] = False
+    steps = (cc - previous) % 16
+    # Bước 0 là gói lặp, bước 1 là bình thường, bước k > 1 nghĩa là mất k - 1 gói
+    lost = np.where(known & ~discontinuity & (steps > 1), steps - 1, 0)
+    last = np.concatenate((pid[1:] != pid[:-1], [True]))
+    for p, value in zip(pid[last].tolist(), cc[last].tolist()):
+        last_cc[p] = value
+    return int(lost.sum())
+
+class GroupMonitor:
+    """Một nhóm multicast được theo dõi: socket, bộ đếm và dữ liệu chờ đếm gói mất"""
+
+    def __init__(self, group, port, source, interface):
+        self.group, self.port, self.source, self.interface = group, port, source, interface
+        self.name = f"{source + '@' if source else ''}{group}:{port}{'%' + interface if interface else ''}"
+        self.packets = self.bytes = self.lost = 0
+        self.first_seen = self.last_seen = None
+        self.interval_bytes = 0
+        self.rate_mbps = 0.0
+        self.pending = []
+        self.last_cc = {}
+        self.drops_start = None
+        self.drops = 0
+        self.sock = self._open()
+        self.inode = os.fstat(self.sock.fileno()).st_ino
+
+    def _membership(self):
+        group = socket.inet_aton(self.group)
+        local = socket.inet_aton(interface_address(self.interface))
+        if self.source:
+            # struct ip_mreq_source (Linux): nhóm, interface, nguồn
+            return IP_ADD_SOURCE_MEMBERSHIP, IP_DROP_SOURCE_MEMBERSHIP, group + local + socket.inet_aton(self.source)
+        return socket.IP_ADD_MEMBERSHIP, socket.IP_DROP_MEMBERSHIP, group + local
+
+    def _open(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        if sys.platform.startswith('linux'):
+            # Bind vào địa chỉ nhóm và tắt IP_MULTICAST_ALL để socket chỉ nhận đúng nhóm của mình
+            # khi nhiều nhóm dùng chung một cổng
+            sock.setsockopt(socket.IPPROTO_IP, IP_MULTICAST_ALL, 0)
+            sock.bind((self.group, self.port))
+        else:
+            sock.bind(('', self.port))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, GROUP_RCVBUF)
+        add, _, mreq = self._membership()
+        sock.setsockopt(socket.IPPROTO_IP, add, mreq)
+        sock.setblocking(False)
+        return sock
+
+    def received(self, data, now):
+        self.packets += 1
+        self.bytes += len(data)
+        self.interval_bytes += len(data)
+        if self.first_seen is None:
+            self.first_seen = now
+        self.last_seen = now
+        if np is not None:
+            usable = len(data) - len(data) % TS_PACKET_SIZE
+            self.pending.append(bytes(data[:usable]))
+
+    def update(self, elapsed, drops):
+        """Cập nhật tốc độ, số gói mất (theo CC) và kernel drops sau mỗi khoảng thống kê"""
+        self.rate_mbps = self.interval_bytes * 8 / elapsed / 1e6
+        self.interval_bytes = 0
+        if self.pending:
+            self.lost += continuity_loss(b"".join(self.pending), self.last_cc)
+            self.pending = []
+        if drops is not None and self.inode in drops:
+            if self.drops_start is None:
+                self.drops_start = drops[self.inode]
+            self.drops = drops[self.inode] - self.drops_start
+
+    def stats(self, now):
+        duration = (self.last_seen - self.first_seen) if self.first_seen is not None else 0
+        return {
+            "group": self.name,
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "avg_mbps": self.bytes * 8 / duration / 1e6 if duration > 0 else 0,
+            "lost_ts_packets": self.lost if np is not None else None,
+            "kernel_drops": self.drops,
+            "last_seen_s_ago": now - self.last_seen if self.last_seen is not None else None,
+            "stale": self.last_seen is None or now - self.last_seen > GROUP_STALE_AFTER,
+        }
+
+    def close(self):
+        _, drop, mreq = self._membership()
+        try:
+            self.sock.setsockopt(socket.IPPROTO_IP, drop, mreq)
+        except OSError:
+            pass
+        self.sock.close()
+
+def monitor_groups(entries, duration, report_path):
+    """Theo dõi nhiều nhóm multicast trong một vòng lặp sự kiện (selectors: epoll trên Linux)
+
+    Không lưu dữ liệu ra file; in trạng thái tổng mỗi giây, bảng theo nhóm và báo cáo JSON khi kết thúc.
+    """
+    monitors = [GroupMonitor(*entry) for entry in entries]
+    selector = selectors.DefaultSelector()
+    for monitor in monitors:
+        selector.register(monitor.sock, selectors.EVENT_READ, monitor)
+    recvmmsg = load_recvmmsg()
+    buffer = bytearray(FAST_BATCH * FAST_SLOT_SIZE)
+    view = memoryview(buffer)
+    if recvmmsg is not None:
+        messages, iovecs = make_messages(buffer)
+    print(f"Monitoring {len(monitors)} groups with {type(selector).__name__}, "
+          f"{'recvmmsg' if recvmmsg else 'recv_into'}, loss from TS continuity counters: "
+          f"{'yes' if np is not None else 'no (numpy not installed)'}")
+
+    cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+    start_time = last_status = time.time()
+    last_packets = 0
+    calls = 0
+    try:
+        while not duration or time.time() - start_time < duration:
+            events = selector.select(timeout=0.2)
+            now = time.time()
+            for key, _ in events:
+                monitor = key.data
+                fd = key.fd
+                while True:
+                    if recvmmsg is not None:
+                        count = recvmmsg(fd, messages, FAST_BATCH, MSG_DONTWAIT, None)
+                        calls += 1
+                        if count < 0:
+                            error = ctypes.get_errno()
+                            if error in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                                break
+                            raise OSError(error, os.strerror(error))
+                        for i in range(count):
+                            monitor.received(view[i * FAST_SLOT_SIZE:i * FAST_SLOT_SIZE + messages[i].msg_len], now)
+                        if count < FAST_BATCH:
+                            break
+                    else:
+                        try:
+                            length = monitor.sock.recv_into(view)
+                        except (BlockingIOError, InterruptedError):
+                            break
+                        calls += 1
+                        monitor.received(view[:length], now)
+
+            if now - last_status >= 1:
+                drops = read_udp_drops()
+                for monitor in monitors:
+                    monitor.update(now - last_status, drops)
+                packets = sum(m.packets for m in monitors)
+                stale = [m.name for m in monitors if m.last_seen is None or now - m.last_seen > GROUP_STALE_AFTER]
+                print(f"[{now - start_time:6.0f}s] groups {len(monitors) - len(stale)}/{len(monitors)} active | "
+                      f"{sum(m.rate_mbps for m in monitors):.1f} Mbps | {packets - last_packets} pkt/s | "
+                      f"lost TS packets: {sum(m.lost for m in monitors) if np is not None else 'n/a'} | "
+                      f"kernel drops: {sum(m.drops for m in monitors)}"
+                      + (f" | stale: {', '.join(stale[:5])}{' ...' if len(stale) > 5 else ''}" if stale else ""))
+                last_status, last_packets = now, packets
+    except KeyboardInterrupt:
+        pass
+
+    now = time.time()
+    elapsed = now - start_time
+    drops = read_udp_drops()
+    for monitor in monitors:
+        monitor.update(max(now - last_status, 1e-6), drops)
+    cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_seconds = (cpu_end.ru_utime - cpu_start.ru_utime) + (cpu_end.ru_stime - cpu_start.ru_stime)
+    cpu_percent = 100 * cpu_seconds / elapsed if elapsed > 0 else 0
+    groups = [monitor.stats(now) for monitor in monitors]
+
+    print(f"\n{'Group':32s} {'Packets':>10s} {'MB':>9s} {'Mbps':>7s} {'Lost':>6s} {'Drops':>6s} {'Last seen':>10s}")
+    for g in groups:
+        last_seen = f"{g['last_seen_s_ago']:.1f}s ago" if g['last_seen_s_ago'] is not None else "never"
+        lost = g['lost_ts_packets'] if g['lost_ts_packets'] is not None else 'n/a'
+        print(f"{g['group']:32s} {g['packets']:10d} {g['bytes']/1024/1024:9.2f} {g['avg_mbps']:7.2f} "
+              f"{lost:>6} {g['kernel_drops']:6d} {last_seen:>10s}")
+    print(f"\nCPU: {cpu_percent:.1f}% of one core over {elapsed:.1f} s "
+          f"({100 * cpu_percent / len(monitors):.1f}% per 100 groups), "
+          f"{sum(g['packets'] for g in groups) / max(calls, 1):.1f} datagrams per receive call")
+
+    report = {
+        "duration_s": elapsed,
+        "group_count": len(monitors),
+        "active_groups": sum(not g["stale"] for g in groups),
+        "cpu_seconds": cpu_seconds,
+        "cpu_percent": cpu_percent,
+        "cpu_percent_per_100_groups": 100 * cpu_percent / len(monitors),
+        "groups": groups,
+    }
+    report_file = report_path or f"multicast_groups_{int(time.time())}.json"
+    with open(report_file, 'w') as r:
+        json.dump(report, r, indent=2)
+    print(f"Report saved to {os.path.abspath(report_file)}")
+
+    for monitor in monitors:
+        selector.unregister(monitor.sock)
+        monitor.close()
+    return report
+
+if args.groups or args.groups_file:
+    try:
+        entries = read_group_entries(args.groups, args.groups_file)
+    except (OSError, ValueError) as e:
+        print(f"Invalid group list: {e}")
+        exit(1)
+    monitor_groups(entries, args.duration, args.report)
+    exit(0)
+
 # Tạo socket UDP
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
 sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -19,6 +1156,10 @@ if sys.platform == 'darwin':  # macOS cần thêm SO_REUSEPORT
 # Đặt timeout để script không bị treo vô hạn
 sock.settimeout(10)  # 10 giây timeout
 
+if args.fast:
+    # Bộ đệm nhận lớn để kernel không bỏ gói khi luồng bị chậm trong chốc lát
+    set_receive_buffer(sock, args.rcvbuf)
+
 # In thông tin giao diện mạng
 print("\nInterface Information:")
 print("----------------------")
@@ -47,6 +1188,16 @@ group = socket.inet_aton(MCAST_GRP)
 mreq = struct.pack('4sL', group, socket.INADDR_ANY)
 sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
 
+fec_sockets = []
+if args.fec:
+    # Luồng FEC cột và hàng ở cổng media + 2 và + 4
+    try:
+        fec_sockets = [open_fec_socket(MCAST_GRP, MCAST_PORT + offset)
+                       for offset in (FEC_COLUMN_PORT_OFFSET, FEC_ROW_PORT_OFFSET)]
+    except socket.error as e:
+        print(f"Error opening FEC sockets: {e}")
+        exit(1)
+
 print(f"\nMulticast Configuration Details:")
 print(f"--------------------------------")
 print(f"Multicast Group: {MCAST_GRP}")
@@ -63,35 +1214,73 @@ total_bytes = 0
 packet_count = 0
 
 try:
-    with open(output_file, 'wb') as f:
-        start_time = time.time()
-        while True:
-            try:
-                data, addr = sock.recvfrom(65536)  # Tăng kích thước buffer
-                packet_count += 1
-                total_bytes += len(data)
+    if args.fast or args.fec:
+        with open(output_file, 'wb', buffering=FAST_WRITE_BUFFER) as f:
+            analyzer = TSAnalyzer(latency=args.latency) if args.analyze else None
+            if args.fec:
+                decoder = FecDecoder()
+                injector = LossInjector(args.drop_rate, args.drop_burst, args.seed) if args.drop_rate else None
+                packet_count, total_bytes = receive_fec(sock, fec_sockets, f, args.duration, decoder, analyzer,
+                                                        injector)
+            else:
+                packet_count, total_bytes = receive_fast(sock, f, args.duration, analyzer)
+        print(f"Received {packet_count} packets, total {total_bytes/1024/1024:.2f} MB")
+        print(f"Data saved to {os.path.abspath(output_file)}")
+        fec_report = None
+        if args.fec:
+            fec_report = decoder.report()
+            fec_report["injected_drops"] = injector.dropped if injector else {}
+            print(f"FEC {fec_report['columns']}x{fec_report['rows']}: overhead "
+                  f"{(fec_report['overhead'] or 0):.1%} | missing before FEC {fec_report['missing_before_fec']} "
+                  f"({(fec_report['loss_before_fec'] or 0):.3%}) | recovered {fec_report['recovered']} | "
+                  f"lost {fec_report['lost']} ({(fec_report['loss_after_fec'] or 0):.3%})")
+        if analyzer is not None or (fec_report is not None and args.report):
+            report = analyzer.report() if analyzer is not None else {}
+            if fec_report is not None:
+                report["fec"] = fec_report
+            report_file = args.report or f"multicast_report_{int(time.time())}.json"
+            with open(report_file, 'w') as r:
+                json.dump(report, r, indent=2)
+        if analyzer is not None:
+            print(f"TS analysis: {'OK' if report['ok'] else 'PROBLEMS FOUND'} | CC errors {report['cc_errors']} | "
+                  f"sync errors {report['sync_errors']} | PCR discontinuities {report['pcr']['discontinuities']} | "
+                  f"gaps {report['datagram_gaps']['count']}")
+            if report.get("latency"):
+                latency = report["latency"]
+                print(f"End-to-end latency ({latency['frames']} frames): p50 {latency['p50_ms']:.0f} ms | "
+                      f"p95 {latency['p95_ms']:.0f} ms | p99 {latency['p99_ms']:.0f} ms | max {latency['max_ms']:.0f} ms")
+        if analyzer is not None or (fec_report is not None and args.report):
+            print(f"Report saved to {os.path.abspath(report_file)}")
+    else:
+        with open(output_file, 'wb') as f:
+            start_time = time.time()
+            while True:
+                try:
+                    data, addr = sock.recvfrom(65536)  # Tăng kích thước buffer
+                    packet_count += 1
+                    total_bytes += len(data)
                 
-                # Ghi dữ liệu vào file
-                f.write(data)
+                    # Ghi dữ liệu vào file
+                    f.write(data)
                 
-                # Hiển thị thông tin
-                elapsed = time.time() - start_time
-                rate = total_bytes / (1024 * 1024 * elapsed) if elapsed > 0 else 0
-                print(f"Received packet #{packet_count}: {len(data)} bytes from {addr} | Total: {total_bytes/1024/1024:.2f} MB | Rate: {rate:.2f} MB/s")
+                    # Hiển thị thông tin
+                    elapsed = time.time() - start_time
+                    rate = total_bytes / (1024 * 1024 * elapsed) if elapsed > 0 else 0
+                    print(f"Received packet #{packet_count}: {len(data)} bytes from {addr} | Total: {total_bytes/1024/1024:.2f} MB | Rate: {rate:.2f} MB/s")
                 
-                # Flush để đảm bảo dữ liệu được ghi xuống ngay lập tức
-                f.flush()
+                    # Flush để đảm bảo dữ liệu được ghi xuống ngay lập tức
+                    f.flush()
                 
-                # Nếu đây là gói đầu tiên, thêm thông tin
-                if packet_count == 1:
-                    print(f"\nFirst packet received from: {addr}")
-                    print(f"Connection established successfully!")
+                    # Nếu đây là gói đầu tiên, thêm thông tin
+                    if packet_count == 1:
+                        print(f"\nFirst packet received from: {addr}")
+                        print(f"Connection established successfully!")
                 
-            except socket.timeout:
-                if packet_count == 0:
-                    print("No data received in 10 seconds, still waiting...")
-                else:
-                    print(f"Timeout after receiving {packet_count} packets. Continuing to listen...")
+                except socket.timeout:
+                    if packet_count == 0:
+                        print("No data received in 10 seconds, still waiting...")
+                    else:
+                        print(f"Timeout after receiving {packet_count} packets. Continuing to listen...")
 except KeyboardInterrupt:
     print(f"\nReceived {packet_count} packets, total {total_bytes/1024/1024:.2f} MB")
     print(f"Data saved to {os.path.abspath(output_file)}")
@@ -101,4 +1290,6 @@ finally:
     # Rời khỏi nhóm multicast trước khi đóng socket
     sock.setsockopt(socket.IPPROTO_IP, socket.IP_DROP_MEMBERSHIP, mreq)
     sock.close()
+    for fec_sock in fec_sockets:
+        fec_sock.close()
     print("Socket closed")
@@ -1,14 +1,58 @@
 #!/usr/bin/env python3
+import argparse
+import asyncio
 import requests
 import time
 import psutil
 import os
 from datetime import datetime
 import json
+import gzip
+import math
+import shutil
+import sys
 import subprocess
 import threading
+from collections import deque
 from urllib.parse import urlparse
 import numpy as np
+import resource
+
+from hlsClient import AsyncHTTPConnection, latency_summary, segment_uris
+
+# Default sampling interval (seconds) of each probe; every probe runs on its own schedule
+PROBE_INTERVALS = {
+    "system": 1.0,
+    "network": 1.0,
+    "latency": 1.0,
+    "hls_status": 5.0,
+    "segment": 5.0,
+    "processes": 1.0,
+    "live_edge": 0.5,
+}
+REPORT_INTERVAL = 5.0   # Seconds between printed reports
+SERVER_URL = "http://localhost:3000"                                # Streaming server to monitor
+CDN_URL = "http://34.120.70.159/13129933_3840_2160_30fps.mp4"       # Source checked once at startup
+
+# Streaming stats storage (one directory per monitoring run)
+STATS_DIR = "hls_stats"
+STATS_FLUSH_INTERVAL = 5.0                  # Seconds between flushes of the open file
+STATS_ROTATE_BYTES = 64 * 1024 * 1024       # Start a new file at this size...
+STATS_ROTATE_SECONDS = 3600                 # ...or after this many seconds
+
+# Online statistics
+SKETCH_ACCURACY = 0.01      # Relative accuracy of the quantile sketch (p50/p95/p99 within 1%)
+SKETCH_MAX_BINS = 2048      # The lowest bins are collapsed beyond this
+STATS_WINDOW = 60.0         # Seconds covered by the sliding-window view
+STATS_WINDOW_BUCKET = 1.0   # Granularity (seconds) of the sliding window
+
+_http = threading.local()
+
+def http_session():
+    """Keep-alive requests session of the calling thread (each probe thread reuses its own connections)"""
+    if not hasattr(_http, "session"):
+        _http.session = requests.Session()
+    return _http.session
 
 class NetworkStats:
     def __init__(self):
@@ -30,35 +74,48 @@ class NetworkStats:
         net_io = psutil.net_io_counters()
         self.previous_total_sent = net_io.bytes_sent
         self.previous_total_recv = net_io.bytes_recv
+        self.last_update = time.monotonic()
 
     def update(self):
         net_io = psutil.net_io_counters()
+        now = time.monotonic()
         current_bytes_sent = net_io.bytes_sent - self.previous_total_sent
         current_bytes_recv = net_io.bytes_recv - self.previous_total_recv
         
-        # Calculate bandwidth usage (bytes per second)
-        if self.last_bytes_sent > 0 and self.last_bytes_recv > 0:
-            send_rate = (current_bytes_sent - self.last_bytes_sent) / 5  # 5 seconds interval
-            recv_rate = (current_bytes_recv - self.last_bytes_recv) / 5
+        # Calculate bandwidth usage (bytes per second) over the measured interval
+        elapsed = now - self.last_update
+        if elapsed > 0:
+            send_rate = (current_bytes_sent - self.last_bytes_sent) / elapsed
+            recv_rate = (current_bytes_recv - self.last_bytes_recv) / elapsed
+            self.upload_speed = send_rate
+            self.download_speed = recv_rate
             self.bandwidth_usage = send_rate + recv_rate
         
+        self.last_update = now
         self.last_bytes_sent = current_bytes_sent
         self.last_bytes_recv = current_bytes_recv
         self.bytes_sent = current_bytes_sent
         self.bytes_recv = current_bytes_recv
+        return {
+            "bandwidth_usage_bps": self.bandwidth_usage,
+            "upload_bps": self.upload_speed,
+            "download_bps": self.download_speed,
+            "bytes_sent": self.bytes_sent,
+            "bytes_recv": self.bytes_recv,
+        }
 
-def get_hls_stats():
+def get_hls_stats(server=SERVER_URL):
     """Get HLS streaming statistics"""
     try:
-        response = requests.get('http://localhost:3000/status')
+        response = http_session().get(f'{server}/status', timeout=5)
         return response.json()
     except Exception as e:
         print(f"Error getting HLS stats: {e}")
         return {"multicast_running": False, "hls_running": False}
 
 def get_system_stats():
-    """Get system resource usage"""
-    cpu_percent = psutil.cpu_percent(interval=1)
+    """Get system resource usage (CPU is averaged since the previous call, so this never blocks)"""
+    cpu_percent = psutil.cpu_percent(interval=None)
     memory = psutil.virtual_memory()
     disk = psutil.disk_usage('/')
     
@@ -68,30 +125,31 @@ def get_system_stats():
         "disk_percent": disk.percent
     }
 
-def measure_latency(host="localhost", port=3000):
+def measure_latency(server=SERVER_URL):
     """Measure latency to the streaming server"""
     try:
-        start_time = time.time()
-        requests.get(f"http://{host}:{port}/status")
-        end_time = time.time()
+        start_time = time.perf_counter()
+        http_session().get(f"{server}/status", timeout=5)
+        end_time = time.perf_counter()
         return (end_time - start_time) * 1000  # Convert to milliseconds
     except Exception as e:
         print(f"Error measuring latency: {e}")
         return -1
 
-def get_segment_download_time():
+def get_segment_download_time(server=SERVER_URL):
     """Measure HLS segment download time"""
     try:
-        start_time = time.time()
-        response = requests.get('http://localhost:3000/hls/playlist.m3u8')
+        session = http_session()
+        start_time = time.perf_counter()
+        response = session.get(f'{server}/hls/playlist.m3u8', timeout=10)
         if response.status_code == 200:
             # Get the latest segment from playlist
             segments = [line for line in response.text.split('\n') if line.endswith('.ts')]
             if segments:
                 latest_segment = segments[-1]
-                response = requests.get(f'http://localhost:3000/hls/{latest_segment}')
+                response = session.get(f'{server}/hls/{latest_segment}', timeout=10)
                 if response.status_code == 200:
-                    duration = (time.time() - start_time) * 1000  # Convert to milliseconds
+                    duration = (time.perf_counter() - start_time) * 1000  # Convert to milliseconds
                     # Estimate CDN bytes based on segment size
                     return duration, len(response.content)
         return -1, 0
@@ -99,7 +157,524 @@ def get_segment_download_time():
         print(f"Error getting segment download time: {e}")
         return -1, 0
 
-def get_cdn_stats(cdn_url="http://34.120.70.159/13129933_3840_2160_30fps.mp4"):
+def parse_program_date_time(value):
+    """Unix time of an EXT-X-PROGRAM-DATE-TIME value (Z, +00:00 or +0000 offsets)"""
+    value = value.strip().replace("Z", "+00:00")
+    if value[-5] in "+-" and value[-4:].isdigit():
+        value = value[:-2] + ":" + value[-2:]
+    return datetime.fromisoformat(value).timestamp()
+
+class LiveEdgeLatency:
+    """End-to-end delay of each new HLS segment, from its EXT-X-PROGRAM-DATE-TIME (capture time of its first frame)
+
+    A new segment is downloaded as soon as the playlist lists it. Latency is the time it was fully received minus
+    its capture time; edge delay is measured from its last frame (PDT + duration), i.e. what segmenting, upload and
+    delivery add. The server and this host must share a clock (same host, or NTP/PTP).
+    """
+
+    def __init__(self, url=f"{SERVER_URL}/hls/playlist.m3u8"):
+        self.url = url
+        self.last_uri = None
+
+    def update(self):
+        try:
+            session = http_session()
+            text = session.get(self.url, timeout=5).text
+            if "#EXT-X-STREAM-INF" in text:
+                # Master playlist: follow the first variant
+                self.url = f"{self.url.rsplit('/', 1)[0]}/{segment_uris(text)[0]}"
+                text = session.get(self.url, timeout=5).text
+            segments = [entry for entry in parse_media_playlist(text)[2] if entry[2] is not None]
+            if not segments:
+                return []
+            uris = [uri for uri, _, _ in segments]
+            if self.last_uri is None:
+                # Segments listed before the first poll were published earlier: start with the next one
+                self.last_uri = uris[-1]
+                return []
+            new = segments[uris.index(self.last_uri) + 1:] if self.last_uri in uris else segments
+            results = []
+            for uri, duration, captured in new:
+                response = session.get(f"{self.url.rsplit('/', 1)[0]}/{uri}", timeout=10)
+                arrived = time.time()
+                self.last_uri = uri
+                if response.status_code == 200:
+                    results.append({"uri": uri, "latency_ms": (arrived - captured) * 1000,
+                                    "edge_delay_ms": (arrived - captured - duration) * 1000})
+            return results
+        except Exception as e:
+            print(f"Error measuring live edge latency: {e}")
+            return []
+
+class ProcessStats:
+    """Per-process resource usage of the server and its ffmpeg children, plus HLS traffic per channel
+
+    The PIDs come from the server's /processes endpoint. Every rate is the counter delta over the measured
+    interval; CPU is in percent of one core. "other" is the busy CPU time not taken by any of these processes.
+    """
+
+    def __init__(self, url=f"{SERVER_URL}/processes"):
+        self.url = url
+        self.handles = {}       # pid -> psutil.Process
+        self.previous = {}      # key -> (time, counters)
+        self.previous_busy = (time.monotonic(), self._busy_seconds())
+
+    @staticmethod
+    def _busy_seconds():
+        times = psutil.cpu_times()
+        # guest time is already counted in user time
+        return sum(times) - times.idle - getattr(times, "iowait", 0) - getattr(times, "guest", 0) \
+            - getattr(times, "guest_nice", 0)
+
+    def _counters(self, pid):
+        process = self.handles.get(pid)
+        if process is None:
+            process = self.handles[pid] = psutil.Process(pid)
+        with process.oneshot():
+            cpu = process.cpu_times()
+            io = process.io_counters() if hasattr(process, "io_counters") else None
+            ctx = process.num_ctx_switches()
+            return {
+                "pid": pid,
+                "cpu_seconds": cpu.user + cpu.system,
+                "rss_bytes": process.memory_info().rss,
+                "threads": process.num_threads(),
+                # read/write_chars include sockets and pipes; read/write_bytes only hit the disk
+                "io_read": getattr(io, "read_chars", io.read_bytes) if io else 0,
+                "io_write": getattr(io, "write_chars", io.write_bytes) if io else 0,
+                "disk_read": io.read_bytes if io else 0,
+                "disk_write": io.write_bytes if io else 0,
+                "ctx_switches": ctx.voluntary + ctx.involuntary,
+            }
+
+    def _rates(self, key, now, counters, totals):
+        """Per-second rates since the previous sample of the same process (None on its first sample)"""
+        previous = self.previous.get(key)
+        self.previous[key] = (now, counters)
+        if previous is None or previous[1].get("pid") != counters.get("pid"):
+            return None
+        elapsed = now - previous[0]
+        if elapsed <= 0:
+            return None
+        return {name: (counters[name] - previous[1][name]) / elapsed for name in totals}
+
+    def update(self):
+        try:
+            info = http_session().get(self.url, timeout=5).json()
+        except Exception as e:
+            print(f"Error getting process list: {e}")
+            return {"processes": {}, "channels": {}, "other_cpu_percent": None}
+        now = time.monotonic()
+        busy = self._busy_seconds()
+        processes, channels = {}, {}
+        targets = [("server", info["server_pid"], None)]
+        for channel_id, channel in info["channels"].items():
+            for entry in channel["processes"]:
+                targets.append((f"{channel_id}/{entry['role']}", entry["pid"], entry))
+            rates = self._rates(f"{channel_id}/traffic", now, channel["traffic"], channel["traffic"])
+            if rates is not None:
+                channels[channel_id] = {
+                    "hls_requests_per_s": rates["hls_requests"],
+                    "hls_served_bps": rates["hls_bytes_served"],
+                    "hls_ingest_bps": rates["hls_bytes_ingested"],
+                }
+        for key, pid, entry in targets:
+            try:
+                if entry is not None and entry["thread"]:
+                    # Paced multicast sender: a thread of the server, only its CPU time and output are known
+                    counters = {"pid": pid, "cpu_seconds": entry["cpu_seconds"]}
+                else:
+                    counters = self._counters(pid)
+                # Bytes the encoder wrote to its outputs (ffmpeg -progress total_size), None when ffmpeg cannot tell
+                if entry is not None and entry["output_bytes"] is not None:
+                    counters["output"] = entry["output_bytes"]
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                self.handles.pop(pid, None)
+                continue
+            rates = self._rates(key, now, counters, [name for name in counters if name not in
+                                                     ("pid", "rss_bytes", "threads")])
+            if rates is None:
+                continue
+            sample = {"pid": pid, "cpu_percent": 100.0 * rates["cpu_seconds"]}
+            if "rss_bytes" in counters:
+                sample.update({
+                    "rss_bytes": counters["rss_bytes"],
+                    "threads": counters["threads"],
+                    "io_read_bps": rates["io_read"],
+                    "io_write_bps": rates["io_write"],
+                    "disk_read_bps": rates["disk_read"],
+                    "disk_write_bps": rates["disk_write"],
+                    "ctx_switches_per_s": rates["ctx_switches"],
+                })
+            if "output" in rates:
+                sample["output_bps"] = rates["output"]
+            processes[key] = sample
+            if "output" in rates:
+                channels.setdefault(key.split("/")[0], {})[f"{entry['role']}_output_bps"] = rates["output"]
+        # The paced sender's CPU time is part of the server process: move it out of the server's share
+        for key, sample in processes.items():
+            if "rss_bytes" not in sample and "server" in processes:
+                processes["server"]["cpu_percent"] = max(0.0, processes["server"]["cpu_percent"] - sample["cpu_percent"])
+        # Keep handles of listed processes only, so a restarted encoder gets a fresh one
+        live = {pid for _, pid, _ in targets}
+        self.handles = {pid: handle for pid, handle in self.handles.items() if pid in live}
+        elapsed = now - self.previous_busy[0]
+        attributed = sum(sample["cpu_percent"] for sample in processes.values())
+        other = max(0.0, 100.0 * (busy - self.previous_busy[1]) / elapsed - attributed) \
+            if processes and elapsed > 0 else None
+        self.previous_busy = (now, busy)
+        return {"processes": processes, "channels": channels, "other_cpu_percent": other}
+
+def compress_stats_file(path):
+    """Gzip a closed stats file; the .gz appears atomically and then the plain file is removed"""
+    with open(path, "rb") as source, gzip.open(path + ".gz.tmp", "wb") as target:
+        shutil.copyfileobj(source, target)
+    os.replace(path + ".gz.tmp", path + ".gz")
+    os.remove(path)
+
+class StatsSink:
+    """Append-only JSON Lines storage with periodic flush, size/time rotation and gzip of closed files
+
+    Every line starts with the record's Unix time ({"t":...}), written under a lock so that lines are in time order;
+    readers use that to slice a run without parsing every record.
+    """
+
+    def __init__(self, directory, flush_interval=STATS_FLUSH_INTERVAL, rotate_bytes=STATS_ROTATE_BYTES,
+                 rotate_seconds=STATS_ROTATE_SECONDS, compress=True):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compress = compress
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.records = 0
+        self.compressors = []
+        self._open()
+
+    def _open(self):
+        self.path = os.path.join(self.directory,
+                                 f"stats-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{self.sequence:04d}.jsonl")
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.size = 0
+        self.opened_at = self.last_flush = time.monotonic()
+
+    def _rotate(self):
+        self.file.close()
+        if self.compress:
+            thread = threading.Thread(target=compress_stats_file, args=(self.path,), daemon=True)
+            thread.start()
+            self.compressors.append(thread)
+        self.sequence += 1
+        self._open()
+
+    def write(self, record):
+        with self.lock:
+            line = json.dumps({"t": round(time.time(), 3), **record}, separators=(",", ":"), default=str) + "\n"
+            self.file.write(line)
+            self.size += len(line)
+            self.records += 1
+            now = time.monotonic()
+            if self.size >= self.rotate_bytes or now - self.opened_at >= self.rotate_seconds:
+                self._rotate()
+            elif now - self.last_flush >= self.flush_interval:
+                self.file.flush()
+                self.last_flush = now
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            if self.compress and self.size:
+                compress_stats_file(self.path)
+            elif not self.size:
+                os.remove(self.path)
+        for thread in self.compressors:
+            thread.join()
+
+def stats_files(path):
+    """Files of a stats run in time order (a single file is returned as is)"""
+    if os.path.isfile(path):
+        return [path]
+    names = sorted(n for n in os.listdir(path) if n.endswith((".jsonl", ".jsonl.gz")))
+    # While a file is being compressed both versions exist: use the plain one
+    return [os.path.join(path, n) for n in names if not (n.endswith(".gz") and n[:-3] in names)]
+
+def stats_file_start(path):
+    """Start time (Unix) encoded in a stats file name, None if the name has another format"""
+    try:
+        stamp = os.path.basename(path).split("-", 1)[1][:15]
+        return time.mktime(datetime.strptime(stamp, "%Y%m%d-%H%M%S").timetuple())
+    except (IndexError, ValueError):
+        return None
+
+def read_stats(path, start=None, end=None, probes=None):
+    """Yield the records of a stats run (directory or file) with start <= t < end, optionally only some probes
+
+    Files that end before `start` are skipped by name, and lines outside the range are rejected from their
+    leading timestamp without JSON parsing; a truncated last line (crash) is ignored.
+    """
+    files = stats_files(path)
+    starts = [stats_file_start(f) for f in files]
+    for index, filename in enumerate(files):
+        if end is not None and starts[index] is not None and starts[index] >= end:
+            break
+        following = starts[index + 1] if index + 1 < len(files) else None
+        # Names are truncated to whole seconds: the next file may have started up to 1 s after its name time
+        if start is not None and following is not None and following + 1 <= start:
+            continue
+        opener = gzip.open if filename.endswith(".gz") else open
+        with opener(filename, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    t = float(line[5:line.index(",", 5)])
+                except ValueError:
+                    continue
+                if start is not None and t < start:
+                    continue
+                if end is not None and t >= end:
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if probes is None or record.get("probe") in probes:
+                    yield record
+
+def export_stats_json(path, output, probe="report"):
+    """Write the records of one probe as a JSON array (streamed, without loading the run into memory)"""
+    with open(output, "w") as f:
+        f.write("[")
+        for index, record in enumerate(read_stats(path, probes={probe})):
+            record.pop("t", None)
+            record.pop("probe", None)
+            f.write(("," if index else "") + "\n" + json.dumps(record, indent=4))
+        f.write("\n]\n")
+
+class RunningStats:
+    """Count, mean, variance (Welford), min and max in O(1) per sample; mergeable"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def std(self):
+        """Population standard deviation (same as np.std)"""
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
+class QuantileSketch:
+    """Mergeable quantile sketch with relative accuracy (logarithmic buckets, as in DDSketch)
+
+    A value x > 0 goes to bucket ceil(log_gamma(x)); every quantile is returned within SKETCH_ACCURACY of a real
+    sample value. Adding is O(1) and two sketches merge by adding their bucket counts.
+    """
+
+    def __init__(self, accuracy=SKETCH_ACCURACY, max_bins=SKETCH_MAX_BINS):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_bins = max_bins
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if value <= 0:
+            self.zero_count += 1
+            return
+        key = math.ceil(math.log(value) / self.log_gamma)
+        self.bins[key] = self.bins.get(key, 0) + 1
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self):
+        # Merge the lowest buckets: only the accuracy of the smallest values is lost
+        keys = sorted(self.bins)
+        excess = keys[:len(keys) - self.max_bins + 1]
+        self.bins[excess[-1]] += sum(self.bins.pop(key) for key in excess[:-1])
+
+    def merge(self, other):
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = round(q * (self.count - 1))
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+class MetricStats:
+    """Running aggregates plus quantile sketch of one metric"""
+
+    def __init__(self):
+        self.running = RunningStats()
+        self.sketch = QuantileSketch()
+
+    def add(self, value):
+        self.running.add(value)
+        self.sketch.add(value)
+
+    def merge(self, other):
+        self.running.merge(other.running)
+        self.sketch.merge(other.sketch)
+
+    def summary(self):
+        r = self.running
+        if not r.count:
+            return {"count": 0, "avg": 0, "min": 0, "max": 0, "std": 0, "p50": 0, "p95": 0, "p99": 0, "total": 0}
+        # The sketch estimate is clamped to the exact extremes
+        quantile = lambda q: min(max(self.sketch.quantile(q), r.min), r.max)
+        return {"count": r.count, "avg": r.mean, "min": r.min, "max": r.max, "std": r.std,
+                "p50": quantile(0.50), "p95": quantile(0.95), "p99": quantile(0.99), "total": r.total}
+
+class WindowedStats:
+    """Sliding-window view: one MetricStats per time bucket, merged on demand"""
+
+    def __init__(self, window=STATS_WINDOW, bucket=STATS_WINDOW_BUCKET):
+        self.window = window
+        self.bucket = bucket
+        self.buckets = deque()
+
+    def add(self, value, now):
+        start = now - now % self.bucket
+        if not self.buckets or self.buckets[-1][0] != start:
+            self.buckets.append((start, MetricStats()))
+            while self.buckets[0][0] <= now - self.window - self.bucket:
+                self.buckets.popleft()
+        self.buckets[-1][1].add(value)
+
+    def view(self, seconds, now):
+        merged = MetricStats()
+        for start, stats in self.buckets:
+            if start + self.bucket > now - seconds:
+                merged.merge(stats)
+        return merged
+
+class StatsBook:
+    """Whole-run and sliding-window statistics of every metric, updated in O(1) per sample"""
+
+    def __init__(self, window=STATS_WINDOW):
+        self.window = window
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.windows = {}
+
+    def add(self, name, value, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if name not in self.totals:
+                self.totals[name] = MetricStats()
+                self.windows[name] = WindowedStats(self.window)
+            self.totals[name].add(value)
+            self.windows[name].add(value, now)
+
+    def summary(self, name):
+        with self.lock:
+            return (self.totals[name] if name in self.totals else MetricStats()).summary()
+
+    def recent(self, name, seconds=None, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if name not in self.windows:
+                return MetricStats().summary()
+            return self.windows[name].view(seconds or self.window, now).summary()
+
+class SamplingScheduler:
+    """Runs each probe in its own thread on a fixed schedule
+
+    Ticks are computed from the start time on the monotonic clock, so a slow probe never shifts later
+    samples; ticks that are missed while a probe is still running are skipped and counted.
+    """
+
+    def __init__(self, sink=None, on_sample=None):
+        self.sink = sink
+        self.on_sample = on_sample
+        self.probes = {}
+        self.latest_values = {}
+        self.skipped = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def add(self, name, interval, probe):
+        self.probes[name] = (interval, probe)
+        self.skipped[name] = 0
+
+    def _run(self, name, interval, probe, start):
+        tick = 0
+        while not self.stop_event.is_set():
+            sampled_at = time.monotonic()
+            value = probe()
+            with self.lock:
+                self.latest_values[name] = value
+            if self.on_sample is not None:
+                self.on_sample(name, value, sampled_at)
+            if self.sink is not None:
+                self.sink.write({"probe": name, "value": value})
+            tick += 1
+            now = time.monotonic()
+            missed = int((now - (start + tick * interval)) // interval) + 1 if now > start + tick * interval else 0
+            if missed:
+                tick += missed
+                with self.lock:
+                    self.skipped[name] += missed
+            self.stop_event.wait(start + tick * interval - now)
+
+    def start(self):
+        start = time.monotonic()
+        for name, (interval, probe) in self.probes.items():
+            thread = threading.Thread(target=self._run, args=(name, interval, probe, start), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return start
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout=15)
+
+    def latest(self, name, default=None):
+        with self.lock:
+            return self.latest_values.get(name, default)
+
+def get_cdn_stats(cdn_url=CDN_URL):
     """Get CDN connection stats"""
     try:
         start_time = time.time()
@@ -132,12 +707,13 @@ def format_bytes(bytes):
         bytes /= 1024
     return f"{bytes:.2f} TB"
 
-def save_performance_report(stats, duration, summary):
+def save_performance_report(stats_path, duration, summary):
     """Save performance report to a text file"""
     with open('performance.txt', 'w') as f:
         f.write("=== VIDEO STREAMING PERFORMANCE REPORT ===\n")
         f.write(f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"Duration: {duration} seconds\n\n")
+        f.write(f"Duration: {duration} seconds\n")
+        f.write(f"Samples: {stats_path}\n\n")
         
         f.write("=== SYSTEM PERFORMANCE ===\n")
         f.write(f"Average CPU Usage: {summary['avg_cpu']:.2f}%\n")
@@ -155,14 +731,45 @@ def save_performance_report(stats, duration, summary):
         f.write(f"  Average: {summary['avg_latency']:.2f}\n")
         f.write(f"  Minimum: {summary['min_latency']:.2f}\n")
         f.write(f"  Maximum: {summary['max_latency']:.2f}\n")
-        f.write(f"  Standard Deviation: {summary['std_latency']:.2f}\n\n")
+        f.write(f"  Standard Deviation: {summary['std_latency']:.2f}\n")
+        f.write(f"  p50 / p95 / p99: {summary['p50_latency']:.2f} / {summary['p95_latency']:.2f} / "
+                f"{summary['p99_latency']:.2f}\n\n")
         
         f.write("=== HLS SEGMENT STATISTICS ===\n")
         f.write(f"Segment Download Time (ms):\n")
         f.write(f"  Average: {summary['avg_segment_time']:.2f}\n")
         f.write(f"  Minimum: {summary['min_segment_time']:.2f}\n")
         f.write(f"  Maximum: {summary['max_segment_time']:.2f}\n")
-        f.write(f"  Standard Deviation: {summary['std_segment_time']:.2f}\n\n")
+        f.write(f"  Standard Deviation: {summary['std_segment_time']:.2f}\n")
+        f.write(f"  p50 / p95 / p99: {summary['p50_segment_time']:.2f} / {summary['p95_segment_time']:.2f} / "
+                f"{summary['p99_segment_time']:.2f}\n\n")
+        
+        if summary['live_segments']:
+            f.write("=== END-TO-END LATENCY (HLS, capture to arrival) ===\n")
+            f.write(f"Segments: {summary['live_segments']}\n")
+            f.write(f"  Average: {summary['avg_live_latency']:.0f} ms\n")
+            f.write(f"  p50 / p95 / p99: {summary['p50_live_latency']:.0f} / {summary['p95_live_latency']:.0f} / "
+                    f"{summary['p99_live_latency']:.0f} ms\n")
+            f.write(f"  Maximum: {summary['max_live_latency']:.0f} ms\n")
+            f.write(f"  Edge delay after the segment's last frame: avg {summary['avg_edge_delay']:.0f} ms, "
+                    f"p95 {summary['p95_edge_delay']:.0f} ms\n\n")
+        
+        window = summary['window']
+        f.write(f"=== LAST {summary['window_seconds']:.0f} SECONDS ===\n")
+        f.write(f"Server Latency (ms): avg {window['latency_ms']['avg']:.2f}, p95 {window['latency_ms']['p95']:.2f}, "
+                f"p99 {window['latency_ms']['p99']:.2f}, max {window['latency_ms']['max']:.2f}\n")
+        f.write(f"Segment Download Time (ms): avg {window['segment_ms']['avg']:.2f}, "
+                f"p95 {window['segment_ms']['p95']:.2f}, max {window['segment_ms']['max']:.2f}\n")
+        f.write(f"Bandwidth Usage: {format_bytes(window['bandwidth_bps']['avg'])}/s\n")
+        f.write(f"CPU Usage: avg {window['cpu_percent']['avg']:.2f}%, max {window['cpu_percent']['max']:.2f}%\n\n")
+        
+        if summary.get('processes'):
+            f.write("=== PER-PROCESS RESOURCES (CPU in % of one core) ===\n")
+            for key, stats in summary['processes'].items():
+                f.write(f"{format_process_line(key, stats)}\n")
+            for key, stats in summary['channels'].items():
+                f.write(f"Channel {format_channel_line(key, stats)}\n")
+            f.write("\n")
         
         f.write("=== ANALYSIS AND RECOMMENDATIONS ===\n")
         
@@ -217,162 +824,813 @@ def save_performance_report(stats, duration, summary):
     
     print(f"Performance report saved to performance.txt")
 
-def monitor_hls_performance(duration=120, cdn_url="http://34.120.70.159/13129933_3840_2160_30fps.mp4"):  # Monitor for 2 minutes by default
+def process_breakdown(book, metrics, seconds=None):
+    """Statistics of every per-process (or per-channel) metric: whole run, or the last `seconds`"""
+    result = {}
+    for key, names in metrics.items():
+        stats = {name: book.summary(f"{key}.{name}") if seconds is None else book.recent(f"{key}.{name}", seconds)
+                 for name in names}
+        result[key] = {name: value for name, value in stats.items() if value["count"]}
+    return result
+
+def format_process_line(key, stats, pid=None):
+    """One line of the per-process breakdown (averages, CPU p95, peak RSS)"""
+    name = key.split(":", 1)[1] + (f" (pid {pid})" if pid else "")
+    if "cpu_percent" not in stats:
+        return f"{name}: no samples"
+    cpu = stats["cpu_percent"]
+    line = f"{name}: CPU {cpu['avg']:.1f}% (p95 {cpu['p95']:.1f}%, max {cpu['max']:.1f}%)"
+    if "rss_bytes" in stats:
+        line += (f" | RSS {format_bytes(stats['rss_bytes']['max'])} | {stats['threads']['avg']:.0f} threads"
+                 f" | I/O {format_bytes(stats['io_read_bps']['avg'])}/s in, {format_bytes(stats['io_write_bps']['avg'])}/s out"
+                 f" | disk {format_bytes(stats['disk_write_bps']['avg'])}/s written"
+                 f" | {stats['ctx_switches_per_s']['avg']:.0f} ctx switches/s")
+    if "output_bps" in stats:
+        line += f" | encoder output {format_bytes(stats['output_bps']['avg'])}/s"
+    return line
+
+def format_channel_line(key, stats):
+    """One line of the per-channel traffic breakdown"""
+    parts = []
+    if "hls_served_bps" in stats:
+        parts.append(f"HLS served {format_bytes(stats['hls_served_bps']['avg'])}/s"
+                     f" ({stats['hls_requests_per_s']['avg']:.1f} req/s)")
+        parts.append(f"HLS ingested {format_bytes(stats['hls_ingest_bps']['avg'])}/s")
+    for name, value in stats.items():
+        if name.endswith("_output_bps"):
+            parts.append(f"{name[:-len('_output_bps')]} encoder output {format_bytes(value['avg'])}/s")
+    return f"{key.split(':', 1)[1]}: " + ", ".join(parts)
+
+def monitor_hls_performance(duration=120, cdn_url=CDN_URL, server=SERVER_URL, intervals=None,
+                            report_interval=REPORT_INTERVAL, stats_dir=STATS_DIR,
+                            rotate_bytes=STATS_ROTATE_BYTES, rotate_seconds=STATS_ROTATE_SECONDS):  # Monitor for 2 minutes by default
     print(f"Starting enhanced HLS performance monitoring for {duration} seconds...")
     print("=" * 70)
     
-    start_time = time.time()
-    stats = []
+    sink = StatsSink(os.path.join(stats_dir, f"run-{datetime.now().strftime('%Y%m%d-%H%M%S')}"),
+                     rotate_bytes=rotate_bytes, rotate_seconds=rotate_seconds)
+    print(f"Streaming samples to {sink.directory}/")
     network_stats = NetworkStats()
-    
-    # Initialize lists for calculating statistics
-    latencies = []
-    segment_times = []
-    bandwidths = []
-    segment_sizes = []
-    cpu_usages = []
-    memory_usages = []
-    disk_usages = []
-    total_cdn_bytes = 0
+    psutil.cpu_percent(interval=None)  # First CPU sample is measured from here
     
     # Get initial CDN stats
     cdn_stats = get_cdn_stats(cdn_url)
     print(f"CDN Content Length: {format_bytes(cdn_stats['content_length'])}")
     
-    while time.time() - start_time < duration:
-        current_time = datetime.now().strftime("%H:%M:%S")
-        
-        # Update network stats
-        network_stats.update()
-        
-        # Get various stats
-        hls_stats = get_hls_stats()
-        system_stats = get_system_stats()
-        cpu_usages.append(system_stats['cpu_percent'])
-        memory_usages.append(system_stats['memory_percent'])
-        disk_usages.append(system_stats['disk_percent'])
-        
-        latency = measure_latency()
-        segment_download_time, segment_size = get_segment_download_time()
-        
-        # Add segment size to total CDN bytes estimation
-        if segment_size > 0:
-            total_cdn_bytes += segment_size
-            segment_sizes.append(segment_size)
-        
-        if latency > 0:
-            latencies.append(latency)
-        if segment_download_time > 0:
-            segment_times.append(segment_download_time)
-        if network_stats.bandwidth_usage > 0:
-            bandwidths.append(network_stats.bandwidth_usage)
-        
-        # Combine stats
-        current_stats = {
-            "timestamp": current_time,
-            "hls_status": hls_stats,
-            "system_stats": system_stats,
-            "network_stats": {
-                "latency_ms": latency,
-                "segment_download_time_ms": segment_download_time,
-                "segment_size_bytes": segment_size,
-                "bandwidth_usage_bps": network_stats.bandwidth_usage,
-                "bytes_sent": network_stats.bytes_sent,
-                "bytes_recv": network_stats.bytes_recv
+    intervals = dict(PROBE_INTERVALS, **(intervals or {}))
+    print("Sampling every " + ", ".join(f"{name} {interval:g}s" for name, interval in intervals.items()))
+    book = StatsBook(window=max(STATS_WINDOW, report_interval))
+    process_stats = ProcessStats(f"{server}/processes")
+    process_metrics, channel_metrics = {}, {}   # "process:<key>" / "channel:<id>" -> metric names seen
+    
+    def record_sample(name, value, now):
+        """Feed one probe sample into the online statistics"""
+        if name == "processes":
+            samples = dict(value["processes"])
+            if value["other_cpu_percent"] is not None:
+                samples["other"] = {"cpu_percent": value["other_cpu_percent"]}
+            for metrics, prefix, entries in ((process_metrics, "process", samples),
+                                             (channel_metrics, "channel", value["channels"])):
+                for key, sample in entries.items():
+                    names = metrics.setdefault(f"{prefix}:{key}", {})
+                    for metric, metric_value in sample.items():
+                        if metric != "pid":
+                            names[metric] = None
+                            book.add(f"{prefix}:{key}.{metric}", metric_value, now)
+            return
+        if name == "latency" and value > 0:
+            book.add("latency_ms", value, now)
+        elif name == "segment" and value[0] > 0:
+            book.add("segment_ms", value[0], now)
+            book.add("segment_bytes", value[1], now)
+        elif name == "network" and value["bandwidth_usage_bps"] > 0:
+            book.add("bandwidth_bps", value["bandwidth_usage_bps"], now)
+        elif name == "live_edge":
+            for segment in value:
+                book.add("live_latency_ms", segment["latency_ms"], now)
+                book.add("edge_delay_ms", segment["edge_delay_ms"], now)
+        elif name == "system":
+            book.add("cpu_percent", value["cpu_percent"], now)
+            book.add("memory_percent", value["memory_percent"], now)
+            book.add("disk_percent", value["disk_percent"], now)
+    
+    scheduler = SamplingScheduler(sink, record_sample)
+    scheduler.add("system", intervals["system"], get_system_stats)
+    scheduler.add("network", intervals["network"], network_stats.update)
+    scheduler.add("latency", intervals["latency"], lambda: measure_latency(server))
+    scheduler.add("hls_status", intervals["hls_status"], lambda: get_hls_stats(server))
+    scheduler.add("segment", intervals["segment"], lambda: get_segment_download_time(server))
+    scheduler.add("processes", intervals["processes"], process_stats.update)
+    scheduler.add("live_edge", intervals["live_edge"], LiveEdgeLatency(f"{server}/hls/playlist.m3u8").update)
+    start = scheduler.start()
+    next_report = start
+    
+    try:
+        while next_report - start < duration:
+            next_report = min(next_report + report_interval, start + duration)
+            time.sleep(max(0, next_report - time.monotonic()))
+            current_time = datetime.now().strftime("%H:%M:%S")
+            
+            # Latest sample of each probe, plus the statistics of this report window
+            hls_stats = scheduler.latest("hls_status", {"hls_running": False})
+            system_stats = scheduler.latest("system", get_system_stats())
+            network = scheduler.latest("network", {"bandwidth_usage_bps": 0, "bytes_sent": 0, "bytes_recv": 0})
+            segment_download_time, segment_size = scheduler.latest("segment", (-1, 0))
+            latency = scheduler.latest("latency", -1)
+            window_latency = book.recent("latency_ms", report_interval)
+            window_cpu = book.recent("cpu_percent", report_interval)
+            window_live = book.recent("live_latency_ms", report_interval)
+            
+            # Combine stats
+            current_stats = {
+                "timestamp": current_time,
+                "hls_status": hls_stats,
+                "system_stats": system_stats,
+                "network_stats": {
+                    "latency_ms": latency,
+                    "segment_download_time_ms": segment_download_time,
+                    "segment_size_bytes": segment_size,
+                    "bandwidth_usage_bps": network["bandwidth_usage_bps"],
+                    "bytes_sent": network["bytes_sent"],
+                    "bytes_recv": network["bytes_recv"]
+                },
+                "window": {
+                    "seconds": report_interval,
+                    "avg_cpu_percent": window_cpu["avg"] if window_cpu["count"] else None,
+                    "latency_samples": window_latency["count"],
+                    "avg_latency_ms": window_latency["avg"] if window_latency["count"] else None,
+                    "p95_latency_ms": window_latency["p95"] if window_latency["count"] else None,
+                    "max_latency_ms": window_latency["max"] if window_latency["count"] else None,
+                    "live_segments": window_live["count"],
+                    "avg_live_latency_ms": window_live["avg"] if window_live["count"] else None,
+                    "max_live_latency_ms": window_live["max"] if window_live["count"] else None,
+                }
             }
-        }
-        
-        stats.append(current_stats)
-        
-        # Print current stats
-        print(f"\nTime: {current_time}")
-        print(f"HLS Status: {'Running' if hls_stats['hls_running'] else 'Stopped'}")
-        print(f"System Performance:")
-        print(f"  CPU Usage: {system_stats['cpu_percent']}%")
-        print(f"  Memory Usage: {system_stats['memory_percent']}%")
-        print(f"  Disk Usage: {system_stats['disk_percent']}%")
-        print(f"Network Performance:")
-        print(f"  Current Bandwidth Usage: {format_bytes(network_stats.bandwidth_usage)}/s")
-        print(f"  Server Latency: {latency:.2f} ms")
-        print(f"  Segment Download Time: {segment_download_time:.2f} ms")
-        print(f"  Segment Size: {format_bytes(segment_size)}")
-        print(f"  Total Data Sent: {format_bytes(network_stats.bytes_sent)}")
-        print(f"  Total Data Received: {format_bytes(network_stats.bytes_recv)}")
-        
-        # Calculate and print statistics if we have enough data
-        if len(latencies) > 0:
-            print(f"Statistics:")
-            print(f"  Avg Latency: {np.mean(latencies):.2f} ms")
-            print(f"  Min Latency: {np.min(latencies):.2f} ms")
-            print(f"  Max Latency: {np.max(latencies):.2f} ms")
-            if len(bandwidths) > 0:
-                avg_bandwidth = np.mean(bandwidths)
-                print(f"  Avg Bandwidth: {format_bytes(avg_bandwidth)}/s")
-                if len(segment_sizes) > 0:
-                    print(f"  Estimated CDN Usage: {format_bytes(total_cdn_bytes)}")
-        
-        print("-" * 70)
-        
-        time.sleep(5)  # Check every 5 seconds
+            
+            sink.write({"probe": "report", **current_stats})
+            
+            # Print current stats
+            print(f"\nTime: {current_time}")
+            print(f"HLS Status: {'Running' if hls_stats.get('hls_running') else 'Stopped'}")
+            print(f"System Performance:")
+            print(f"  CPU Usage: {system_stats['cpu_percent']}%"
+                  + (f" (avg {window_cpu['avg']:.1f}% over {window_cpu['count']} samples)" if window_cpu["count"] else ""))
+            print(f"  Memory Usage: {system_stats['memory_percent']}%")
+            print(f"  Disk Usage: {system_stats['disk_percent']}%")
+            print(f"Network Performance:")
+            print(f"  Current Bandwidth Usage: {format_bytes(network['bandwidth_usage_bps'])}/s")
+            print(f"  Server Latency: {latency:.2f} ms"
+                  + (f" (avg {window_latency['avg']:.2f} ms, p95 {window_latency['p95']:.2f} ms "
+                     f"over {window_latency['count']} samples)" if window_latency["count"] else ""))
+            print(f"  Segment Download Time: {segment_download_time:.2f} ms")
+            if window_live["count"]:
+                print(f"  Live Latency (capture to arrival): avg {window_live['avg']:.0f} ms, "
+                      f"max {window_live['max']:.0f} ms over {window_live['count']} segments")
+            print(f"  Segment Size: {format_bytes(segment_size)}")
+            print(f"  Total Data Sent: {format_bytes(network['bytes_sent'])}")
+            print(f"  Total Data Received: {format_bytes(network['bytes_recv'])}")
+            
+            # Per-process and per-channel breakdown over this report window
+            pids = {key: sample["pid"] for key, sample in scheduler.latest("processes", {"processes": {}})["processes"].items()}
+            window_processes = process_breakdown(book, process_metrics, report_interval)
+            window_channels = process_breakdown(book, channel_metrics, report_interval)
+            if window_processes:
+                print(f"Processes:")
+                for key, stats in window_processes.items():
+                    print(f"  {format_process_line(key, stats, pids.get(key.split(':', 1)[1]))}")
+            if window_channels:
+                print(f"Channels:")
+                for key, stats in window_channels.items():
+                    print(f"  {format_channel_line(key, stats)}")
+            
+            # Whole-run statistics, updated online as the samples arrive
+            latencies = book.summary("latency_ms")
+            if latencies["count"] > 0:
+                bandwidths = book.summary("bandwidth_bps")
+                recent = book.recent("latency_ms")
+                print(f"Statistics:")
+                print(f"  Avg Latency: {latencies['avg']:.2f} ms")
+                print(f"  Min Latency: {latencies['min']:.2f} ms")
+                print(f"  Max Latency: {latencies['max']:.2f} ms")
+                print(f"  Latency p50/p95/p99: {latencies['p50']:.2f} / {latencies['p95']:.2f} / {latencies['p99']:.2f} ms"
+                      f" (last {book.window:.0f}s: {recent['p50']:.2f} / {recent['p95']:.2f} / {recent['p99']:.2f} ms)")
+                if bandwidths["count"] > 0:
+                    print(f"  Avg Bandwidth: {format_bytes(bandwidths['avg'])}/s")
+            live = book.summary("live_latency_ms")
+            if live["count"] > 0:
+                print(f"  Live Latency p50/p95/p99: {live['p50']:.0f} / {live['p95']:.0f} / {live['p99']:.0f} ms")
+            
+            print("-" * 70)
+    finally:
+        scheduler.stop()
+        sink.close()
+    
+    latencies = book.summary("latency_ms")
+    segment_times = book.summary("segment_ms")
+    bandwidths = book.summary("bandwidth_bps")
+    live = book.summary("live_latency_ms")
+    edge = book.summary("edge_delay_ms")
+    skipped = {name: count for name, count in scheduler.skipped.items() if count}
+    if skipped:
+        print(f"\nSkipped sampling ticks (probe slower than its interval): {skipped}")
     
-    # Save stats to file
-    with open('hls_performance_stats.json', 'w') as f:
-        json.dump(stats, f, indent=4)
+    # Save the report snapshots of this run in the original single-file format
+    export_stats_json(sink.directory, 'hls_performance_stats.json')
     
     # Create summary for performance report
     summary = {
-        "avg_cpu": np.mean(cpu_usages) if cpu_usages else 0,
-        "avg_memory": np.mean(memory_usages) if memory_usages else 0,
-        "avg_disk": np.mean(disk_usages) if disk_usages else 0,
-        "avg_bandwidth": np.mean(bandwidths) if bandwidths else 0,
-        "avg_latency": np.mean(latencies) if latencies else 0,
-        "min_latency": np.min(latencies) if latencies else 0,
-        "max_latency": np.max(latencies) if latencies else 0,
-        "std_latency": np.std(latencies) if latencies else 0,
-        "avg_segment_time": np.mean(segment_times) if segment_times else 0,
-        "min_segment_time": np.min(segment_times) if segment_times else 0,
-        "max_segment_time": np.max(segment_times) if segment_times else 0,
-        "std_segment_time": np.std(segment_times) if segment_times else 0,
-        "total_cdn_bytes": total_cdn_bytes,
+        "avg_cpu": book.summary("cpu_percent")["avg"],
+        "avg_memory": book.summary("memory_percent")["avg"],
+        "avg_disk": book.summary("disk_percent")["avg"],
+        "avg_bandwidth": bandwidths["avg"],
+        "avg_latency": latencies["avg"],
+        "min_latency": latencies["min"],
+        "max_latency": latencies["max"],
+        "std_latency": latencies["std"],
+        "p50_latency": latencies["p50"],
+        "p95_latency": latencies["p95"],
+        "p99_latency": latencies["p99"],
+        "avg_segment_time": segment_times["avg"],
+        "min_segment_time": segment_times["min"],
+        "max_segment_time": segment_times["max"],
+        "std_segment_time": segment_times["std"],
+        "p50_segment_time": segment_times["p50"],
+        "p95_segment_time": segment_times["p95"],
+        "p99_segment_time": segment_times["p99"],
+        "live_segments": live["count"],
+        "avg_live_latency": live["avg"],
+        "p50_live_latency": live["p50"],
+        "p95_live_latency": live["p95"],
+        "p99_live_latency": live["p99"],
+        "max_live_latency": live["max"],
+        "avg_edge_delay": edge["avg"],
+        "p95_edge_delay": edge["p95"],
+        "total_cdn_bytes": book.summary("segment_bytes")["total"],
         "last_bytes_sent": network_stats.bytes_sent,
-        "last_bytes_recv": network_stats.bytes_recv
+        "last_bytes_recv": network_stats.bytes_recv,
+        "window_seconds": book.window,
+        "window": {name: book.recent(name) for name in ("latency_ms", "segment_ms", "bandwidth_bps", "cpu_percent",
+                                                        "live_latency_ms")},
+        "processes": process_breakdown(book, process_metrics),
+        "channels": process_breakdown(book, channel_metrics),
     }
     
     # Print final statistics
     print("\nFinal Statistics:")
     
-    if len(latencies) > 0:
+    if latencies["count"] > 0:
         print(f"Latency (ms):")
-        print(f"  Average: {np.mean(latencies):.2f}")
-        print(f"  Minimum: {np.min(latencies):.2f}")
-        print(f"  Maximum: {np.max(latencies):.2f}")
-        print(f"  Standard Deviation: {np.std(latencies):.2f}")
+        print(f"  Average: {latencies['avg']:.2f}")
+        print(f"  Minimum: {latencies['min']:.2f}")
+        print(f"  Maximum: {latencies['max']:.2f}")
+        print(f"  Standard Deviation: {latencies['std']:.2f}")
+        print(f"  p50 / p95 / p99: {latencies['p50']:.2f} / {latencies['p95']:.2f} / {latencies['p99']:.2f}")
     
-    if len(segment_times) > 0:
+    if segment_times["count"] > 0:
         print(f"\nSegment Download Time (ms):")
-        print(f"  Average: {np.mean(segment_times):.2f}")
-        print(f"  Minimum: {np.min(segment_times):.2f}")
-        print(f"  Maximum: {np.max(segment_times):.2f}")
-        print(f"  Standard Deviation: {np.std(segment_times):.2f}")
+        print(f"  Average: {segment_times['avg']:.2f}")
+        print(f"  Minimum: {segment_times['min']:.2f}")
+        print(f"  Maximum: {segment_times['max']:.2f}")
+        print(f"  Standard Deviation: {segment_times['std']:.2f}")
+        print(f"  p50 / p95 / p99: {segment_times['p50']:.2f} / {segment_times['p95']:.2f} / {segment_times['p99']:.2f}")
     
-    if len(bandwidths) > 0:
+    if live["count"] > 0:
+        print(f"\nHLS Live Latency, capture to arrival (ms, {live['count']} segments):")
+        print(f"  Average: {live['avg']:.0f}")
+        print(f"  p50 / p95 / p99: {live['p50']:.0f} / {live['p95']:.0f} / {live['p99']:.0f}")
+        print(f"  Maximum: {live['max']:.0f}")
+        print(f"  Edge delay after the segment's last frame: avg {edge['avg']:.0f}, p95 {edge['p95']:.0f}")
+    
+    if bandwidths["count"] > 0:
         print(f"\nBandwidth Usage (bytes/s):")
-        print(f"  Average: {format_bytes(np.mean(bandwidths))}/s")
-        print(f"  Minimum: {format_bytes(np.min(bandwidths))}/s")
-        print(f"  Maximum: {format_bytes(np.max(bandwidths))}/s")
-        print(f"  Standard Deviation: {format_bytes(np.std(bandwidths))}/s")
+        print(f"  Average: {format_bytes(bandwidths['avg'])}/s")
+        print(f"  Minimum: {format_bytes(bandwidths['min'])}/s")
+        print(f"  Maximum: {format_bytes(bandwidths['max'])}/s")
+        print(f"  Standard Deviation: {format_bytes(bandwidths['std'])}/s")
     
     print(f"\nData Transfer:")
     print(f"  Total Data Sent: {format_bytes(network_stats.bytes_sent)}")
     print(f"  Total Data Received: {format_bytes(network_stats.bytes_recv)}")
-    print(f"  Estimated CDN Data: {format_bytes(total_cdn_bytes)}")
+    print(f"  Estimated CDN Data: {format_bytes(summary['total_cdn_bytes'])}")
+    
+    if summary["processes"]:
+        print(f"\nPer-Process Resources (CPU in % of one core):")
+        for key, stats in summary["processes"].items():
+            print(f"  {format_process_line(key, stats)}")
+    if summary["channels"]:
+        print(f"\nPer-Channel Traffic:")
+        for key, stats in summary["channels"].items():
+            print(f"  {format_channel_line(key, stats)}")
     
     # Save performance report
-    save_performance_report(stats, duration, summary)
+    save_performance_report(sink.directory, duration, summary)
     
-    print("\nMonitoring completed. Detailed stats saved to hls_performance_stats.json")
-    return stats
+    print(f"\nMonitoring completed. Detailed stats saved to hls_performance_stats.json, all samples in {sink.directory}/")
+    return sink.directory
+
+# Viewer load mode (--load)
+LOAD_START_SEGMENTS = 3          # A new viewer starts this many segments behind the live edge (HLS spec)
+LOAD_JOIN_SPREAD = 5.0           # Seconds over which the viewers of one level join
+LOAD_PLAYLIST_TIMEOUT = 10.0     # Request timeout (seconds) before a viewer counts an error
+
+def parse_media_playlist(text):
+    """Media sequence, target duration and [(uri, duration, program date time)] of an HLS media playlist
+
+    The program date time is the Unix capture time from EXT-X-PROGRAM-DATE-TIME, or None.
+    """
+    sequence, target, segments, duration, captured = 0, 0.0, [], None, None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            sequence = int(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-TARGETDURATION:"):
+            target = float(line.split(":", 1)[1])
+        elif line.startswith("#EXTINF:"):
+            duration = float(line.split(":", 1)[1].split(",")[0])
+        elif line.startswith("#EXT-X-PROGRAM-DATE-TIME:"):
+            captured = parse_program_date_time(line.split(":", 1)[1])
+        elif line and not line.startswith("#"):
+            segments.append((line, duration if duration is not None else target, captured))
+            duration = captured = None
+    return sequence, target, segments
+
+class PlaybackBuffer:
+    """Buffer of a simulated player: drains in real time once playing and records stalls"""
+
+    def __init__(self, start_time):
+        self.start_time = start_time
+        self.level = 0.0
+        self.updated = start_time
+        self.playing_since = None
+        self.stalled_since = None
+        self.stalls = []
+
+    def advance(self, now):
+        if self.playing_since is not None and self.stalled_since is None:
+            self.level -= now - self.updated
+            if self.level < 0:
+                # Buffer ran dry before now: the stall started when it hit zero
+                self.stalled_since = now + self.level
+                self.level = 0.0
+        self.updated = now
+
+    def add(self, now, seconds):
+        self.advance(now)
+        self.level += seconds
+        if self.playing_since is None:
+            self.playing_since = now
+        elif self.stalled_since is not None:
+            self.stalls.append(now - self.stalled_since)
+            self.stalled_since = None
+
+    def stalled_time(self, now):
+        self.advance(now)
+        return sum(self.stalls) + (now - self.stalled_since if self.stalled_since is not None else 0.0)
+
+async def load_viewer(base_url, playlist_path, join_delay, deadline, results):
+    """One simulated viewer: join live, fetch segments in order at playback pace on one keep-alive connection"""
+    await asyncio.sleep(join_delay)
+    parsed = urlparse(base_url)
+    connection = AsyncHTTPConnection(parsed.hostname, parsed.port or 80)
+    start = time.monotonic()
+    buffer = PlaybackBuffer(start)
+    next_sequence = None
+    ended_at = float("inf")
+    directory = playlist_path.rsplit("/", 1)[0]
+
+    async def get(path, kind):
+        request_start = time.monotonic()
+        try:
+            status, _, body = await asyncio.wait_for(connection.request(path), LOAD_PLAYLIST_TIMEOUT)
+        except (ConnectionError, OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            results["errors"] += 1
+            await connection.close()
+            return None
+        results["requests"] += 1
+        results[kind].append((time.monotonic() - request_start) * 1000)
+        if status != 200:
+            results["errors"] += 1
+            return None
+        results["bytes"] += len(body)
+        return body
+
+    try:
+        while time.monotonic() < deadline:
+            body = await get(playlist_path, "playlist")
+            if body is None:
+                await asyncio.sleep(0.5)
+                continue
+            text = body.decode("utf-8", "replace")
+            if "#EXT-X-STREAM-INF" in text:
+                # Master playlist: follow the first variant
+                playlist_path = f"{directory}/{segment_uris(text)[0]}"
+                directory = playlist_path.rsplit("/", 1)[0]
+                continue
+            sequence, target, segments = parse_media_playlist(text)
+            if not segments:
+                await asyncio.sleep(0.5)
+                continue
+            if next_sequence is None:
+                next_sequence = sequence + max(0, len(segments) - LOAD_START_SEGMENTS)
+            elif next_sequence < sequence:
+                # Fell out of the live window: skip to the oldest segment still listed
+                results["skips"] += 1
+                next_sequence = sequence
+            fetched = False
+            for number, (uri, duration, captured) in enumerate(segments, start=sequence):
+                if number < next_sequence or time.monotonic() >= deadline:
+                    continue
+                data = await get(f"{directory}/{uri}", "segment")
+                if data is None:
+                    break
+                now = time.monotonic()
+                if buffer.playing_since is None:
+                    results["startup"].append(now - start)
+                buffer.add(now, duration)
+                if captured is not None:
+                    # Screen latency: the segment starts playing once the buffered media before it has played
+                    results["live_latency"].append((time.time() + buffer.level - duration - captured) * 1000)
+                next_sequence = number + 1
+                fetched = True
+            if "#EXT-X-ENDLIST" in text and next_sequence >= sequence + len(segments):
+                # Stream ended: playback stops when the buffer runs out, which is not a stall
+                buffer.advance(time.monotonic())
+                ended_at = buffer.updated + buffer.level
+                break
+            # Reload after one target duration, or half of it if the playlist had nothing new
+            await asyncio.sleep(target if fetched else target / 2)
+    finally:
+        await connection.close()
+        now = min(time.monotonic(), deadline, ended_at)
+        if buffer.playing_since is None:
+            results["never_started"] += 1
+        else:
+            stalled = buffer.stalled_time(now)
+            results["stalls"] += len(buffer.stalls) + (1 if buffer.stalled_since is not None else 0)
+            results["stalled_seconds"] += stalled
+            results["watch_seconds"] += now - buffer.playing_since
+
+async def run_load_level(base_url, playlist_path, viewers, duration):
+    """Run `viewers` concurrent viewers for `duration` seconds, joining over LOAD_JOIN_SPREAD seconds"""
+    results = {"playlist": [], "segment": [], "startup": [], "live_latency": [], "requests": 0, "errors": 0, "bytes": 0,
+               "stalls": 0, "stalled_seconds": 0.0, "watch_seconds": 0.0, "skips": 0, "never_started": 0}
+    spread = min(LOAD_JOIN_SPREAD, duration / 4)
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*(load_viewer(base_url, playlist_path, spread * i / viewers, deadline, results)
+                           for i in range(viewers)))
+    return results
+
+def summarize_load_level(viewers, duration, results):
+    startup_ms = [s * 1000 for s in results["startup"]]
+    return {
+        "viewers": viewers,
+        "duration_s": duration,
+        "requests": results["requests"],
+        "errors": results["errors"],
+        "error_rate": results["errors"] / max(results["requests"] + results["errors"], 1),
+        "throughput_mbps": results["bytes"] * 8 / duration / 1e6,
+        "startup": latency_summary(startup_ms),
+        "never_started": results["never_started"],
+        "segment_latency": latency_summary(results["segment"]),
+        "playlist_latency": latency_summary(results["playlist"]),
+        "live_latency": latency_summary(results["live_latency"]),
+        "stalls": results["stalls"],
+        "rebuffer_ratio": results["stalled_seconds"] / results["watch_seconds"] if results["watch_seconds"] else 0.0,
+        "live_window_skips": results["skips"],
+    }
+
+def check_load_slo(level, slo):
+    """List of SLO violations for one load level (empty when the level passes)"""
+    violations = []
+    if level["startup"]["p90_ms"] > slo["startup_p90_ms"]:
+        violations.append(f"startup p90 {level['startup']['p90_ms']:.0f} ms > {slo['startup_p90_ms']:.0f} ms")
+    if level["segment_latency"]["p99_ms"] > slo["segment_p99_ms"]:
+        violations.append(f"segment p99 {level['segment_latency']['p99_ms']:.0f} ms > {slo['segment_p99_ms']:.0f} ms")
+    if level["rebuffer_ratio"] > slo["rebuffer_ratio"]:
+        violations.append(f"rebuffer ratio {level['rebuffer_ratio']:.2%} > {slo['rebuffer_ratio']:.2%}")
+    if level["error_rate"] > slo["error_rate"]:
+        violations.append(f"error rate {level['error_rate']:.2%} > {slo['error_rate']:.2%}")
+    if level["never_started"]:
+        violations.append(f"{level['never_started']} viewers never started playback")
+    return violations
+
+def run_viewer_load(base_url, playlist_path, levels, duration, slo, output):
+    """Ramp the number of simulated viewers until an SLO breaks and report the maximum sustainable count"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < max(levels) + 256:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(max(levels) + 256, hard), hard))
+
+    print(f"Viewer load test on {base_url}{playlist_path}: levels {levels}, {duration} s each")
+    print("=" * 70)
+    report = {"date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "server": base_url,
+              "playlist": playlist_path, "slo": slo, "levels": [], "max_sustainable_viewers": 0}
+    for viewers in levels:
+        results = asyncio.run(run_load_level(base_url, playlist_path, viewers, duration))
+        level = summarize_load_level(viewers, duration, results)
+        level["slo_violations"] = check_load_slo(level, slo)
+        report["levels"].append(level)
+        print(f"{viewers:5d} viewers | startup p90 {level['startup']['p90_ms']:6.0f} ms | "
+              f"segment p50 {level['segment_latency']['p50_ms']:6.1f} ms p99 {level['segment_latency']['p99_ms']:6.1f} ms | "
+              f"stalls {level['stalls']} (rebuffer {level['rebuffer_ratio']:.2%}) | "
+              f"behind live p50 {level['live_latency']['p50_ms'] / 1000:.1f} s | "
+              f"errors {level['errors']} | {level['throughput_mbps']:.1f} Mbps")
+        if level["slo_violations"]:
+            print(f"  SLO broken: {'; '.join(level['slo_violations'])}")
+            break
+        report["max_sustainable_viewers"] = viewers
+
+    print(f"\nMaximum sustainable viewers: {report['max_sustainable_viewers']}")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Load report saved to {output}")
+    return report
+
+# Run comparison (--baseline / --candidate)
+COMPARE_METRICS = {                 # metric -> label; for all of them higher is worse
+    "latency_ms": "Server Latency (ms)",
+    "segment_ms": "Segment Download Time (ms)",
+    "cpu_percent": "CPU Usage (%)",
+    "bandwidth_bps": "Bandwidth Usage (bytes/s)",
+    "live_latency_ms": "HLS Live Latency (ms)",
+}
+COMPARE_BOOTSTRAP = 2000            # Bootstrap resamples per statistic
+COMPARE_BOOTSTRAP_CHUNK = 50        # Resamples computed per vectorized step (bounds memory)
+COMPARE_BLOCK = 10                  # Consecutive samples resampled together (samples of a run are correlated)
+COMPARE_MAX_SAMPLES = 20000         # Longer runs are thinned evenly to this many samples per metric
+COMPARE_ALPHA = 0.05                # Significance level (two-sided)
+COMPARE_TOLERANCE = 0.05            # Relative worsening below this is not a regression, even if significant
+
+def load_run_metrics(path):
+    """Samples of the compared metrics of one run: a stored run (hls_stats/run-*) or an hls_performance_stats.json"""
+    values = {name: [] for name in COMPARE_METRICS}
+    if os.path.isfile(path) and path.endswith(".json"):
+        # Report snapshots only (one per report interval)
+        with open(path) as f:
+            for report in json.load(f):
+                network = report.get("network_stats", {})
+                values["latency_ms"].append(network.get("latency_ms", -1))
+                values["segment_ms"].append(network.get("segment_download_time_ms", -1))
+                values["bandwidth_bps"].append(network.get("bandwidth_usage_bps", 0))
+                values["cpu_percent"].append(report.get("system_stats", {}).get("cpu_percent", -1))
+                values["live_latency_ms"].append(report.get("window", {}).get("avg_live_latency_ms") or -1)
+    else:
+        for record in read_stats(path, probes={"latency", "segment", "system", "network", "live_edge"}):
+            value = record["value"]
+            if record["probe"] == "latency":
+                values["latency_ms"].append(value)
+            elif record["probe"] == "segment":
+                values["segment_ms"].append(value[0])
+            elif record["probe"] == "system":
+                values["cpu_percent"].append(value["cpu_percent"])
+            elif record["probe"] == "live_edge":
+                values["live_latency_ms"].extend(segment["latency_ms"] for segment in value)
+            else:
+                values["bandwidth_bps"].append(value["bandwidth_usage_bps"])
+    result = {}
+    for name, samples in values.items():
+        samples = np.asarray(samples, dtype=float)
+        # Failed probes are stored as -1 (0 for bandwidth); an idle CPU sample of 0% is valid
+        samples = samples[samples >= 0] if name == "cpu_percent" else samples[samples > 0]
+        if len(samples) > COMPARE_MAX_SAMPLES:
+            samples = samples[np.linspace(0, len(samples) - 1, COMPARE_MAX_SAMPLES).astype(int)]
+        result[name] = samples
+    return result
+
+def pad_runs(runs):
+    """Samples of several runs as one NaN-padded (runs x samples) array, plus the length of each run"""
+    lengths = np.array([len(run) for run in runs])
+    data = np.full((len(runs), max(lengths.max(), 1)), np.nan)
+    for row, run in enumerate(runs):
+        data[row, :len(run)] = run
+    return data, lengths
+
+def bootstrap_statistics(data, lengths, rng, boots=COMPARE_BOOTSTRAP, block=COMPARE_BLOCK):
+    """Bootstrap distribution of the mean and p95 of a group of runs
+
+    Two levels, vectorized over COMPARE_BOOTSTRAP_CHUNK resamples at a time: runs are drawn with replacement
+    (run-to-run variation), then each drawn run is rebuilt from random blocks of `block` consecutive samples of
+    itself (correlation between neighbouring samples).
+    """
+    count, width = data.shape
+    block = max(1, min(block, lengths.min()))
+    blocks = -(-width // block)
+    means, p95s = [], []
+    for done in range(0, boots, COMPARE_BOOTSTRAP_CHUNK):
+        k = min(COMPARE_BOOTSTRAP_CHUNK, boots - done)
+        runs = rng.integers(0, count, size=(k, count))
+        run_lengths = lengths[runs]
+        starts = (rng.random((k, count, blocks)) * (run_lengths - block + 1)[..., None]).astype(int)
+        positions = (starts[..., None] + np.arange(block)).reshape(k, count, -1)[..., :width]
+        values = data[runs[..., None], positions]
+        # Each drawn run keeps its own number of samples
+        values = np.where(np.arange(width) < run_lengths[..., None], values, np.nan).reshape(k, -1)
+        means.append(np.nanmean(values, axis=1))
+        # p95 with linear interpolation, as np.percentile; sorting puts the NaN padding last
+        values.sort(axis=1)
+        rank = (np.sum(~np.isnan(values), axis=1) - 1) * 0.95
+        below = np.floor(rank).astype(int)
+        rows = np.arange(k)
+        lower = values[rows, below]
+        upper = values[rows, np.minimum(below + 1, values.shape[1] - 1)]
+        upper = np.where(np.isnan(upper), lower, upper)
+        p95s.append(lower + (rank - below) * (upper - lower))
+    return np.concatenate(means), np.concatenate(p95s)
+
+def compare_statistic(base, candidate, base_boot, candidate_boot, alpha, tolerance):
+    """Relative change of one statistic with its confidence interval, p-value and verdict"""
+    change = candidate / base - 1 if base else 0.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        changes = candidate_boot / base_boot - 1
+    changes = changes[np.isfinite(changes)]
+    if not len(changes):
+        return {"baseline": base, "candidate": candidate, "change": change, "ci": [change, change],
+                "p_value": 1.0, "verdict": "unchanged"}
+    low, high = np.percentile(changes, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+    # Two-sided bootstrap p-value: how often the resampled change falls on the other side of zero
+    p_value = max(2 * min(np.mean(changes <= 0), np.mean(changes >= 0)), 1 / len(changes))
+    if low > 0 and change > tolerance:
+        verdict = "regression"
+    elif high < 0 and change < -tolerance:
+        verdict = "improvement"
+    else:
+        verdict = "unchanged"
+    return {"baseline": float(base), "candidate": float(candidate), "change": float(change),
+            "ci": [float(low), float(high)], "p_value": float(min(p_value, 1.0)), "verdict": verdict}
+
+def describe_group(runs):
+    """Distribution of one metric over a group of runs (all samples pooled)"""
+    samples = np.concatenate(runs) if runs else np.array([])
+    if not len(samples):
+        return {"runs": len(runs), "count": 0}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        "runs": len(runs),
+        "count": int(len(samples)),
+        "mean": float(samples.mean()),
+        "std": float(samples.std()),
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "max": float(samples.max()),
+        "run_means": [float(run.mean()) for run in runs if len(run)],
+    }
+
+def compare_runs(baseline_paths, candidate_paths, output, alpha=COMPARE_ALPHA, tolerance=COMPARE_TOLERANCE,
+                 metrics=None, seed=0):
+    """Compare candidate runs against baseline runs; returns the report, whose "pass" is False on any regression"""
+    rng = np.random.default_rng(seed)
+    metrics = metrics or list(COMPARE_METRICS)
+    load_start = time.perf_counter()
+    baseline = [load_run_metrics(path) for path in baseline_paths]
+    candidate = [load_run_metrics(path) for path in candidate_paths]
+    print(f"Loaded {len(baseline)} baseline and {len(candidate)} candidate runs "
+          f"in {time.perf_counter() - load_start:.2f} s")
+    report = {
+        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "baseline": baseline_paths,
+        "candidate": candidate_paths,
+        "alpha": alpha,
+        "tolerance": tolerance,
+        "metrics": {},
+    }
+    for name in metrics:
+        base_runs = [run[name] for run in baseline if len(run[name])]
+        candidate_runs = [run[name] for run in candidate if len(run[name])]
+        entry = {"label": COMPARE_METRICS[name], "baseline": describe_group(base_runs),
+                 "candidate": describe_group(candidate_runs)}
+        if base_runs and candidate_runs:
+            base_means, base_p95s = bootstrap_statistics(*pad_runs(base_runs), rng)
+            candidate_means, candidate_p95s = bootstrap_statistics(*pad_runs(candidate_runs), rng)
+            entry["mean"] = compare_statistic(entry["baseline"]["mean"], entry["candidate"]["mean"],
+                                              base_means, candidate_means, alpha, tolerance)
+            entry["p95"] = compare_statistic(entry["baseline"]["p95"], entry["candidate"]["p95"],
+                                             base_p95s, candidate_p95s, alpha, tolerance)
+            verdicts = {entry["mean"]["verdict"], entry["p95"]["verdict"]}
+            entry["verdict"] = "regression" if "regression" in verdicts else \
+                "improvement" if "improvement" in verdicts else "unchanged"
+        else:
+            entry["verdict"] = "no data"
+        report["metrics"][name] = entry
+    regressions = [name for name, entry in report["metrics"].items() if entry["verdict"] == "regression"]
+    report["regressions"] = regressions
+    report["pass"] = not regressions
+    
+    with open(output, "w") as f:
+        json.dump(report, f, indent=4)
+    text_output = os.path.splitext(output)[0] + ".txt"
+    with open(text_output, "w") as f:
+        f.write(format_comparison(report))
+    print(format_comparison(report), end="")
+    print(f"Comparison report saved to {output} and {text_output}")
+    return report
+
+def format_comparison(report):
+    """Text form of a comparison report"""
+    lines = ["=== PERFORMANCE COMPARISON ===",
+             f"Date: {report['date']}",
+             f"Baseline runs: {len(report['baseline'])}, candidate runs: {len(report['candidate'])}",
+             f"Confidence: {100 * (1 - report['alpha']):.0f}%, tolerance: {100 * report['tolerance']:.0f}%", ""]
+    for entry in report["metrics"].values():
+        lines.append(f"{entry['label']}: {entry['verdict'].upper()}")
+        for side in ("baseline", "candidate"):
+            group = entry[side]
+            if group["count"]:
+                lines.append(f"  {side.capitalize():9} {group['runs']} runs, {group['count']} samples: mean {group['mean']:.2f}, "
+                             f"p50 {group['p50']:.2f}, p95 {group['p95']:.2f}, p99 {group['p99']:.2f}")
+        for statistic in ("mean", "p95"):
+            if statistic in entry:
+                result = entry[statistic]
+                lines.append(f"  {statistic:4} change {100 * result['change']:+.1f}% "
+                             f"(CI {100 * result['ci'][0]:+.1f}% .. {100 * result['ci'][1]:+.1f}%, p={result['p_value']:.3f})")
+        lines.append("")
+    if report["pass"]:
+        lines.append("RESULT: PASS - no significant regression")
+    else:
+        lines.append(f"RESULT: FAIL - significant regression in {', '.join(report['regressions'])}")
+    return "\n".join(lines) + "\n"
 
 if __name__ == "__main__":
-    # Start monitoring
-    monitor_hls_performance() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="HLS performance checker")
+    parser.add_argument("--duration", type=int, default=120, help="monitoring time in seconds")
+    parser.add_argument("--probe", action="append", default=[], metavar="NAME=SECONDS",
+                        help=f"sampling interval of one probe ({', '.join(PROBE_INTERVALS)}); repeatable")
+    parser.add_argument("--report-interval", type=float, default=REPORT_INTERVAL, help="seconds between reports")
+    parser.add_argument("--stats-dir", default=STATS_DIR, help="directory for the streamed samples (one run-* per run)")
+    parser.add_argument("--rotate-mb", type=float, default=STATS_ROTATE_BYTES / 1024 / 1024,
+                        help="start a new stats file at this size")
+    parser.add_argument("--rotate-minutes", type=float, default=STATS_ROTATE_SECONDS / 60,
+                        help="start a new stats file after this time")
+    parser.add_argument("--read", metavar="PATH",
+                        help="print the records of a stored run (directory or file) as JSON Lines and exit")
+    parser.add_argument("--since", help="with --read: first time, 'YYYY-MM-DD HH:MM:SS' or Unix seconds")
+    parser.add_argument("--until", help="with --read: end time (exclusive)")
+    parser.add_argument("--only", nargs="+", metavar="PROBE", help="with --read: only these probes (or 'report')")
+    parser.add_argument("--load", action="store_true",
+                        help="simulate concurrent viewers and ramp their number until an SLO breaks")
+    parser.add_argument("--server", default=SERVER_URL, help="streaming server to monitor or load")
+    parser.add_argument("--cdn-url", default=CDN_URL, help="source whose size and latency are checked at startup")
+    parser.add_argument("--playlist", default="/hls/playlist.m3u8", help="playlist path (media or master)")
+    parser.add_argument("--viewers", type=int, nargs="+", default=[10, 25, 50, 100, 200, 400, 800, 1600],
+                        help="viewer counts of the ramp")
+    parser.add_argument("--level-duration", type=int, default=60, help="seconds per viewer count")
+    parser.add_argument("--slo-startup-ms", type=float, default=5000, help="max startup time p90")
+    parser.add_argument("--slo-segment-ms", type=float, default=2000, help="max segment fetch latency p99")
+    parser.add_argument("--slo-rebuffer", type=float, default=0.01, help="max stalled/watched time ratio")
+    parser.add_argument("--slo-errors", type=float, default=0.01, help="max failed request ratio")
+    parser.add_argument("--baseline", nargs="+", metavar="RUN",
+                        help="compare stored runs (hls_stats/run-* or hls_performance_stats.json) against --candidate; "
+                             "exits with status 1 on a significant regression")
+    parser.add_argument("--candidate", nargs="+", metavar="RUN", help="runs to check against --baseline")
+    parser.add_argument("--metrics", nargs="+", choices=list(COMPARE_METRICS), help="with --baseline: metrics to compare")
+    parser.add_argument("--alpha", type=float, default=COMPARE_ALPHA, help="significance level of the comparison")
+    parser.add_argument("--tolerance", type=float, default=COMPARE_TOLERANCE,
+                        help="relative worsening that is accepted even when significant")
+    parser.add_argument("--seed", type=int, default=0, help="bootstrap random seed")
+    parser.add_argument("--output", help="report file (default hls_load_report.json, or "
+                                         "performance_comparison.json with --baseline)")
+    args = parser.parse_args()
+
+    def parse_time(value):
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return time.mktime(datetime.strptime(value, "%Y-%m-%d %H:%M:%S").timetuple())
+
+    if args.read:
+        read_start = time.perf_counter()
+        count = 0
+        first = last = None
+        for record in read_stats(args.read, parse_time(args.since), parse_time(args.until),
+                                 set(args.only) if args.only else None):
+            sys.stdout.write(json.dumps(record, separators=(",", ":")) + "\n")
+            first = record["t"] if first is None else first
+            last = record["t"]
+            count += 1
+        span = f", {datetime.fromtimestamp(first)} to {datetime.fromtimestamp(last)}" if count else ""
+        print(f"{count} records{span} (read in {time.perf_counter() - read_start:.2f} s)", file=sys.stderr)
+    elif args.baseline:
+        if not args.candidate:
+            parser.error("--baseline needs --candidate")
+        report = compare_runs(args.baseline, args.candidate, args.output or "performance_comparison.json",
+                              args.alpha, args.tolerance, args.metrics, args.seed)
+        sys.exit(0 if report["pass"] else 1)
+    elif args.load:
+        run_viewer_load(args.server, args.playlist, sorted(args.viewers), args.level_duration, {
+            "startup_p90_ms": args.slo_startup_ms,
+            "segment_p99_ms": args.slo_segment_ms,
+            "rebuffer_ratio": args.slo_rebuffer,
+            "error_rate": args.slo_errors,
+        }, args.output or "hls_load_report.json")
+    else:
+        intervals = {}
+        for value in args.probe:
+            name, _, seconds = value.partition("=")
+            if name not in PROBE_INTERVALS or not seconds:
+                parser.error(f"--probe expects NAME=SECONDS with NAME in {', '.join(PROBE_INTERVALS)}")
+            intervals[name] = float(seconds)
+        # Start monitoring
+        monitor_hls_performance(args.duration, args.cdn_url, args.server, intervals=intervals,
+                                report_interval=args.report_interval, stats_dir=args.stats_dir, rotate_bytes=int(args.rotate_mb * 1024 * 1024),
+                                rotate_seconds=args.rotate_minutes * 60)
@@ -1,16 +1,37 @@
 #!/usr/bin/env python3
 import subprocess
-from flask import Flask, request, jsonify, send_from_directory
+import ctypes
+import errno
+from flask import Flask, request, jsonify, send_from_directory, abort, Response
 import sys
 import os
+import argparse
+import atexit
+import signal
 import socket
 import shutil
+import tempfile
+import re
+import select
+import struct
+import threading
+import time
+import math
+import json
+import hashlib
+import urllib.parse
+import urllib.request
+import urllib.error
+import bisect
+import queue
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 app = Flask(__name__)
 
-# Biến toàn cục lưu FFmpeg process
-ffmpeg_process = None
-hls_process = None
+# Danh sách kênh đang quản lý: channel_id -> Channel
+channels = {}
+channels_lock = threading.Lock()
 
 # Thông số mặc định (thay đổi theo nhu cầu)
 DEFAULT_CDN_URL = "http://34.120.70.159/152407-802753527_small.mp4"  # URL video từ CDN
@@ -19,12 +40,132 @@ DEFAULT_PORT = "1234"                          # Cổng phát
 DEFAULT_TTL = "2"                             # TTL=2 để có thể đi qua router nội bộ
 HLS_SEGMENT_TIME = "2"                         # Độ dài mỗi segment HLS (giây)
 HLS_OUTPUT_DIR = "hls_output"                  # Thư mục chứa file HLS
+HLS_LIST_SIZE = "5"                            # Số segment trong playlist
+HLS_STORAGE = "memory"                         # "memory": giữ segment trong RAM, "disk": ghi vào HLS_OUTPUT_DIR
+HLS_STORAGE_MODES = ("memory", "disk")
+HLS_MEMORY_SEGMENTS = 10                       # Số segment tối đa giữ trong RAM cho mỗi playlist
+HLS_MODES = ("standard", "ll")                 # "ll": Low-Latency HLS (partial segment + blocking reload)
+DEFAULT_HLS_MODE = "standard"
+HLS_PART_TIME = "0.5"                          # Độ dài partial segment LL-HLS (bội số khoảng keyframe 0.5 giây)
+HLS_LL_INGEST_LIST_SIZE = "10"                 # Số part trong playlist nội bộ FFmpeg gửi lên ở chế độ LL
+HLS_LL_PART_SEGMENTS = 3                       # Liệt kê part cho 3 segment gần nhất (theo khuyến nghị LL-HLS)
+HLS_LL_WAIT_PARTS = 3                          # Blocking reload/preload hint chờ tối đa 3 part (= PART-HOLD-BACK)
+HLS_LL_MAX_WAITERS = 32                        # Request LL-HLS đang chờ cùng lúc (mỗi request giữ một luồng waitress,
+                                               # để lại nửa SERVER_THREADS); quá mức thì trả ngay bản hiện có
+LL_INGEST_PLAYLIST = "parts.m3u8"              # Playlist nội bộ của FFmpeg ở chế độ LL (không phục vụ cho client)
+# Các rendition ABR có thể chọn (tham số ladder=1080p,720p,480p,audio); height None = chỉ có audio
+HLS_RENDITIONS = {
+    "1080p": {"height": 1080, "video_bitrate": "5000k", "maxrate": "5350k", "bufsize": "7500k", "audio_bitrate": "128k"},
+    "720p": {"height": 720, "video_bitrate": "2800k", "maxrate": "2996k", "bufsize": "4200k", "audio_bitrate": "128k"},
+    "480p": {"height": 480, "video_bitrate": "1200k", "maxrate": "1284k", "bufsize": "1800k", "audio_bitrate": "96k"},
+    "360p": {"height": 360, "video_bitrate": "800k", "maxrate": "856k", "bufsize": "1200k", "audio_bitrate": "96k"},
+    "audio": {"height": None, "audio_bitrate": "64k"},
+}
+DEFAULT_HLS_LADDER = ""                        # Rỗng: một rendition 800k như trước, không có master playlist
+HLS_LADDER_PRESET = "veryfast"                 # Preset x264 cho ladder (nhiều lần encode trong một tiến trình)
+DEFAULT_PIPELINE = "separate"                  # "separate": 2 tiến trình FFmpeg, "shared": 1 lần decode/encode cho cả 2 đầu ra
+PIPELINE_MODES = ("separate", "shared")
+DEFAULT_CHANNEL_ID = "default"                 # Kênh dùng cho các route cũ /start, /stop, /status
+CHANNEL_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+PASSTHROUGH_MODES = ("auto", "off")            # "auto": remux không encode nếu nguồn tương thích
+DEFAULT_PASSTHROUGH = "auto"
+PASSTHROUGH_VIDEO_PROFILES = ("Baseline", "Constrained Baseline", "Main")
+PASSTHROUGH_MULTICAST_MAX_GOP = 2.0            # Khoảng keyframe tối đa (giây) để client multicast vào kênh nhanh
+PROBE_SECONDS = 10                             # Chỉ đọc 10 giây đầu của nguồn để đo khoảng keyframe
+PROBE_TIMEOUT = 20
+MULTICAST_FEC_OFF = "off"                      # fec=LxD: FEC hàng/cột SMPTE 2022-1 (Pro-MPEG), media chuyển sang RTP
+DEFAULT_MULTICAST_FEC = MULTICAST_FEC_OFF
+MULTICAST_FEC_LIMITS = (4, 20)                 # Giới hạn L (số cột) và D (số hàng) của FFmpeg prompeg
+MULTICAST_FEC_MAX_MATRIX = 100                 # SMPTE 2022-1: L x D tối đa 100 gói media mỗi ma trận
+FEC_COLUMN_PORT_OFFSET = 2                     # FEC cột ở cổng media + 2, FEC hàng ở cổng media + 4
+FEC_ROW_PORT_OFFSET = 4
+RTP_PACKET_SIZE = 1328                         # 12 byte header RTP + 7 gói TS
+MULTICAST_SENDERS = ("ffmpeg", "paced")        # "paced": phát file TS đã encode sẵn bằng Python, không encode lại mỗi vòng
+DEFAULT_MULTICAST_SENDER = "ffmpeg"
+PACED_TS_DIR = "ts_cache"                      # Bản encode TS một lần của nguồn không phải .ts
+PACED_BATCH = 64                               # Số datagram tối đa mỗi lời gọi sendmmsg
+PACED_SLACK = 0.001                            # Gửi sớm tối đa 1 ms để gom datagram thành batch
+PACED_SNDBUF = 4 * 1024 * 1024
+PACED_LATENESS_SAMPLES = 10000
+PACED_CHUNK_DATAGRAMS = 4096                   # Đọc file TS theo khối 4096 datagram (~5,4 MB), không giữ cả file trong RAM
+PACED_READ_AHEAD = 2                           # Số khối được chuẩn bị sẵn (đọc, lịch gửi, đánh dấu) trước khi tới lượt phát
+CHANNEL_STARTUP_TIMEOUT = 30                  # Giây chờ gói UDP và segment HLS đầu tiên trước khi coi là degraded
+ENCODER_TELEMETRY_HISTORY = 120               # Số mẫu tiến độ encode giữ lại cho mỗi tiến trình (~60 giây)
+CHANNEL_STDERR_LINES = 20                      # Số dòng stderr cuối của FFmpeg giữ lại để báo lỗi
+SERVER_HOST = "0.0.0.0"
+SERVER_PORT = 3000
+SERVER_THREADS = 64                            # Số luồng xử lý request (waitress)
+SERVER_CONNECTION_LIMIT = 4096                 # Số kết nối đồng thời tối đa (waitress)
+SOURCE_CACHE_ENABLED = True                    # Cache file nguồn CDN trên đĩa
+SOURCE_CACHE_DIR = "source_cache"              # Thư mục cache
+SOURCE_CACHE_MAX_BYTES = 10 * 1024 ** 3        # Dung lượng cache tối đa (LRU)
+SOURCE_CACHE_REVALIDATE = 300                  # Kiểm tra lại ETag/Last-Modified sau mỗi 300 giây
+SOURCE_CACHE_PORT = 0                          # Cổng HTTP nội bộ cho FFmpeg đọc cache (0 = tự chọn)
+SOURCE_CACHE_CHUNK = 256 * 1024
+SOURCE_CACHE_READAHEAD = 8 * 1024 * 1024       # Reader nằm trong khoảng này sau luồng tải thì chờ thay vì tải riêng
+SCHEDULER_ENABLED = True                       # Kiểm soát tải CPU: ước lượng chi phí kênh, gán core, từ chối/xếp hàng
+SCHEDULER_CPU_TARGET = 0.85                    # Chỉ dùng 85% số core cho encoder, phần còn lại cho server/OS và dao động tải
+SCHEDULER_MIN_SPEED = 0.97                     # Encoder -re dao động quanh 1.0x; thấp hơn mức này là không theo kịp realtime
+SCHEDULER_SPEED_SAMPLES = 10                   # Số mẫu -progress gần nhất (~5 giây) để tính speed hiện tại
+SCHEDULER_INTERVAL = 2.0                       # Giây giữa hai lần đo CPU/speed và xét hàng đợi
+SCHEDULER_WARMUP = 10.0                        # Bỏ qua số đo trong 10 giây đầu (FFmpeg đọc nhanh hơn realtime lúc khởi động)
+SCHEDULER_SMOOTHING = 0.3                      # Hệ số EWMA cho chi phí đo được
+SCHEDULER_PIN_CORES = True                     # Gán tiến trình FFmpeg của mỗi kênh vào một tập core (Linux)
+SCHEDULER_ADMISSION_MODES = ("refuse", "queue")  # Khi hết headroom: từ chối ngay hoặc chờ đến khi có chỗ
+DEFAULT_SCHEDULER_ADMISSION = "refuse"
+SCHEDULER_REFUSED = "Channel refused"          # Đầu thông báo /start khi scheduler từ chối (để phân biệt với lỗi khởi động)
+SCHEDULER_QUEUE_TIMEOUT = 600                  # Kênh chờ quá 10 phút thì hủy (state failed)
+SCHEDULER_REFERENCE_PIXELS = 1280 * 720        # Chi phí trong SCHEDULER_COSTS tính cho nguồn 720p
+# Số core cần để chạy realtime cho từng phần việc, trước khi có số đo thực của profile
+SCHEDULER_COSTS = {
+    "decode": 0.05,                            # Decode H.264 nguồn
+    "multicast_encode": 0.45,                  # MULTICAST_ENCODE_ARGS (ultrafast, zerolatency)
+    "hls_encode": 1.6,                         # Encode HLS một rendition (preset mặc định của x264)
+    "ladder_encode": 0.6,                      # Mỗi rendition ladder (HLS_LADDER_PRESET), theo độ phân giải rendition
+    "audio": 0.02,                             # Encode AAC
+    "remux": 0.01,                             # Passthrough: chỉ remux
+    "paced": 0.01,                             # Bộ phát paced (luồng Python, không encode lại)
+}
 
-def ensure_hls_dir():
+# Tham số encode dùng cho luồng multicast (và cho chế độ shared)
+MULTICAST_ENCODE_ARGS = [
+    # Video settings
+    "-c:v", "libx264",
+    "-vsync", "cfr",
+    "-preset", "ultrafast",
+    "-tune", "zerolatency",
+    "-profile:v", "baseline",
+    "-level", "3.0",
+    "-b:v", "800k",
+    "-maxrate", "1000k",
+    "-bufsize", "1000k",
+    "-r", "24",
+    "-x264opts", "no-cabac:no-scenecut:partitions=none:ref=1:me=dia:subme=0:trellis=0:weightp=0:no-weightb:bframes=0:8x8dct=0",
+    "-force_key_frames", "expr:gte(t,n_forced*0.5)",
+    "-g", "12",
+    "-keyint_min", "12",
+    "-sc_threshold", "0",
+    "-vf", "fps=fps=24",
+
+    # Audio settings
+    "-c:a", "aac",
+    "-b:a", "96k",
+    "-ar", "44100",
+    "-ac", "2",
+]
+
+# Chỉ remux khi nguồn đã đúng định dạng (H.264 + AAC, keyframe đủ dày)
+PASSTHROUGH_ARGS = [
+    "-map", "0:v:0",
+    "-map", "0:a:0?",
+    "-c", "copy",
+]
+
+def ensure_hls_dir(hls_dir):
     """Đảm bảo thư mục HLS tồn tại và trống"""
-    if os.path.exists(HLS_OUTPUT_DIR):
-        shutil.rmtree(HLS_OUTPUT_DIR)
-    os.makedirs(HLS_OUTPUT_DIR)
+    if os.path.exists(hls_dir):
+        shutil.rmtree(hls_dir)
+    os.makedirs(hls_dir)
 
 def configure_firewall():
     """Cấu hình tường lửa để cho phép multicast"""
@@ -50,25 +191,108 @@ def configure_firewall():
         print(f"Failed to configure firewall: {e}", file=sys.stderr)
         print("Continuing anyway...", file=sys.stderr)
 
-def start_ffmpeg(cdn_url, multicast_addr, port, ttl):
-    global ffmpeg_process, hls_process
-    if ffmpeg_process is not None or hls_process is not None:
-        return False, "Streaming is already running."
+TS_CLOCK_PERIOD = 2 ** 33 / 90000     # Chu kỳ quay vòng của PTS/PCR (33 bit, 90 kHz), khoảng 26,5 giờ
+FFMPEG_READRATE_BURST = 0.5           # -re của FFmpeg >= 6.1 đọc trước 0,5 giây đầu không giới hạn (-readrate_initial_burst)
+                                      # Giờ bắt đầu lấy lúc tạo lệnh: thời gian FFmpeg khởi động, mở và probe nguồn
+                                      # (~0,1-0,3 giây với file cục bộ, thêm vài round trip với CDN) không được trừ,
+                                      # nên timestamp sớm hơn giờ đọc thật chừng đó và độ trễ đo được là cận trên
+MPEGTS_MUX_DELAY = 0.7                # -muxdelay mặc định của FFmpeg: DTS đi trước PCR 0,7 giây (đệm T-STD của bộ giải mã)
+
+def wallclock_ts_offset(mux_delay=MPEGTS_MUX_DELAY):
+    """Giá trị -output_ts_offset để DTS/PTS đầu ra = giờ hệ thống (Unix, modulo TS_CLOCK_PERIOD) lúc khung hình được đọc
+
+    Với -re, khung hình có timestamp t được đọc lúc bắt đầu + t - FFMPEG_READRATE_BURST, nên PTS cho biết thời điểm
+    "capture" của nó: phía nhận tính được độ trễ đầu-cuối (checkMulticast.py --latency), server suy ra
+    EXT-X-PROGRAM-DATE-TIME của từng segment HLS từ đó. Muxer mpegts cộng 2 × mux_delay vào PTS/DTS (và mux_delay
+    vào PCR) nên phần đó được trừ ra: 0 cho đầu ra multicast (-muxdelay 0), mặc định cho HLS và các nhánh tee.
+    """
+    return f"{(time.time() - FFMPEG_READRATE_BURST - 2 * mux_delay) % TS_CLOCK_PERIOD:.6f}"
 
+def first_pes_pts(data):
+    """PTS (giây) của PES video đầu tiên trong dữ liệu TS (PES bất kỳ nếu không có video), None nếu không thấy"""
+    fallback = None
+    for offset in range(0, len(data) - 187, 188):
+        if data[offset] != 0x47 or not data[offset + 1] & 0x40:
+            continue
+        start = offset + 4
+        if data[offset + 3] & 0x20:
+            start += 1 + data[offset + 4]
+        header = data[start:start + 14]
+        if len(header) < 14 or header[:3] != b"\x00\x00\x01" or not header[7] & 0x80:
+            continue
+        b = header[9:14]
+        pts = (((b[0] >> 1) & 0x07) << 30 | b[1] << 22 | (b[2] >> 1) << 15 | b[3] << 7 | b[4] >> 1) / 90000.0
+        if 0xE0 <= header[3] <= 0xEF:
+            return pts
+        if fallback is None:
+            fallback = pts
+    return fallback
+
+def capture_time(data, now=None):
+    """Giờ capture (Unix) của segment TS, suy từ PTS đầu tiên (xem wallclock_ts_offset)"""
+    pts = first_pes_pts(data)
+    if pts is None:
+        return None
+    now = time.time() if now is None else now
+    return pts + TS_CLOCK_PERIOD * round((now - pts) / TS_CLOCK_PERIOD)
+
+def format_program_date_time(timestamp):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(timestamp)) + f".{int(timestamp * 1000) % 1000:03d}Z"
+
+def add_program_date_time(text, captured_at):
+    """Chèn EXT-X-PROGRAM-DATE-TIME trước mỗi segment; captured_at(uri) trả về giờ capture hoặc None"""
+    lines, pending = [], []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("#EXT-X-PROGRAM-DATE-TIME:"):
+            continue
+        if stripped.startswith("#EXTINF:") or (pending and stripped.startswith("#")):
+            pending.append(line)
+            continue
+        if pending and stripped:
+            timestamp = captured_at(stripped)
+            if timestamp is not None:
+                lines.append(f"#EXT-X-PROGRAM-DATE-TIME:{format_program_date_time(timestamp)}")
+        lines += pending + [line]
+        pending = []
+    return "\n".join(lines + pending) + "\n"
+
+def build_multicast_url(multicast_addr, port, ttl, fec=None):
+    """Tạo URL đầu ra cho luồng multicast: UDP thô, hoặc RTP khi có FEC (FEC cần số thứ tự RTP)"""
     # Kiểm tra xem địa chỉ có phải là multicast không
     is_multicast = multicast_addr.startswith('239.') or multicast_addr.startswith('224.')
-    is_local = multicast_addr.startswith('127.')
-    
-    # In thông tin địa chỉ cho debug
-    print(f"Stream address: {multicast_addr}", file=sys.stderr)
-    print(f"Is multicast: {is_multicast}", file=sys.stderr)
-    print(f"Is localhost: {is_local}", file=sys.stderr)
-    
-    # Đảm bảo thư mục HLS tồn tại và trống
-    ensure_hls_dir()
-    
-    # Cấu hình cho multicast stream
-    multicast_command = [
+    if fec:
+        url = f"rtp://{multicast_addr}:{port}?pkt_size={RTP_PACKET_SIZE}&buffer_size=65536"
+    else:
+        url = f"udp://{multicast_addr}:{port}?pkt_size=1316&buffer_size=65536"
+    if is_multicast:
+        return f"{url}&ttl={ttl}"
+    return url
+
+def parse_fec(value):
+    """(L, D) từ chuỗi "LxD" (ví dụ "10x5"), None nếu "off"; ValueError nếu không hợp lệ"""
+    if not value or value == MULTICAST_FEC_OFF:
+        return None
+    try:
+        columns, rows = (int(v) for v in value.lower().split("x"))
+    except ValueError:
+        raise ValueError(f"Invalid FEC matrix: {value} (expected LxD, e.g. 10x5, or off)")
+    low, high = MULTICAST_FEC_LIMITS
+    if not (low <= columns <= high and low <= rows <= high) or columns * rows > MULTICAST_FEC_MAX_MATRIX:
+        raise ValueError(f"FEC L and D must be between {low} and {high} with L x D <= {MULTICAST_FEC_MAX_MATRIX}")
+    return columns, rows
+
+def fec_option(fec):
+    """Giá trị tùy chọn -fec của FFmpeg cho ma trận (L, D)"""
+    return f"prompeg=l={fec[0]}:d={fec[1]}"
+
+def build_multicast_command(cdn_url, multicast_url, passthrough=False, fec=None):
+    """Lệnh FFmpeg chỉ phát multicast; passthrough=True chỉ remux (không encode lại)
+
+    Với fec=(L, D), media đi trong RTP và FFmpeg phát thêm FEC cột/hàng ở cổng +2/+4.
+    """
+    output = ["-fec", fec_option(fec), "-f", "rtp_mpegts"] if fec else ["-f", "mpegts"]
+    return [
         "ffmpeg",
         "-loglevel", "warning",                  # Giảm log
         "-re",                                   # Đọc với tốc độ thực 
@@ -79,156 +303,2428 @@ def start_ffmpeg(cdn_url, multicast_addr, port, ttl):
         "-analyzeduration", "500000",
         "-probesize", "1000000",
         "-i", cdn_url,
-        
-        # Video settings
-        "-c:v", "libx264",
-        "-vsync", "cfr",
-        "-preset", "ultrafast",
-        "-tune", "zerolatency",
-        "-profile:v", "baseline",
-        "-level", "3.0",
-        "-b:v", "800k",
-        "-maxrate", "1000k",
-        "-bufsize", "1000k",
-        "-r", "24",
-        "-x264opts", "no-cabac:no-scenecut:partitions=none:ref=1:me=dia:subme=0:trellis=0:weightp=0:no-weightb:bframes=0:8x8dct=0",
-        "-force_key_frames", "expr:gte(t,n_forced*0.5)",
-        "-g", "12",
-        "-keyint_min", "12",
-        "-sc_threshold", "0",
-        "-vf", "fps=fps=24",
-        
-        # Audio settings
-        "-c:a", "aac",
-        "-b:a", "96k",
-        "-ar", "44100",
-        "-ac", "2",
-        
+        *(PASSTHROUGH_ARGS if passthrough else MULTICAST_ENCODE_ARGS),
+
         # Output settings
         "-max_muxing_queue_size", "9999",
         "-muxdelay", "0",
         "-muxpreload", "0",
-        "-f", "mpegts",
+        "-output_ts_offset", wallclock_ts_offset(0),
+        *output,
+        multicast_url,
     ]
 
-    # Thêm đầu ra cho multicast
-    if is_multicast:
-        multicast_output = f"udp://{multicast_addr}:{port}?pkt_size=1316&buffer_size=65536&ttl={ttl}"
+def build_hls_muxer_options(hls_base, low_latency=False, variants=False):
+    """Tùy chọn muxer HLS và playlist đầu ra; hls_base là thư mục trên đĩa hoặc URL ingest để giữ segment trong RAM"""
+    if low_latency:
+        # LL-HLS: mỗi segment FFmpeg tạo ra là một partial segment, server tự ghép thành segment đầy đủ
+        options = [
+            ("hls_time", HLS_PART_TIME),
+            ("hls_list_size", HLS_LL_INGEST_LIST_SIZE),
+            ("hls_segment_filename", f"{hls_base}/part_%d.ts"),
+        ]
+        playlist = f"{hls_base}/{LL_INGEST_PLAYLIST}"
     else:
-        multicast_output = f"udp://{multicast_addr}:{port}?pkt_size=1316&buffer_size=65536"
-    
-    multicast_command.append(multicast_output)
+        options = [
+            ("hls_time", HLS_SEGMENT_TIME),
+            ("hls_list_size", HLS_LIST_SIZE),
+            ("hls_flags", "delete_segments"),
+            ("hls_segment_filename", f"{hls_base}/segment_%d.ts"),
+        ]
+        playlist = f"{hls_base}/playlist.m3u8"
+        if variants:
+            # ABR: mỗi rendition một thư mục con, playlist.m3u8 ở gốc là master playlist
+            options[-1] = ("hls_segment_filename", f"{hls_base}/%v/segment_%d.ts")
+            options.append(("master_pl_name", "playlist.m3u8"))
+            playlist = f"{hls_base}/%v/playlist.m3u8"
+    if hls_base.startswith("http://"):
+        # Gửi segment/playlist bằng HTTP PUT tới server ingest nội bộ, giữ kết nối
+        options += [("method", "PUT"), ("http_persistent", "1")]
+    return options, playlist
 
-    # Cấu hình cho HLS stream
-    hls_command = [
+def build_hls_command(cdn_url, hls_base, low_latency=False, passthrough=False):
+    """Lệnh FFmpeg chỉ tạo HLS; passthrough=True chỉ remux (không encode lại)"""
+    command = [
         "ffmpeg",
         "-loglevel", "warning",
         "-re",
         "-i", cdn_url,
+    ]
+    if passthrough:
+        command += PASSTHROUGH_ARGS
+    else:
+        command += [
+            "-c:v", "libx264",
+            "-c:a", "aac",
+            "-b:v", "800k",
+            "-b:a", "96k",
+            "-ar", "44100",
+            "-ac", "2",
+        ]
+    if low_latency and not passthrough:
+        # Keyframe ở đầu mỗi partial segment để part nào cũng INDEPENDENT
+        command += [
+            "-tune", "zerolatency",
+            "-force_key_frames", f"expr:gte(t,n_forced*{HLS_PART_TIME})",
+            "-sc_threshold", "0",
+        ]
+    command += ["-output_ts_offset", wallclock_ts_offset(), "-f", "hls"]
+    options, playlist = build_hls_muxer_options(hls_base, low_latency)
+    for name, value in options:
+        command += [f"-{name}", value]
+    command.append(playlist)
+    return command
+
+def parse_ladder(value):
+    """Danh sách rendition từ chuỗi "1080p,720p,audio"; ValueError nếu có tên không hợp lệ"""
+    ladder = [name.strip() for name in (value or "").split(",") if name.strip()]
+    for name in ladder:
+        if name not in HLS_RENDITIONS:
+            raise ValueError(f"Unknown rendition: {name} (available: {', '.join(HLS_RENDITIONS)})")
+    if len(set(ladder)) != len(ladder):
+        raise ValueError("Duplicate rendition in ladder")
+    return ladder
+
+def build_ladder_command(cdn_url, hls_base, ladder, multicast_url=None, fec=None):
+    """Lệnh FFmpeg ABR: decode một lần, một filter graph split/scale cho mọi rendition, kèm master playlist
+
+    Nếu có multicast_url (pipeline shared), cùng tiến trình phát thêm luồng multicast từ bản decode đó.
+    """
+    renditions = [(name, HLS_RENDITIONS[name]) for name in ladder]
+    videos = [(name, r) for name, r in renditions if r["height"]]
+    if multicast_url:
+        # Dùng chung phần đầu vào của lệnh multicast (loop, đọc realtime)
+        multicast_command = build_multicast_command(cdn_url, multicast_url, fec=fec)
+        command = multicast_command[:multicast_command.index("-i") + 2]
+    else:
+        command = ["ffmpeg", "-loglevel", "warning", "-re", "-i", cdn_url]
+
+    branches = len(videos) + (1 if multicast_url else 0)
+    if branches:
+        # Một lần decode, split rồi scale cho từng rendition (cùng khung hình nguồn nên keyframe thẳng hàng)
+        head = "[0:v:0]fps=fps=24," if multicast_url else "[0:v:0]"
+        graph = head + f"split={branches}" + "".join(f"[s{i}]" for i in range(branches))
+        for i, (_, rendition) in enumerate(videos):
+            graph += f";[s{i}]scale=-2:{rendition['height']}[v{i}]"
+        command += ["-filter_complex", graph]
+
+    for i in range(len(videos)):
+        command += ["-map", f"[v{i}]"]
+    command += ["-map", "0:a:0"] * len(renditions)
+    command += [
         "-c:v", "libx264",
+        "-preset", HLS_LADDER_PRESET,
+        # Keyframe cố định ở đầu mỗi segment cho mọi rendition để player chuyển rendition không bị giật
+        "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_TIME})",
+        "-sc_threshold", "0",
         "-c:a", "aac",
-        "-b:v", "800k",
-        "-b:a", "96k",
         "-ar", "44100",
         "-ac", "2",
-        "-f", "hls",
-        "-hls_time", HLS_SEGMENT_TIME,
-        "-hls_list_size", "5",
-        "-hls_flags", "delete_segments",
-        "-hls_segment_filename", f"{HLS_OUTPUT_DIR}/segment_%d.ts",
-        f"{HLS_OUTPUT_DIR}/playlist.m3u8"
     ]
-    
+    stream_map = []
+    for i, (name, rendition) in enumerate(videos):
+        command += [
+            f"-b:v:{i}", rendition["video_bitrate"],
+            f"-maxrate:v:{i}", rendition["maxrate"],
+            f"-bufsize:v:{i}", rendition["bufsize"],
+        ]
+    video_index = 0
+    for i, (name, rendition) in enumerate(renditions):
+        command += [f"-b:a:{i}", rendition["audio_bitrate"]]
+        if rendition["height"]:
+            stream_map.append(f"v:{video_index},a:{i},name:{name}")
+            video_index += 1
+        else:
+            stream_map.append(f"a:{i},name:{name}")
+
+    options, playlist = build_hls_muxer_options(hls_base, variants=True)
+    command += ["-output_ts_offset", wallclock_ts_offset(), "-f", "hls", "-var_stream_map", " ".join(stream_map)]
+    for name, value in options:
+        command += [f"-{name}", value]
+    command.append(playlist)
+
+    if multicast_url:
+        # Nhánh multicast: đầu ra thứ hai của cùng tiến trình (bỏ -vf vì fps đã nằm trong filter graph)
+        encode_args = list(MULTICAST_ENCODE_ARGS)
+        vf = encode_args.index("-vf")
+        del encode_args[vf:vf + 2]
+        command += ["-map", f"[s{len(videos)}]", "-map", "0:a:0?", *encode_args,
+                    *multicast_command[multicast_command.index("-max_muxing_queue_size"):]]
+    return command
+
+def tee_escape(value):
+    """Escape giá trị tùy chọn của một nhánh tee"""
+    return value.replace("\\", "\\\\\\\\").replace(":", "\\\\:")
+
+def build_shared_command(cdn_url, multicast_url, hls_base, low_latency=False, passthrough=False, fec=None):
+    """Lệnh FFmpeg decode/encode một lần rồi chia ra multicast và HLS bằng tee muxer"""
+    options, playlist = build_hls_muxer_options(hls_base, low_latency)
+    # Trong tùy chọn của tee, dấu ':' trong giá trị phải được escape 2 lần (\\:)
+    hls_options = ":".join(f"{name}={tee_escape(value)}" for name, value in options)
+    # Nhánh tee không nhận -muxdelay của lệnh: đặt max_delay mặc định cho từng nhánh (xem wallclock_ts_offset)
+    max_delay = f"max_delay={int(MPEGTS_MUX_DELAY * 1000000)}"
+    hls_slave = f"[f=hls:{hls_options}:{max_delay}:onfail=ignore]{playlist}"
+    if fec:
+        multicast_slave = f"[f=rtp_mpegts:fec={tee_escape(fec_option(fec))}:{max_delay}:onfail=ignore]{multicast_url}"
+    else:
+        multicast_slave = f"[f=mpegts:{max_delay}:onfail=ignore]{multicast_url}"
+    command = build_multicast_command(cdn_url, multicast_url, passthrough)
+    # Thay phần muxer mpegts cuối lệnh (-muxdelay 0 và offset tương ứng) bằng tee với 2 nhánh
+    command = command[:command.index("-muxdelay")] + ["-output_ts_offset", wallclock_ts_offset()]
+    if not passthrough:
+        # PASSTHROUGH_ARGS đã có -map
+        command += ["-map", "0:v:0", "-map", "0:a:0?"]
+    command += [
+        "-f", "tee",
+        f"{multicast_slave}|{hls_slave}",
+    ]
+    return command
+
+# Kết quả probe theo cdn_url (codec không đổi giữa các lần phát lại cùng một nguồn)
+source_probes = {}
+source_probes_lock = threading.Lock()
+
+def max_keyframe_interval(keyframe_times):
+    """Khoảng cách lớn nhất giữa 2 keyframe; None nếu trong cửa sổ probe chỉ có một keyframe"""
+    times = sorted(keyframe_times)
+    if len(times) < 2:
+        return None
+    return max(b - a for a, b in zip(times, times[1:]))
+
+def run_ffprobe(url):
+    """Probe bằng ffprobe (JSON)"""
+    result = subprocess.run([
+        "ffprobe", "-v", "error",
+        "-print_format", "json",
+        "-show_entries", "stream=index,codec_type,codec_name,profile,pix_fmt,width,height,avg_frame_rate"
+                         ":packet=stream_index,pts_time,flags",
+        "-read_intervals", f"%+{PROBE_SECONDS}",
+        url,
+    ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=PROBE_TIMEOUT)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode("utf-8", "replace").strip())
+    data = json.loads(result.stdout)
+    probe = {"video": None, "audio": None}
+    video_index = None
+    for stream in data.get("streams", []):
+        kind = stream.get("codec_type")
+        if kind in probe and probe[kind] is None:
+            probe[kind] = {
+                "codec": stream.get("codec_name"),
+                "profile": stream.get("profile"),
+                "pix_fmt": stream.get("pix_fmt"),
+                "width": stream.get("width"),
+                "height": stream.get("height"),
+            }
+            if kind == "video":
+                video_index = stream["index"]
+    keyframes = [float(p["pts_time"]) for p in data.get("packets", [])
+                 if p.get("stream_index") == video_index and "K" in p.get("flags", "") and p.get("pts_time")]
+    probe["max_keyframe_interval"] = max_keyframe_interval(keyframes)
+    return probe
+
+STREAM_PATTERN = re.compile(r"Stream #0:\d+\S*: (Video|Audio): (\w+)(?: \(([^)]*)\))?[^,]*(?:, (\w+))?")
+RESOLUTION_PATTERN = re.compile(r", (\d{2,5})x(\d{2,5})[ ,]")
+
+def run_ffmpeg_probe(url):
+    """Probe chỉ với ffmpeg khi không có ffprobe: thông tin stream từ stderr, keyframe từ framecrc"""
+    result = subprocess.run([
+        "ffmpeg", "-hide_banner", "-nostdin",
+        "-t", str(PROBE_SECONDS),
+        "-i", url,
+        "-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-",
+    ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=PROBE_TIMEOUT)
+    stderr = result.stderr.decode("utf-8", "replace")
+    probe = {"video": None, "audio": None}
+    for line in stderr.splitlines():
+        match = STREAM_PATTERN.search(line)
+        if match is None:
+            continue
+        kind, codec, profile, pix_fmt = match.groups()
+        kind = kind.lower()
+        if probe[kind] is None:
+            probe[kind] = {"codec": codec, "profile": profile or None}
+            if kind == "video":
+                probe[kind]["pix_fmt"] = pix_fmt
+                resolution = RESOLUTION_PATTERN.search(line)
+                if resolution:
+                    probe[kind]["width"], probe[kind]["height"] = map(int, resolution.groups())
+    if probe["video"] is None and probe["audio"] is None:
+        raise RuntimeError(stderr.strip().splitlines()[-1] if stderr.strip() else "ffmpeg probe failed")
+    # framecrc: "#tb 0: 1/12288" rồi mỗi packet "0, dts, pts, duration, size, crc[, F=0x..]"
+    time_base = 1.0
+    keyframes = []
+    for line in result.stdout.decode("utf-8", "replace").splitlines():
+        if line.startswith("#tb 0:"):
+            num, _, den = line.split(":", 1)[1].strip().partition("/")
+            time_base = int(num) / int(den)
+        elif line and not line.startswith("#"):
+            fields = [f.strip() for f in line.split(",")]
+            flags = int(fields[6][2:], 16) if len(fields) > 6 and fields[6].startswith("F=") else 1
+            if flags & 1:
+                keyframes.append(int(fields[2]) * time_base)
+    probe["max_keyframe_interval"] = max_keyframe_interval(keyframes)
+    return probe
+
+def probe_source(cdn_url, source_url):
+    """Probe codec/profile/khoảng keyframe của nguồn, lưu cache theo cdn_url; None nếu không probe được"""
+    with source_probes_lock:
+        if cdn_url in source_probes:
+            return source_probes[cdn_url]
     try:
-        # Khởi chạy FFmpeg cho multicast
-        print(f"Starting multicast stream...", file=sys.stderr)
-        ffmpeg_process = subprocess.Popen(multicast_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        
-        # Khởi chạy FFmpeg cho HLS
-        print(f"Starting HLS stream...", file=sys.stderr)
-        hls_process = subprocess.Popen(hls_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        
-        # Đợi một chút để xem có lỗi ngay không
+        probe = run_ffprobe(source_url) if shutil.which("ffprobe") else run_ffmpeg_probe(source_url)
+    except (OSError, ValueError, RuntimeError, subprocess.TimeoutExpired) as e:
+        print(f"Probe failed for {cdn_url}: {e}", file=sys.stderr)
+        probe = None
+    with source_probes_lock:
+        source_probes[cdn_url] = probe
+    return probe
+
+def cached_probe(cdn_url):
+    """Kết quả probe đã có của nguồn (không chạy probe), None nếu chưa probe"""
+    with source_probes_lock:
+        return source_probes.get(cdn_url)
+
+def passthrough_outputs(probe, low_latency=False):
+    """Các đầu ra ("multicast", "hls") có thể remux thẳng từ nguồn mà không encode lại"""
+    if probe is None or probe["video"] is None:
+        return set()
+    video, audio = probe["video"], probe["audio"]
+    if video["codec"] != "h264" or video["profile"] not in PASSTHROUGH_VIDEO_PROFILES or \
+            video["pix_fmt"] != "yuv420p":
+        return set()
+    if audio is not None and (audio["codec"] != "aac" or audio["profile"] not in (None, "LC")):
+        return set()
+    # HLS chỉ cắt segment tại keyframe, nên GOP phải ngắn hơn segment (hoặc part ở chế độ LL)
+    gop = probe["max_keyframe_interval"]
+    if gop is None:
+        return set()
+    outputs = set()
+    if gop <= PASSTHROUGH_MULTICAST_MAX_GOP:
+        outputs.add("multicast")
+    if gop <= float(HLS_PART_TIME if low_latency else HLS_SEGMENT_TIME):
+        outputs.add("hls")
+    return outputs
+
+def merge_ranges(ranges):
+    """Gộp các khoảng [start, end) chồng lấn hoặc liền nhau"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def parse_range_header(range_header, size):
+    """Chuyển header Range thành (start, end) bao gồm cả end; None nếu không hợp lệ"""
+    if not range_header or not range_header.startswith("bytes="):
+        return 0, size - 1
+    first, _, last = range_header[6:].split(",")[0].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            start = max(0, size - int(last))
+            end = size - 1
+    except ValueError:
+        return 0, size - 1
+    if start >= size or start > end:
+        return None
+    return start, end
+
+class CacheEntry:
+    """Một file nguồn trong cache: metadata kiểm tra hợp lệ và các khoảng byte đã có trên đĩa"""
+
+    def __init__(self, key, url, data_path):
+        self.key = key
+        self.url = url
+        self.data_path = data_path
+        self.size = 0
+        self.etag = None
+        self.last_modified = None
+        self.content_type = "application/octet-stream"
+        self.ranges = []            # Các khoảng [start, end) đã tải về
+        self.last_access = time.time()
+        self.validated_at = 0
+        self.readers = 0
+        self.cond = threading.Condition()
+        self.fillers = {}           # Các luồng đang tải từ CDN: id -> vị trí hiện tại
+        self.fill_error = None
+
+    @property
+    def cached_bytes(self):
+        return sum(end - start for start, end in self.ranges)
+
+    @property
+    def complete(self):
+        return self.size > 0 and self.ranges == [[0, self.size]]
+
+    def covered_until(self, pos):
+        """Vị trí cuối của khoảng đã cache chứa pos, None nếu pos chưa có"""
+        for start, end in self.ranges:
+            if start <= pos < end:
+                return end
+        return None
+
+    def next_cached_start(self, pos):
+        """Vị trí bắt đầu của khoảng đã cache kế tiếp sau pos"""
+        starts = [start for start, _ in self.ranges if start > pos]
+        return min(starts) if starts else self.size
+
+    def to_dict(self):
+        return {
+            "url": self.url,
+            "size": self.size,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "content_type": self.content_type,
+            "ranges": self.ranges,
+            "last_access": self.last_access,
+        }
+
+class SourceCache:
+    """Cache file nguồn từ CDN trên đĩa (Cache Server trên máy chủ multicast)
+
+    FFmpeg đọc qua một HTTP server nội bộ. Các khoảng byte chưa có được tải từ CDN
+    bằng Range request và ghi vào file cache, các lần loop sau đọc hoàn toàn từ đĩa.
+    """
+
+    def __init__(self, cache_dir, max_bytes, revalidate_after):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.httpd = None
+        self.stats = {
+            "hits": 0,                   # Request phục vụ hoàn toàn từ cache
+            "misses": 0,                 # Request phải tải thêm từ CDN
+            "bytes_served": 0,           # Số byte FFmpeg đã đọc qua cache
+            "bytes_from_origin": 0,      # Số byte thực sự kéo từ CDN
+            "revalidations": 0,
+            "invalidations": 0,
+            "evictions": 0,
+        }
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _count(self, name, n=1):
+        with self.lock:
+            self.stats[name] += n
+
+    @staticmethod
+    def key_for(url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+
+    def _meta_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_index(self):
+        """Nạp lại các entry đã cache từ lần chạy trước"""
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-5]
+            data_path = os.path.join(self.cache_dir, f"{key}.data")
+            try:
+                with open(os.path.join(self.cache_dir, name)) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not os.path.exists(data_path):
+                continue
+            entry = CacheEntry(key, meta["url"], data_path)
+            entry.size = meta.get("size", 0)
+            entry.etag = meta.get("etag")
+            entry.last_modified = meta.get("last_modified")
+            entry.content_type = meta.get("content_type", entry.content_type)
+            entry.ranges = merge_ranges(meta.get("ranges", []))
+            entry.last_access = meta.get("last_access", 0)
+            self.entries[key] = entry
+
+    def _save_meta(self, entry):
         try:
-            return_code = ffmpeg_process.wait(timeout=2)
-            if return_code != 0:
-                error = ffmpeg_process.stderr.read().decode('utf-8')
-                ffmpeg_process = None
-                return False, f"Multicast FFmpeg failed: {error}"
-        except subprocess.TimeoutExpired:
-            pass
+            with open(self._meta_path(entry.key), "w") as f:
+                json.dump(entry.to_dict(), f)
+        except OSError as e:
+            print(f"Error saving cache metadata: {e}", file=sys.stderr)
 
+    def _reset_data(self, entry):
+        """Xóa dữ liệu cũ và tạo file thưa đúng kích thước nguồn"""
+        entry.ranges = []
+        with open(entry.data_path, "wb") as f:
+            f.truncate(entry.size)
+
+    def _validate(self, entry):
+        """Kiểm tra nguồn trên CDN còn giống bản cache không (ETag/Last-Modified)"""
+        req = urllib.request.Request(entry.url, headers={"Range": "bytes=0-0"})
+        if entry.etag:
+            req.add_header("If-None-Match", entry.etag)
+        if entry.last_modified:
+            req.add_header("If-Modified-Since", entry.last_modified)
         try:
-            return_code = hls_process.wait(timeout=2)
-            if return_code != 0:
-                error = hls_process.stderr.read().decode('utf-8')
-                hls_process = None
-                return False, f"HLS FFmpeg failed: {error}"
-        except subprocess.TimeoutExpired:
-            pass
-            
-        print(f"\n----- HƯỚNG DẪN KẾT NỐI -----", file=sys.stderr)
-        print(f"1. Xem qua Multicast:", file=sys.stderr)
-        print(f"   - VLC -> Media -> Open Network Stream -> Nhập: udp://@{multicast_addr}:{port}", file=sys.stderr)
-        print(f"   - Hoặc: vlc udp://@{multicast_addr}:{port} --network-caching=50", file=sys.stderr)
-        print(f"2. Xem qua HLS:", file=sys.stderr)
-        print(f"   - VLC -> Media -> Open Network Stream -> Nhập: http://localhost:3000/hls/playlist.m3u8", file=sys.stderr)
-        print(f"   - Hoặc trình duyệt web: http://localhost:3000/hls/player.html", file=sys.stderr)
-        print(f"--------------------------------\n", file=sys.stderr)
-        
-        return True, "Streaming started successfully (both Multicast and HLS)."
-    except Exception as e:
-        if ffmpeg_process:
-            ffmpeg_process.terminate()
-            ffmpeg_process = None
-        if hls_process:
-            hls_process.terminate()
-            hls_process = None
-        return False, f"Error starting stream: {e}"
-
-def stop_ffmpeg():
-    global ffmpeg_process, hls_process
-    success = True
-    message = []
-    
-    # Dừng multicast process
-    if ffmpeg_process:
+            with urllib.request.urlopen(req, timeout=10) as response:
+                headers = response.headers
+                status = response.status
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                raise
+            headers, status = e.headers, 304
+        self._count("revalidations")
+        entry.validated_at = time.time()
+        if status == 304:
+            return
+
+        if status == 206 and "/" in headers.get("Content-Range", ""):
+            size = int(headers["Content-Range"].rsplit("/", 1)[1])
+        else:
+            size = int(headers.get("Content-Length") or 0)
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        changed = (size != entry.size or etag != entry.etag or last_modified != entry.last_modified)
+        entry.etag = etag
+        entry.last_modified = last_modified
+        entry.content_type = headers.get("Content-Type", entry.content_type)
+        if changed:
+            if entry.ranges:
+                self._count("invalidations")
+            entry.size = size
+            self._reset_data(entry)
+        self._save_meta(entry)
+
+    def lookup(self, url):
+        """Lấy entry cho url, tạo mới hoặc kiểm tra lại nếu đã quá hạn"""
+        key = self.key_for(url)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = CacheEntry(key, url, os.path.join(self.cache_dir, f"{key}.data"))
+                self.entries[key] = entry
+        if time.time() - entry.validated_at > self.revalidate_after:
+            try:
+                self._validate(entry)
+            except Exception as e:
+                if not entry.ranges:
+                    with self.lock:
+                        self.entries.pop(key, None)
+                    raise
+                # CDN không phản hồi: dùng tạm bản cache cũ
+                print(f"Cache revalidation failed for {url}, serving stale copy: {e}", file=sys.stderr)
+        entry.last_access = time.time()
+        return entry
+
+    def read(self, entry, start, end):
+        """Sinh dữ liệu từ start đến end (bao gồm); phần còn thiếu được tải nền từ CDN rồi đọc từ đĩa"""
+        pos = start
+        hit = True
+        with self.lock:
+            entry.readers += 1
+        try:
+            with open(entry.data_path, "rb") as cached:
+                while pos <= end:
+                    covered_end = self._wait_for_data(entry, pos)
+                    if covered_end is None:
+                        hit = False
+                        continue
+                    stop = min(covered_end, end + 1)
+                    cached.seek(pos)
+                    while pos < stop:
+                        chunk = cached.read(min(SOURCE_CACHE_CHUNK, stop - pos))
+                        if not chunk:
+                            raise IOError(f"Cache file truncated at byte {pos}")
+                        pos += len(chunk)
+                        self._count("bytes_served", len(chunk))
+                        yield chunk
+        finally:
+            with self.lock:
+                entry.readers -= 1
+            entry.last_access = time.time()
+            self._count("hits" if hit else "misses")
+            self._save_meta(entry)
+            self._evict()
+
+    def _wait_for_data(self, entry, pos):
+        """Trả về cuối khoảng đã cache chứa pos; nếu chưa có thì đảm bảo có luồng tải và chờ"""
+        with entry.cond:
+            covered_end = entry.covered_until(pos)
+            if covered_end is not None:
+                return covered_end
+            if entry.fill_error:
+                error, entry.fill_error = entry.fill_error, None
+                raise IOError(error)
+            # Chỉ tạo luồng tải mới khi pos không nằm ngay sau vị trí một luồng đang tải
+            if not any(cursor <= pos < cursor + SOURCE_CACHE_READAHEAD for cursor in entry.fillers.values()):
+                filler_id = object()
+                entry.fillers[filler_id] = pos
+                threading.Thread(target=self._fill, args=(entry, filler_id, pos), daemon=True).start()
+            entry.cond.wait(timeout=1)
+            return None
+
+    def _fill(self, entry, filler_id, start):
+        """Luồng nền: tải khoảng trống bắt đầu từ start bằng Range request, ghi vào cache"""
+        end = entry.next_cached_start(start)
+        req = urllib.request.Request(entry.url, headers={"Range": f"bytes={start}-{end - 1}"})
+        if entry.etag:
+            req.add_header("If-Range", entry.etag)
+        try:
+            with urllib.request.urlopen(req, timeout=10) as response, open(entry.data_path, "r+b") as data:
+                if response.status == 200 and entry.etag and response.headers.get("ETag") != entry.etag:
+                    # Nguồn đã thay đổi (If-Range không khớp): buộc kiểm tra lại ở lần đọc sau
+                    entry.validated_at = 0
+                    raise IOError(f"Source changed on origin: {entry.url}")
+                offset = 0 if response.status == 200 else start   # CDN không hỗ trợ Range: đọc từ đầu
+                data.seek(offset)
+                while offset < end:
+                    chunk = response.read(SOURCE_CACHE_CHUNK)
+                    if not chunk:
+                        raise IOError(f"Origin closed connection at byte {offset}")
+                    data.write(chunk)
+                    data.flush()
+                    self._count("bytes_from_origin", len(chunk))
+                    chunk_start, offset = offset, offset + len(chunk)
+                    with entry.cond:
+                        entry.ranges = merge_ranges(entry.ranges + [[chunk_start, offset]])
+                        entry.fillers[filler_id] = offset
+                        entry.cond.notify_all()
+                        # Dừng khi gặp phần đã có sẵn (do luồng khác tải)
+                        if start < offset < end and entry.covered_until(offset) is not None:
+                            break
+        except Exception as e:
+            with entry.cond:
+                entry.fill_error = f"Error filling cache for {entry.url}: {e}"
+                print(entry.fill_error, file=sys.stderr)
+        finally:
+            with entry.cond:
+                entry.fillers.pop(filler_id, None)
+                entry.cond.notify_all()
+            self._save_meta(entry)
+
+    def _evict(self):
+        """Xóa các entry ít dùng gần đây nhất khi cache vượt giới hạn dung lượng"""
+        with self.lock:
+            total = sum(e.cached_bytes for e in self.entries.values())
+            for entry in sorted(self.entries.values(), key=lambda e: e.last_access):
+                if total <= self.max_bytes:
+                    break
+                if entry.readers > 0:
+                    continue
+                total -= entry.cached_bytes
+                self.entries.pop(entry.key, None)
+                for path in (entry.data_path, self._meta_path(entry.key)):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                self.stats["evictions"] += 1
+
+    def start(self):
+        """Khởi động HTTP server nội bộ để FFmpeg đọc nguồn từ cache"""
+        with self.lock:
+            if self.httpd is None:
+                self.httpd = start_internal_server(SourceCacheHandler, SOURCE_CACHE_PORT)
+        return self.httpd.server_address[1]
+
+    def source_for(self, url):
+        """URL mà FFmpeg nên đọc cho một nguồn CDN"""
+        if not url.startswith(("http://", "https://")):
+            return url
         try:
-            ffmpeg_process.terminate()
+            entry = self.lookup(url)
+        except Exception as e:
+            print(f"Source cache unavailable for {url}: {e}", file=sys.stderr)
+            return url
+        if entry.size <= 0 or entry.size > self.max_bytes:
+            return url
+        if entry.complete:
+            # Đã có đủ trên đĩa: FFmpeg đọc thẳng file, không qua HTTP
+            self._count("hits")
+            return entry.data_path
+        port = self.start()
+        return f"http://127.0.0.1:{port}/{entry.key}"
+
+    def get_stats(self):
+        with self.lock:
+            entries = [{
+                "key": e.key,
+                "url": e.url,
+                "size": e.size,
+                "cached_bytes": e.cached_bytes,
+                "complete": e.complete,
+                "readers": e.readers,
+                "last_access": e.last_access,
+            } for e in self.entries.values()]
+        served = self.stats["bytes_served"]
+        saved = max(0, served - self.stats["bytes_from_origin"])
+        return {
+            **self.stats,
+            "bytes_saved": saved,
+            "hit_ratio": saved / served if served else 0,
+            "cached_bytes": sum(e["cached_bytes"] for e in entries),
+            "max_bytes": self.max_bytes,
+            "entries": entries,
+        }
+
+class SourceCacheHandler(BaseHTTPRequestHandler):
+    """Phục vụ file cache cho FFmpeg, hỗ trợ Range request"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _respond(self, send_body):
+        key = self.path.lstrip("/").split("?", 1)[0]
+        cache = get_source_cache()
+        with cache.lock:
+            entry = cache.entries.get(key)
+        if entry is None:
+            self.send_error(404)
+            return
+        try:
+            entry = cache.lookup(entry.url)
+        except Exception as e:
+            self.send_error(502, str(e))
+            return
+        byte_range = parse_range_header(self.headers.get("Range"), entry.size)
+        if byte_range is None:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{entry.size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        start, end = byte_range
+        if self.headers.get("Range"):
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{entry.size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", entry.content_type)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if not send_body:
+            return
+        try:
+            for chunk in cache.read(entry, start, end):
+                self.wfile.write(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        except Exception as e:
+            print(f"Error serving cached source {entry.url}: {e}", file=sys.stderr)
+            self.close_connection = True
+
+source_cache = None
+source_cache_lock = threading.Lock()
+
+def get_source_cache():
+    """Cache nguồn dùng chung, chỉ tạo (thư mục, index) khi cần chứ không phải lúc import module"""
+    global source_cache
+    with source_cache_lock:
+        if source_cache is None:
+            source_cache = SourceCache(SOURCE_CACHE_DIR, SOURCE_CACHE_MAX_BYTES, SOURCE_CACHE_REVALIDATE)
+    return source_cache
+
+class InternalHTTPServer(ThreadingHTTPServer):
+    """HTTP server nội bộ giữa FFmpeg và ứng dụng"""
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # FFmpeg đóng kết nối khi dừng hoặc seek: không cần in traceback
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+def start_internal_server(handler_class, port=0):
+    """Chạy một HTTP server nội bộ (chỉ lắng nghe 127.0.0.1) trong luồng nền"""
+    httpd = InternalHTTPServer(("127.0.0.1", port), handler_class)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+def read_request_body(handler):
+    """Đọc body của request, hỗ trợ Content-Length và Transfer-Encoding: chunked"""
+    if handler.headers.get("Transfer-Encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int(handler.rfile.readline().split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                # Bỏ qua trailer và dòng trống cuối
+                while handler.rfile.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                break
+            chunks.append(handler.rfile.read(size))
+            handler.rfile.readline()
+        return b"".join(chunks)
+    length = int(handler.headers.get("Content-Length") or 0)
+    return handler.rfile.read(length) if length else b""
+
+def hls_content_type(name):
+    if name.endswith(".m3u8"):
+        return "application/vnd.apple.mpegurl"
+    if name.endswith(".ts"):
+        return "video/mp2t"
+    return "application/octet-stream"
+
+class SegmentStore:
+    """Giữ playlist và các segment HLS mới nhất của một kênh trong RAM (bộ đệm vòng có giới hạn)"""
+
+    def __init__(self, max_segments=HLS_MEMORY_SEGMENTS):
+        self.max_segments = max_segments
+        self.playlists = {}                 # tên -> bytes, luôn là bản mới nhất
+        self.segments = OrderedDict()       # tên -> bytes, theo thứ tự ghi
+        self.captured = {}                  # tên segment -> giờ capture, cho EXT-X-PROGRAM-DATE-TIME
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def put(self, name, data):
+        with self.lock:
+            if name.endswith(".m3u8"):
+                directory = os.path.dirname(name)
+                text = add_program_date_time(data.decode("utf-8", "replace"),
+                                             lambda uri: self.captured.get(os.path.join(directory, uri)))
+                self.playlists[name] = text.encode("utf-8")
+                return
+            old = self.segments.pop(name, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self.segments[name] = data
+            self.captured[name] = capture_time(data)
+            self.bytes += len(data)
+            # Giới hạn số segment theo từng thư mục (mỗi playlist một vòng riêng)
+            directory = os.path.dirname(name)
+            same_dir = [n for n in self.segments if os.path.dirname(n) == directory]
+            for old_name in same_dir[:max(0, len(same_dir) - self.max_segments)]:
+                self.bytes -= len(self.segments.pop(old_name))
+                self.captured.pop(old_name, None)
+
+    def get(self, name):
+        with self.lock:
+            if name.endswith(".m3u8"):
+                return self.playlists.get(name)
+            return self.segments.get(name)
+
+    def delete(self, name):
+        with self.lock:
+            if name.endswith(".m3u8"):
+                self.playlists.pop(name, None)
+                return
+            data = self.segments.pop(name, None)
+            self.captured.pop(name, None)
+            if data is not None:
+                self.bytes -= len(data)
+
+    def clear(self):
+        with self.lock:
+            self.playlists.clear()
+            self.segments.clear()
+            self.captured.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {"segments": len(self.segments), "playlists": len(self.playlists), "bytes": self.bytes}
+
+def parse_media_playlist(text):
+    """Danh sách (uri, duration) trong một media playlist"""
+    entries = []
+    duration = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXTINF:"):
+            duration = float(line[8:].split(",", 1)[0])
+        elif line and not line.startswith("#") and duration is not None:
+            entries.append((line.rsplit("/", 1)[-1], duration))
+            duration = None
+    return entries
+
+class LowLatencyStore(SegmentStore):
+    """SegmentStore cho LL-HLS
+
+    FFmpeg gửi các đoạn ngắn (HLS_PART_TIME giây, bắt đầu bằng keyframe). Mỗi đoạn là một partial segment;
+    server ghép các part liên tiếp thành segment đầy đủ, tự tạo playlist có EXT-X-PART, EXT-X-PRELOAD-HINT
+    và hỗ trợ blocking playlist reload (_HLS_msn/_HLS_part).
+    """
+
+    def __init__(self, part_target=float(HLS_PART_TIME), segment_target=float(HLS_SEGMENT_TIME),
+                 list_size=int(HLS_LIST_SIZE)):
+        super().__init__()
+        self.part_target = part_target
+        self.segment_target = segment_target
+        self.list_size = list_size
+        self.cond = threading.Condition(self.lock)
+        self.pending = {}                   # part đã nhận nhưng FFmpeg chưa báo độ dài
+        self.parts = OrderedDict()          # tên part -> bytes
+        self.published = set()
+        self.segment_list = []              # [{"msn", "uri", "duration", "parts": [(uri, duration)], "captured_at"}]
+        self.current_parts = []             # Các part của segment đang hình thành
+        self.next_msn = 0
+        self.last_part_index = -1
+        self.playlist = None
+
+    def put(self, name, data):
+        with self.cond:
+            if name == LL_INGEST_PLAYLIST:
+                for uri, duration in parse_media_playlist(data.decode("utf-8", "replace")):
+                    if uri not in self.published and uri in self.pending:
+                        self._publish_part(uri, duration)
+                self._trim()
+                self.playlist = self._render_playlist().encode("utf-8")
+                self.cond.notify_all()
+            elif name.endswith(".m3u8"):
+                return
+            else:
+                self.pending[name] = data
+
+    @staticmethod
+    def _part_index(uri):
+        return int(re.sub(r"\D", "", uri) or 0)
+
+    def _publish_part(self, uri, duration):
+        self.published.add(uri)
+        self.parts[uri] = self.pending.pop(uri)
+        self.current_parts.append((uri, duration))
+        self.last_part_index = max(self.last_part_index, self._part_index(uri))
+        # Đóng segment khi đã đủ độ dài mục tiêu
+        if sum(d for _, d in self.current_parts) >= self.segment_target - self.part_target / 2:
+            data = b"".join(self.parts[u] for u, _ in self.current_parts)
+            uri = f"segment_{self.next_msn}.ts"
+            self.segments[uri] = data
+            self.bytes += len(data)
+            self.segment_list.append({
+                "msn": self.next_msn,
+                "uri": uri,
+                "duration": sum(d for _, d in self.current_parts),
+                "parts": self.current_parts,
+                "captured_at": capture_time(data),
+            })
+            self.next_msn += 1
+            self.current_parts = []
+
+    def _trim(self):
+        """Giữ list_size segment trong playlist và thêm vài segment cho client đang tải chậm"""
+        keep = self.list_size + 2
+        for segment in self.segment_list[:-keep]:
+            data = self.segments.pop(segment["uri"], None)
+            if data is not None:
+                self.bytes -= len(data)
+            for uri, _ in segment["parts"]:
+                self.parts.pop(uri, None)
+                self.published.discard(uri)
+        self.segment_list = self.segment_list[-keep:]
+        if self.segment_list:
+            # Part FFmpeg đã gửi nhưng không bao giờ có trong playlist nội bộ (bị bỏ qua/xóa) và đã cũ hơn cửa sổ
+            oldest = self._part_index(self.segment_list[0]["parts"][0][0])
+            for uri in [uri for uri in self.pending if self._part_index(uri) < oldest]:
+                del self.pending[uri]
+
+    def _render_playlist(self):
+        visible = self.segment_list[-self.list_size:]
+        durations = [s["duration"] for s in visible] or [self.segment_target]
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:6",
+            f"#EXT-X-TARGETDURATION:{max(int(self.segment_target), math.ceil(max(durations)))}",
+            f"#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK={3 * self.part_target:.3f}",
+            f"#EXT-X-PART-INF:PART-TARGET={self.part_target:.3f}",
+            f"#EXT-X-MEDIA-SEQUENCE:{visible[0]['msn'] if visible else self.next_msn}",
+        ]
+        with_parts = {s["msn"] for s in visible[-HLS_LL_PART_SEGMENTS:]}
+        for segment in visible:
+            if segment["captured_at"] is not None:
+                lines.append(f"#EXT-X-PROGRAM-DATE-TIME:{format_program_date_time(segment['captured_at'])}")
+            if segment["msn"] in with_parts:
+                lines += [self._part_line(uri, duration) for uri, duration in segment["parts"]]
+            lines += [f"#EXTINF:{segment['duration']:.3f},", segment["uri"]]
+        lines += [self._part_line(uri, duration) for uri, duration in self.current_parts]
+        lines.append(f'#EXT-X-PRELOAD-HINT:TYPE=PART,URI="part_{self.last_part_index + 1}.ts"')
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _part_line(uri, duration):
+        return f'#EXT-X-PART:DURATION={duration:.3f},URI="{uri}",INDEPENDENT=YES'
+
+    def has_part(self, msn, part):
+        """Segment msn đã hoàn tất, hoặc đang hình thành và đã có part thứ `part`"""
+        if part is None:
+            return msn < self.next_msn
+        return msn < self.next_msn or (msn == self.next_msn and len(self.current_parts) > part)
+
+    def wait_for_part(self, msn, part, timeout):
+        """Blocking playlist reload: chờ tới khi playlist chứa segment/part được yêu cầu"""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.has_part(msn, part), timeout)
+
+    def wait_for_file(self, name, timeout):
+        """Chờ part được gợi ý bởi EXT-X-PRELOAD-HINT"""
+        with self.cond:
+            return self.cond.wait_for(lambda: name in self.parts, timeout)
+
+    def get(self, name):
+        with self.lock:
+            if name == "playlist.m3u8":
+                return self.playlist
+            if name in self.parts:
+                return self.parts[name]
+            return self.segments.get(name)
+
+    def delete(self, name):
+        # Server tự quản lý vòng segment/part
+        pass
+
+    def clear(self):
+        with self.cond:
+            self.playlists.clear()
+            self.segments.clear()
+            self.bytes = 0
+            self.pending.clear()
+            self.parts.clear()
+            self.published.clear()
+            self.segment_list = []
+            self.current_parts = []
+            self.playlist = None
+            self.cond.notify_all()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "segments": len(self.segments),
+                "parts": len(self.parts),
+                "bytes": self.bytes + sum(len(p) for p in self.parts.values()),
+                "media_sequence": self.next_msn,
+                "current_parts": len(self.current_parts),
+            }
+
+class HlsIngestHandler(BaseHTTPRequestHandler):
+    """Nhận playlist/segment FFmpeg gửi bằng PUT và lưu vào SegmentStore của kênh"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _store(self):
+        channel_id, _, name = self.path.lstrip("/").split("?", 1)[0].partition("/")
+        channel = get_channel(channel_id)
+        if channel is None or channel.hls_store is None or not name:
+            return None, None, name
+        return channel, channel.hls_store, name
+
+    def _reply(self, code):
+        self.send_response(code)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_PUT(self):
+        data = read_request_body(self)
+        channel, store, name = self._store()
+        if store is None:
+            self._reply(404)
+            return
+        store.put(name, data)
+        channel.count_traffic("hls_bytes_ingested", len(data))
+        self._reply(201)
+
+    do_POST = do_PUT
+
+    def do_DELETE(self):
+        # FFmpeg gửi DELETE kèm body chunked rỗng trên kết nối persistent: phải đọc hết trước khi trả lời
+        read_request_body(self)
+        _, store, name = self._store()
+        if store is not None:
+            store.delete(name)
+        self._reply(204)
+
+hls_ingest_httpd = None
+hls_ingest_lock = threading.Lock()
+
+def hls_ingest_base(channel_id):
+    """URL gốc FFmpeg dùng để gửi HLS của một kênh vào RAM"""
+    global hls_ingest_httpd
+    with hls_ingest_lock:
+        if hls_ingest_httpd is None:
+            hls_ingest_httpd = start_internal_server(HlsIngestHandler)
+    return f"http://127.0.0.1:{hls_ingest_httpd.server_address[1]}/{channel_id}"
+
+def open_packet_probe(multicast_addr, port):
+    """Socket chờ gói UDP đầu tiên của kênh; None nếu không thể lắng nghe địa chỉ đích này"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if sys.platform == 'darwin':
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        if multicast_addr.startswith('239.') or multicast_addr.startswith('224.'):
+            # Tham gia nhóm như một client bình thường
+            sock.bind(('', int(port)))
+            mreq = struct.pack('4sL', socket.inet_aton(multicast_addr), socket.INADDR_ANY)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        else:
+            # Unicast: chỉ quan sát được nếu đích là địa chỉ của máy này
+            sock.bind((multicast_addr, int(port)))
+        sock.setblocking(False)
+        return sock
+    except OSError:
+        sock.close()
+        return None
+
+def drain_stderr(process, tail):
+    """Đọc stderr của FFmpeg liên tục (tránh đầy pipe làm treo FFmpeg) và giữ các dòng cuối"""
+    for line in iter(process.stderr.readline, b""):
+        tail.append(line.decode("utf-8", "replace").rstrip())
+
+def launch_ffmpeg(command):
+    """Chạy FFmpeg với tiến độ dạng key=value ghi ra stdout (-progress) để đọc liên tục"""
+    command = [command[0], "-progress", "pipe:1", "-nostats", *command[1:]]
+    return subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+def parse_progress_number(value, suffix=""):
+    """Số trong một dòng -progress ("812.3kbits/s", "1.01x", "N/A")"""
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[:-len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+class EncoderTelemetry:
+    """Đọc tiến độ -progress của một tiến trình FFmpeg và giữ lịch sử gần nhất (bộ đệm có giới hạn)"""
+
+    def __init__(self, role, process, history=ENCODER_TELEMETRY_HISTORY):
+        self.role = role                # "multicast", "hls" hoặc "shared"
+        self.pid = process.pid
+        self.samples = deque(maxlen=history)
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._read, args=(process,), daemon=True)
+        self.thread.start()
+
+    def _read(self, process):
+        block = {}
+        for line in iter(process.stdout.readline, b""):
+            key, _, value = line.decode("utf-8", "replace").strip().partition("=")
+            if key != "progress":
+                block[key] = value
+                continue
+            # Mỗi khối kết thúc bằng progress=continue|end
+            sample = {
+                "time": time.time(),
+                "frame": int(block.get("frame", 0) or 0),
+                "fps": parse_progress_number(block.get("fps", "")),
+                "bitrate_kbps": parse_progress_number(block.get("bitrate", ""), "kbits/s"),
+                "total_size": int(parse_progress_number(block.get("total_size", "")) or 0),
+                "out_time": block.get("out_time"),
+                "out_time_seconds": (parse_progress_number(block.get("out_time_us", "")) or 0) / 1e6,
+                "dup_frames": int(block.get("dup_frames", 0) or 0),
+                "drop_frames": int(block.get("drop_frames", 0) or 0),
+                "speed": parse_progress_number(block.get("speed", ""), "x"),
+                "progress": value,
+            }
+            with self.lock:
+                self.samples.append(sample)
+            block = {}
+
+    def latest(self):
+        with self.lock:
+            return self.samples[-1] if self.samples else None
+
+    def recent_speed(self, count=SCHEDULER_SPEED_SAMPLES):
+        """Speed trung bình của count mẫu gần nhất, None nếu chưa có"""
+        with self.lock:
+            speeds = [s["speed"] for s in list(self.samples)[-count:] if s["speed"] is not None]
+        return sum(speeds) / len(speeds) if speeds else None
+
+    def stats(self, history=True):
+        with self.lock:
+            samples = list(self.samples)
+        speeds = [s["speed"] for s in samples if s["speed"] is not None]
+        result = {
+            "role": self.role,
+            "pid": self.pid,
+            "latest": samples[-1] if samples else None,
+            "avg_speed": sum(speeds) / len(speeds) if speeds else None,
+            "min_speed": min(speeds) if speeds else None,
+        }
+        if len(samples) >= 2:
+            # Tốc độ trong cửa sổ lịch sử: khung hình/giây thực, frame bị drop/dup mới phát sinh
+            first, last = samples[0], samples[-1]
+            elapsed = last["time"] - first["time"]
+            result["window_seconds"] = elapsed
+            result["window_fps"] = (last["frame"] - first["frame"]) / elapsed if elapsed > 0 else None
+            result["window_drop_frames"] = last["drop_frames"] - first["drop_frames"]
+            result["window_dup_frames"] = last["dup_frames"] - first["dup_frames"]
+        if history:
+            result["history"] = samples
+        return result
+
+TS_PACKET_SIZE = 188
+TS_PACKETS_PER_DATAGRAM = 7                    # 7 x 188 = 1316 byte, vừa một gói UDP trên Ethernet
+
+def read_pcr(data, offset):
+    """PCR (giây) của gói TS tại offset, None nếu gói không mang PCR"""
+    if data[offset + 3] & 0x20 and data[offset + 4] > 0 and data[offset + 5] & 0x10:
+        b = data[offset + 6:offset + 12]
+        base = (b[0] << 25) | (b[1] << 17) | (b[2] << 9) | (b[3] << 1) | (b[4] >> 7)
+        extension = ((b[4] & 0x01) << 8) | b[5]
+        return (base * 300 + extension) / 27000000.0
+    return None
+
+def index_pcr(path):
+    """PCR của file TS: (danh sách (số thứ tự gói, PCR tính từ đầu file) của PID mang PCR đầu tiên, số gói)
+
+    Đọc file theo khối nên không cần giữ cả file trong RAM.
+    """
+    points = []
+    pcr_pid = None
+    offset_pcr = 0.0
+    previous = None
+    packet_count = 0
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(TS_PACKET_SIZE * TS_PACKETS_PER_DATAGRAM * PACED_CHUNK_DATAGRAMS)
+            if len(data) < TS_PACKET_SIZE:
+                break
+            for offset in range(0, len(data) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+                index = packet_count + offset // TS_PACKET_SIZE
+                pid = ((data[offset + 1] & 0x1F) << 8) | data[offset + 2]
+                if pcr_pid is not None and pid != pcr_pid:
+                    continue
+                pcr = read_pcr(data, offset)
+                if pcr is None:
+                    continue
+                pcr_pid = pid
+                if previous is not None and pcr + offset_pcr < previous:
+                    # PCR quay về (file ghép hoặc tràn 33 bit): nối tiếp thời gian
+                    offset_pcr = previous - pcr
+                previous = pcr + offset_pcr
+                points.append((index, previous))
+            packet_count += len(data) // TS_PACKET_SIZE
+    if len(points) < 2:
+        raise ValueError("TS file has fewer than 2 PCR values")
+    first = points[0][1]
+    return [(index, pcr - first) for index, pcr in points], packet_count
+
+class SendSchedule:
+    """Thời điểm gửi (giây, tính từ đầu lượt phát) của từng datagram 7 gói, nội suy tuyến tính giữa các PCR
+
+    duration là độ dài một lượt phát để nối các vòng lặp liền mạch.
+    """
+
+    def __init__(self, points, packet_count):
+        self.points = points
+        self.packets = [index for index, _ in points]
+        self.packet_count = packet_count
+        self.datagram_count = -(-packet_count // TS_PACKETS_PER_DATAGRAM)
+        self.base = self._time(0)
+        self.duration = self._time(packet_count) - self.base
+
+    def _time(self, packet):
+        # Ngoài khoảng PCR đầu/cuối thì ngoại suy theo tốc độ đoạn gần nhất
+        segment = min(max(bisect.bisect_right(self.packets, packet) - 1, 0), len(self.points) - 2)
+        (p0, t0), (p1, t1) = self.points[segment], self.points[segment + 1]
+        return t0 + (packet - p0) * (t1 - t0) / (p1 - p0)
+
+    def times(self, first, count):
+        """Lịch gửi của các datagram first .. first + count - 1"""
+        return [self._time(datagram * TS_PACKETS_PER_DATAGRAM) - self.base for datagram in range(first, first + count)]
+
+def mark_discontinuity(data, seen):
+    """Đặt discontinuity_indicator (tại chỗ) ở gói có adaptation field đầu tiên của mỗi PID chưa có trong seen
+
+    Dùng cho các vòng lặp sau để bộ giải mã chấp nhận PCR/continuity counter quay về đầu; seen giữ qua các khối.
+    """
+    for offset in range(0, len(data) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+        pid = ((data[offset + 1] & 0x1F) << 8) | data[offset + 2]
+        if pid in seen or pid == 0x1FFF:
+            continue
+        if data[offset + 3] & 0x20 and data[offset + 4] > 0:
+            data[offset + 5] |= 0x80
+            seen.add(pid)
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IOVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+def load_sendmmsg():
+    """Hàm sendmmsg của libc (Linux), None nếu không có"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+class BatchSender:
+    """Gửi nhiều datagram của một buffer trong một lời gọi sendmmsg; dùng send() từng gói nếu không có sendmmsg"""
+
+    def __init__(self, sock, batch_size=PACED_BATCH):
+        self.sock = sock
+        self.sendmmsg = load_sendmmsg()
+        self.syscalls = 0
+        if self.sendmmsg is not None:
+            self.iovecs = (_IOVec * batch_size)()
+            self.messages = (_MMsgHdr * batch_size)()
+            for i in range(batch_size):
+                self.messages[i].msg_hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+                self.messages[i].msg_hdr.msg_iovlen = 1
+
+    def send(self, buffer, address, view, offsets, length):
+        """Gửi các datagram bắt đầu tại offsets (cùng độ dài tối đa length) trong buffer có địa chỉ address"""
+        if self.sendmmsg is None:
+            for offset in offsets:
+                try:
+                    self.sock.send(view[offset:offset + length])
+                except ConnectionRefusedError:
+                    pass
+                self.syscalls += 1
+            return
+        count = len(offsets)
+        for i, offset in enumerate(offsets):
+            self.iovecs[i].iov_base = address + offset
+            self.iovecs[i].iov_len = min(length, len(buffer) - offset)
+        sent = 0
+        while sent < count:
+            result = self.sendmmsg(self.sock.fileno(), ctypes.byref(self.messages[sent]), count - sent, 0)
+            self.syscalls += 1
+            if result < 0:
+                error = ctypes.get_errno()
+                if error in (errno.EINTR, errno.EAGAIN, errno.ENOBUFS):
+                    continue
+                if error == errno.ECONNREFUSED:
+                    # ICMP port unreachable từ đích unicast chưa có ai nghe: bỏ qua như FFmpeg
+                    break
+                raise OSError(error, os.strerror(error))
+            sent += result
+
+# Khóa theo file TS đích: 2 kênh cùng cdn_url thì kênh sau chờ bản encode của kênh trước rồi dùng lại
+paced_ts_locks = {}
+paced_ts_locks_lock = threading.Lock()
+
+def prepare_paced_ts(cdn_url, source_url, passthrough=False):
+    """File .ts cục bộ để phát: dùng thẳng nếu nguồn đã là file .ts, nếu không thì encode một lần và cache lại"""
+    if os.path.isfile(source_url) and source_url.lower().endswith(".ts"):
+        return source_url
+    os.makedirs(PACED_TS_DIR, exist_ok=True)
+    path = os.path.join(PACED_TS_DIR, hashlib.sha1(cdn_url.encode("utf-8")).hexdigest() + ".ts")
+    with paced_ts_locks_lock:
+        lock = paced_ts_locks.setdefault(path, threading.Lock())
+    with lock:
+        if os.path.exists(path):
+            return path
+        copy = passthrough or urllib.parse.urlparse(cdn_url).path.lower().endswith(".ts")
+        # File tạm riêng cho mỗi lần encode, cùng thư mục để os.replace là thao tác nguyên tử
+        fd, tmp_path = tempfile.mkstemp(dir=PACED_TS_DIR, suffix=".ts")
+        os.close(fd)
+        command = [
+            "ffmpeg", "-loglevel", "error", "-nostdin", "-y",
+            "-i", source_url,
+            *(PASSTHROUGH_ARGS if copy else MULTICAST_ENCODE_ARGS),
+            "-f", "mpegts", tmp_path,
+        ]
+        try:
+            result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            if result.returncode != 0:
+                raise RuntimeError(f"Encoding {cdn_url} to TS failed: "
+                                   f"{result.stderr.decode('utf-8', 'replace').strip()}")
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path
+
+class PacedTSSender:
+    """Phát file MPEG-TS đã encode sẵn tới nhóm multicast, giãn gói theo PCR và lặp lại không encode
+
+    Có giao diện giống subprocess.Popen (poll/terminate/wait) để Channel quản lý như tiến trình FFmpeg multicast.
+    """
+
+    pid = None
+
+    def __init__(self, ts_path, multicast_addr, port, ttl, loop=True):
+        self.ts_path = ts_path          # File TS đã có sẵn (prepare_paced_ts), không encode trong luồng phát
+        self.address = (multicast_addr, int(port))
+        self.ttl = int(ttl)
+        self.loop = loop
+        self.returncode = None
+        self.error = ""
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.datagrams = 0
+        self.bytes = 0
+        self.loops = 0
+        self.cpu_seconds = 0.0
+        self.lateness = deque(maxlen=PACED_LATENESS_SAMPLES)   # Độ trễ so với lịch PCR (giây) của từng lần gửi
+        self.batch_sender = None
+        self.started_at = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _open_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, PACED_SNDBUF)
+        sock.connect(self.address)
+        return sock
+
+    def _read_ahead(self, schedule, chunks):
+        """Luồng đọc trước: chuẩn bị từng khối (dữ liệu, lịch gửi, discontinuity) cho luồng phát qua chunks"""
+        datagram = TS_PACKET_SIZE * TS_PACKETS_PER_DATAGRAM
+        loop = 0
+        try:
+            while not self.stop_event.is_set():
+                # Vòng lặp sau đánh dấu discontinuity ở đầu mỗi PID
+                seen = set() if loop else None
+                first = 0
+                with open(self.ts_path, "rb") as f:
+                    while first < schedule.datagram_count and not self.stop_event.is_set():
+                        buffer = bytearray(f.read(datagram * PACED_CHUNK_DATAGRAMS))
+                        del buffer[len(buffer) - len(buffer) % TS_PACKET_SIZE:]
+                        if not buffer:
+                            break
+                        if seen is not None:
+                            mark_discontinuity(buffer, seen)
+                        count = -(-len(buffer) // datagram)
+                        address = ctypes.addressof((ctypes.c_char * len(buffer)).from_buffer(buffer))
+                        item = (loop, buffer, address, memoryview(buffer), schedule.times(first, count),
+                                [i * datagram for i in range(count)])
+                        self._put(chunks, item)
+                        first += count
+                loop += 1
+                if not self.loop:
+                    break
+            self._put(chunks, None)
+        except Exception as e:
+            self._put(chunks, e)
+
+    def _put(self, chunks, item):
+        while not self.stop_event.is_set():
             try:
-                ffmpeg_process.wait(timeout=3)
-            except subprocess.TimeoutExpired:
-                ffmpeg_process.kill()
-            message.append("Multicast stream stopped")
+                chunks.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                continue
+
+    def _run(self):
+        sock = None
+        try:
+            # Chỉ giữ lại vị trí các PCR, không giữ dữ liệu file
+            schedule = SendSchedule(*index_pcr(self.ts_path))
+            chunks = queue.Queue(PACED_READ_AHEAD)
+            threading.Thread(target=self._read_ahead, args=(schedule, chunks), daemon=True).start()
+            length = TS_PACKET_SIZE * TS_PACKETS_PER_DATAGRAM
+            sock = self._open_socket()
+            self.batch_sender = BatchSender(sock)
+            cpu_start = time.thread_time()
+            self.started_at = time.time()
+            start = time.perf_counter()
+            while not self.stop_event.is_set():
+                try:
+                    item = chunks.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+                if item is None:
+                    self.loops += 1
+                    break
+                loop, buffer, address, view, times, offsets = item
+                self.loops = loop
+                pass_start = start + loop * schedule.duration
+                index = 0
+                while index < len(times) and not self.stop_event.is_set():
+                    now = time.perf_counter()
+                    due = pass_start + times[index]
+                    if due > now + PACED_SLACK:
+                        time.sleep(due - now - PACED_SLACK / 2)
+                        continue
+                    # Gửi mọi datagram đã tới hạn (trong khoảng PACED_SLACK) trong một lời gọi
+                    end = index + 1
+                    limit = min(len(times), index + PACED_BATCH)
+                    while end < limit and pass_start + times[end] <= now + PACED_SLACK:
+                        end += 1
+                    self.batch_sender.send(buffer, address, view, offsets[index:end], length)
+                    sent_at = time.perf_counter()
+                    with self.lock:
+                        self.lateness.append(sent_at - due)
+                        self.datagrams += end - index
+                        self.bytes += min(len(buffer), offsets[end - 1] + length) - offsets[index]
+                        self.cpu_seconds = time.thread_time() - cpu_start
+                    index = end
+            self.returncode = 0
         except Exception as e:
-            success = False
-            message.append(f"Error stopping multicast: {e}")
+            self.error = str(e)
+            print(f"Paced sender error: {e}", file=sys.stderr)
+            self.returncode = 1
         finally:
-            ffmpeg_process = None
-    
-    # Dừng HLS process
-    if hls_process:
+            self.stop_event.set()
+            if sock is not None:
+                sock.close()
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        self.stop_event.set()
+
+    kill = terminate
+
+    def wait(self, timeout=None):
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            raise subprocess.TimeoutExpired("paced sender", timeout)
+        return self.returncode
+
+    def stats(self, history=True):
+        with self.lock:
+            lateness = sorted(self.lateness)
+            elapsed = time.time() - self.started_at if self.started_at else 0
+            result = {
+                "role": "multicast",
+                "sender": "paced",
+                "ts_path": self.ts_path,
+                "datagrams": self.datagrams,
+                "bytes": self.bytes,
+                "loops": self.loops,
+                "syscalls": self.batch_sender.syscalls if self.batch_sender else 0,
+                "sendmmsg": self.batch_sender is not None and self.batch_sender.sendmmsg is not None,
+                "bitrate_kbps": self.bytes * 8 / elapsed / 1000 if elapsed > 0 else None,
+                "cpu_seconds": self.cpu_seconds,
+                "cpu_percent": 100.0 * self.cpu_seconds / elapsed if elapsed > 0 else None,
+            }
+        if lateness:
+            # Độ lệch thời điểm gửi so với lịch PCR (jitter phía gửi)
+            result["lateness_ms"] = {
+                "p50": 1000 * lateness[len(lateness) // 2],
+                "p99": 1000 * lateness[min(len(lateness) - 1, int(len(lateness) * 0.99))],
+                "max": 1000 * lateness[-1],
+            }
+        return result
+
+def stop_process(process):
+    """Dừng một tiến trình FFmpeg, kill nếu không tự thoát sau 3 giây"""
+    process.terminate()
+    try:
+        process.wait(timeout=3)
+    except subprocess.TimeoutExpired:
+        process.kill()
         try:
-            hls_process.terminate()
+            process.wait(timeout=3)
+        except subprocess.TimeoutExpired:
+            pass
+
+def source_pixel_scale(probe):
+    """Số điểm ảnh của nguồn so với 720p (1.0 nếu probe không có độ phân giải)"""
+    video = probe.get("video") if probe else None
+    if not video or not video.get("width") or not video.get("height"):
+        return 1.0
+    return video["width"] * video["height"] / SCHEDULER_REFERENCE_PIXELS
+
+def estimate_channel_cost(pipeline, passthrough, ladder, multicast_sender, probe):
+    """Số core một kênh cần để chạy 1.0x realtime, ước lượng theo profile encode và độ phân giải nguồn"""
+    costs = SCHEDULER_COSTS
+    scale = source_pixel_scale(probe)
+    # Rendition ladder: chi phí encode theo độ phân giải của rendition (16:9), không theo nguồn
+    renditions = costs["audio"] * len(ladder) + sum(
+        costs["ladder_encode"] * HLS_RENDITIONS[name]["height"] ** 2 * 16 / 9 / SCHEDULER_REFERENCE_PIXELS
+        for name in ladder if HLS_RENDITIONS[name]["height"])
+    multicast_encode = (costs["decode"] + costs["multicast_encode"]) * scale + costs["audio"]
+    if pipeline == "shared":
+        if ladder:
+            return multicast_encode + renditions
+        return costs["remux"] if passthrough else multicast_encode
+    if multicast_sender == "paced":
+        multicast = costs["paced"]
+    else:
+        multicast = costs["remux"] if "multicast" in passthrough else multicast_encode
+    if ladder:
+        hls = costs["decode"] * scale + renditions
+    elif "hls" in passthrough:
+        hls = costs["remux"]
+    else:
+        hls = (costs["decode"] + costs["hls_encode"]) * scale + costs["audio"]
+    return multicast + hls
+
+def process_cpu_seconds(pid):
+    """Tổng thời gian CPU (user + system) của một tiến trình từ /proc, None nếu không đọc được"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Tên tiến trình có thể chứa dấu cách: các trường sau dấu ')' cuối cùng
+            fields = f.read().rpartition(")")[2].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+class CapacityScheduler:
+    """Kiểm soát tải CPU của các kênh
+
+    Mỗi kênh giữ chỗ một số core ước lượng theo profile encode; khi kênh chạy, chi phí được thay bằng
+    số đo thực (CPU của tiến trình / speed FFmpeg, tức số core cần để đạt 1.0x). Kênh mới bị từ chối
+    hoặc xếp hàng nếu tổng chi phí vượt SCHEDULER_CPU_TARGET số core, hoặc đã có encoder dưới realtime.
+    """
+
+    def __init__(self, cores=None, target=SCHEDULER_CPU_TARGET):
+        if cores is None:
+            cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") \
+                else list(range(os.cpu_count() or 1))
+        self.cores = cores
+        self.capacity = len(cores) * target     # Headroom tối đa (số core) khi không có kênh nào
+        self.pinning = SCHEDULER_PIN_CORES and hasattr(os, "sched_setaffinity")
+        self.core_load = {core: 0.0 for core in cores}
+        self.allocations = {}                   # channel_id -> chi phí, tập core, số đo
+        self.learned = {}                       # profile -> chi phí đo được (EWMA), cho kênh mới cùng profile
+        self.queue = []                         # Kênh chờ capacity (FIFO)
+        self.server_sample = None               # (time, CPU) của process server lần đo trước
+        self.server_cost = 0.0                  # Core dùng bởi server (HTTP, ingest HLS), không tính bộ phát paced
+        self.draining = None                    # Kênh đầu hàng đợi đang được khởi động lại
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def _used(self):
+        return self.server_cost + sum(a["cost"] for a in self.allocations.values())
+
+    def _slow_channels(self):
+        return sorted(channel_id for channel_id, a in self.allocations.items() if a["slow"])
+
+    def _assign_cores(self, allocation):
+        """Chọn các core ít tải nhất, đủ để chi phí kênh không vượt SCHEDULER_CPU_TARGET mỗi core"""
+        for core in allocation["cores"]:
+            self.core_load[core] -= allocation["share"]
+        count = min(len(self.cores), max(1, math.ceil(allocation["cost"] / SCHEDULER_CPU_TARGET)))
+        cores = sorted(self.cores, key=lambda core: (self.core_load[core], core))[:count]
+        allocation["share"] = allocation["cost"] / count
+        for core in cores:
+            self.core_load[core] += allocation["share"]
+        changed = sorted(cores) != sorted(allocation["cores"])
+        allocation["cores"] = sorted(cores)
+        return changed
+
+    def _pin(self, allocation):
+        if not self.pinning:
+            return
+        for pid in allocation["pids"]:
             try:
-                hls_process.wait(timeout=3)
-            except subprocess.TimeoutExpired:
-                hls_process.kill()
-            message.append("HLS stream stopped")
+                os.sched_setaffinity(pid, allocation["cores"])
+            except OSError:
+                pass                            # Tiến trình đã thoát
+
+    def _release(self, channel_id):
+        allocation = self.allocations.pop(channel_id, None)
+        if allocation is not None:
+            for core in allocation["cores"]:
+                self.core_load[core] -= allocation["share"]
+
+    def _ensure_thread(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def admit(self, channel, profile, estimate, queue_args=None):
+        """("start" | "queue" | "refuse", lý do); "start" giữ chỗ chi phí và tập core cho kênh
+
+        queue_args: tham số Channel.start để khởi động lại kênh khi có chỗ (None = từ chối nếu hết chỗ).
+        """
+        with self.lock:
+            self._ensure_thread()
+            self._release(channel.id)
+            cost = self.learned.get(profile, estimate)
+            headroom = self.capacity - self._used()
+            slow = self._slow_channels()
+            waiting = [e for e in self.queue if e["channel"] is not channel]
+            queued = next((e for e in self.queue if e["channel"] is channel), None)
+            # Kênh duy nhất luôn được chạy: chi phí ước lượng có thể sai, số đo thực sẽ quyết định các kênh sau
+            fits = not self.allocations or (cost <= headroom and not slow)
+            if fits and (not waiting or self.draining == channel.id):
+                if queued is not None:
+                    self.queue.remove(queued)
+                allocation = {"profile": profile, "estimate": cost, "cost": cost, "measured": None, "speed": None,
+                              "slow": False, "cores": [], "share": 0.0, "pids": [], "cpu": {},
+                              "launched": False, "admitted_at": time.time()}
+                self._assign_cores(allocation)
+                self.allocations[channel.id] = allocation
+                return "start", ""
+            if slow:
+                reason = f"Encoders below {SCHEDULER_MIN_SPEED}x realtime on channel {', '.join(slow)}"
+            elif not fits:
+                reason = (f"Not enough CPU headroom: channel needs ~{cost:.2f} cores, "
+                          f"{max(headroom, 0.0):.2f} of {self.capacity:.2f} left")
+            else:
+                reason = f"{len(waiting)} channel(s) already waiting for CPU capacity"
+            if queue_args is None:
+                if queued is not None:
+                    self.queue.remove(queued)
+                return "refuse", reason
+            if queued is None:
+                self.queue.append({"channel": channel, "args": queue_args, "profile": profile,
+                                   "cost": cost, "queued_at": time.time(), "reason": reason})
+            else:
+                queued.update(args=queue_args, profile=profile, cost=cost, reason=reason)
+            return "queue", reason
+
+    def refine(self, channel_id, profile, estimate):
+        """Cập nhật chỗ đã giữ khi biết profile thực của kênh (sau probe nguồn), nếu chưa có số đo"""
+        with self.lock:
+            allocation = self.allocations.get(channel_id)
+            if allocation is None or allocation["measured"] is not None:
+                return
+            cost = self.learned.get(profile, estimate)
+            allocation.update(profile=profile, estimate=cost, cost=cost)
+            self._assign_cores(allocation)
+
+    def launched(self, channel_id, processes):
+        """Gán tập core cho các tiến trình FFmpeg vừa khởi chạy của kênh"""
+        with self.lock:
+            allocation = self.allocations.get(channel_id)
+            if allocation is None:
+                return
+            # Bộ phát paced là luồng trong process server, không gán core riêng
+            allocation["pids"] = [p.pid for p in processes if not isinstance(p, PacedTSSender)]
+            allocation["launched"] = True
+            self._pin(allocation)
+
+    def release(self, channel_id):
+        """Trả lại chỗ của kênh đã dừng (hoặc bỏ khỏi hàng đợi)"""
+        with self.lock:
+            self._release(channel_id)
+            self.queue = [e for e in self.queue if e["channel"].id != channel_id]
+
+    def _measure(self, allocation, channel, now):
+        """Chi phí thực của kênh: tổng CPU/speed các tiến trình (None khi chưa đủ số đo)"""
+        demand, speeds, complete = 0.0, [], True
+        for telemetry in channel.telemetry:
+            if isinstance(telemetry, PacedTSSender):
+                key, cpu, speed = "paced", telemetry.cpu_seconds, 1.0
+            else:
+                key, cpu, speed = telemetry.pid, process_cpu_seconds(telemetry.pid), telemetry.recent_speed()
+            previous = allocation["cpu"].get(key)
+            allocation["cpu"][key] = (now, cpu)
+            if speed is not None:
+                speeds.append(speed)
+            if cpu is None or previous is None or previous[1] is None or now <= previous[0]:
+                complete = False
+                continue
+            rate = (cpu - previous[1]) / (now - previous[0])
+            if key == "paced":
+                allocation["thread_cost"] = rate
+            # Encoder chậm hơn realtime cần thêm CPU theo tỉ lệ 1/speed để đạt 1.0x
+            demand += rate / min(max(speed, 0.1), 1.0) if speed else rate
+        allocation["speed"] = min(speeds) if speeds else None
+        return demand if complete and channel.telemetry else None
+
+    def refresh(self):
+        """Đo CPU (/proc) và speed từng kênh, cập nhật chi phí, profile đã học và tập core"""
+        now = time.time()
+        server_cpu = time.process_time()
+        with channels_lock:
+            known = dict(channels)
+        with self.lock:
+            paced_cost = 0.0
+            for channel_id, allocation in list(self.allocations.items()):
+                channel = known.get(channel_id)
+                if channel is None or (allocation["launched"] and (not channel.running or channel.state == "failed")):
+                    self._release(channel_id)
+                    continue
+                if not allocation["launched"]:
+                    continue
+                measured = self._measure(allocation, channel, now)
+                warm = channel.started_at is not None and now - channel.started_at >= SCHEDULER_WARMUP
+                allocation["slow"] = warm and allocation["speed"] is not None and \
+                    allocation["speed"] < SCHEDULER_MIN_SPEED
+                # CPU của bộ phát paced nằm trong process server: tính cho kênh, không tính cho server
+                paced_cost += allocation.get("thread_cost", 0.0)
+                if measured is None or not warm:
+                    continue
+                alpha = SCHEDULER_SMOOTHING
+                allocation["measured"] = measured if allocation["measured"] is None \
+                    else (1 - alpha) * allocation["measured"] + alpha * measured
+                allocation["cost"] = allocation["measured"]
+                learned = self.learned.get(allocation["profile"])
+                self.learned[allocation["profile"]] = measured if learned is None \
+                    else (1 - alpha) * learned + alpha * measured
+                if self._assign_cores(allocation):
+                    self._pin(allocation)
+            if self.server_sample is not None and now > self.server_sample[0]:
+                rate = (server_cpu - self.server_sample[1]) / (now - self.server_sample[0])
+                self.server_cost = max(0.0, rate - paced_cost)
+            self.server_sample = (now, server_cpu)
+
+    def _drain(self):
+        """Khởi động kênh đầu hàng đợi khi đủ headroom; hủy kênh chờ quá SCHEDULER_QUEUE_TIMEOUT"""
+        with self.lock:
+            now = time.time()
+            expired = [e for e in self.queue if now - e["queued_at"] > SCHEDULER_QUEUE_TIMEOUT]
+            self.queue = [e for e in self.queue if e not in expired]
+            head = self.queue[0] if self.queue else None
+            if head is not None:
+                cost = self.learned.get(head["profile"], head["cost"])
+                if self.allocations and (cost > self.capacity - self._used() or self._slow_channels()):
+                    head = None
+            self.draining = head["channel"].id if head else None
+        for entry in expired:
+            entry["channel"].expire_queue()
+        if head is not None:
+            try:
+                head["channel"].start(**head["args"])
+            finally:
+                with self.lock:
+                    self.draining = None
+
+    def _run(self):
+        while True:
+            time.sleep(SCHEDULER_INTERVAL)
+            try:
+                self.refresh()
+                self._drain()
+            except Exception as e:
+                print(f"Scheduler error: {e}", file=sys.stderr)
+
+    def allocation(self, channel_id):
+        """Chi phí và tập core của một kênh (None nếu kênh không giữ chỗ)"""
+        with self.lock:
+            allocation = self.allocations.get(channel_id)
+            if allocation is None:
+                return None
+            return {key: allocation[key] for key in ("estimate", "cost", "measured", "speed", "slow", "cores")}
+
+    def snapshot(self):
+        """Headroom hiện tại/tối đa (số core), chi phí từng kênh và hàng đợi"""
+        with self.lock:
+            used = self._used()
+            headroom = self.capacity - used
+            now = time.time()
+            return {
+                "enabled": SCHEDULER_ENABLED,
+                "cores": self.cores,
+                "cpu_target": SCHEDULER_CPU_TARGET,
+                "pinning": self.pinning,
+                "max_headroom_cores": self.capacity,
+                "used_cores": used,
+                "server_cores": self.server_cost,
+                "headroom_cores": headroom,
+                # Speed dự kiến khi mọi kênh cùng cần CPU: dưới 1.0 là máy không chạy nổi realtime
+                "projected_speed": min(1.0, len(self.cores) / used) if used > 0 else 1.0,
+                "slow_channels": self._slow_channels(),
+                "core_load": {str(core): load for core, load in self.core_load.items()},
+                "channels": {channel_id: {**{key: a[key] for key in ("estimate", "cost", "measured", "speed",
+                                                                     "slow", "cores", "pids")},
+                                          # Số kênh cùng profile còn chạy thêm được / tối đa trên máy trống
+                                          "additional_like_this": max(0, math.floor(headroom / a["cost"]))
+                                          if a["cost"] > 0 else None,
+                                          "max_like_this": math.floor(self.capacity / a["cost"])
+                                          if a["cost"] > 0 else None}
+                             for channel_id, a in self.allocations.items()},
+                "queue": [{"channel_id": e["channel"].id, "cost": e["cost"], "reason": e["reason"],
+                           "waiting_seconds": now - e["queued_at"]} for e in self.queue],
+            }
+
+scheduler = CapacityScheduler()
+
+class Channel:
+    """Một kênh phát: nguồn CDN, nhóm multicast, thư mục HLS và các tiến trình FFmpeg riêng"""
+
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.hls_dir = os.path.abspath(os.path.join(HLS_OUTPUT_DIR, channel_id))
+        self.cdn_url = None
+        self.multicast_addr = None
+        self.port = None
+        self.ttl = None
+        self.pipeline = DEFAULT_PIPELINE
+        self.use_cache = SOURCE_CACHE_ENABLED
+        self.source_url = None          # URL/file FFmpeg thực sự đọc (cache hoặc CDN)
+        self.storage = HLS_STORAGE
+        self.hls_store = None           # SegmentStore khi storage == "memory"
+        self.hls_mode = DEFAULT_HLS_MODE
+        self.ladder = []                # Các rendition ABR, rỗng = một rendition
+        self.source_probe = None        # Kết quả probe codec của nguồn
+        self.passthrough = []           # Các đầu ra chỉ remux, không encode lại
+        self.multicast_sender = DEFAULT_MULTICAST_SENDER
+        self.fec = None                 # (L, D) của FEC SMPTE 2022-1, None = UDP thô không FEC
+        self.ffmpeg_process = None
+        self.hls_process = None
+        self.started_at = None
+        self.state = "stopped"          # stopped -> (queued) -> starting -> ready -> degraded -> failed
+        self.state_message = ""
+        self.first_packet_at = None
+        self.first_segment_at = None
+        self.stderr_tails = {}          # pid -> các dòng stderr cuối
+        self.telemetry = []             # EncoderTelemetry cho từng tiến trình FFmpeg
+        self.monitor_stop = None        # Event dừng luồng khởi động/theo dõi của lần start hiện tại
+        self.preparing = False          # Luồng nền đang kiểm tra cache nguồn và probe, chưa chạy FFmpeg
+        self.traffic = {"hls_requests": 0, "hls_bytes_served": 0, "hls_bytes_ingested": 0}
+        self.traffic_lock = threading.Lock()
+        self.disk_captured = {}             # segment trên đĩa -> giờ capture (file không đổi sau khi vào playlist)
+        self.lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.ffmpeg_process is not None or self.hls_process is not None or self.preparing
+
+    def start(self, cdn_url, multicast_addr, port, ttl, pipeline=DEFAULT_PIPELINE, cache=SOURCE_CACHE_ENABLED,
+              storage=HLS_STORAGE, hls_mode=DEFAULT_HLS_MODE, ladder=DEFAULT_HLS_LADDER,
+              passthrough=DEFAULT_PASSTHROUGH, multicast_sender=DEFAULT_MULTICAST_SENDER,
+              admission=DEFAULT_SCHEDULER_ADMISSION, fec=DEFAULT_MULTICAST_FEC):
+        # Tham số để scheduler khởi động lại kênh khi được xếp hàng
+        start_args = dict(cdn_url=cdn_url, multicast_addr=multicast_addr, port=port, ttl=ttl, pipeline=pipeline,
+                          cache=cache, storage=storage, hls_mode=hls_mode, ladder=ladder, passthrough=passthrough,
+                          multicast_sender=multicast_sender, admission=admission, fec=fec)
+        with self.lock:
+            if self.running and self.state != "failed":
+                return False, "Streaming is already running."
+            if self.running:
+                # Lần chạy trước đã hỏng: dọn tiến trình cũ rồi khởi động lại
+                self._discard_processes()
+            if pipeline not in PIPELINE_MODES:
+                return False, f"Unknown pipeline mode: {pipeline}"
+            if storage not in HLS_STORAGE_MODES:
+                return False, f"Unknown HLS storage: {storage}"
+            if multicast_sender not in MULTICAST_SENDERS:
+                return False, f"Unknown multicast sender: {multicast_sender}"
+            if multicast_sender == "paced" and pipeline == "shared":
+                return False, "The paced multicast sender requires pipeline=separate."
+            if passthrough not in PASSTHROUGH_MODES:
+                return False, f"Unknown passthrough mode: {passthrough}"
+            if admission not in SCHEDULER_ADMISSION_MODES:
+                return False, f"Unknown admission mode: {admission}"
+            if hls_mode not in HLS_MODES:
+                return False, f"Unknown HLS mode: {hls_mode}"
+            if hls_mode == "ll" and storage != "memory":
+                # Playlist LL-HLS do server tự sinh từ các part trong RAM
+                return False, "Low-latency HLS requires memory storage."
+            try:
+                ladder = parse_ladder(ladder) if isinstance(ladder, str) else list(ladder or [])
+            except ValueError as e:
+                return False, str(e)
+            if ladder and hls_mode == "ll":
+                return False, "Rendition ladder is not supported with low-latency HLS."
+            try:
+                fec = parse_fec(fec) if isinstance(fec, str) else fec
+            except ValueError as e:
+                return False, str(e)
+            if fec and multicast_sender == "paced":
+                return False, "FEC requires multicast_sender=ffmpeg."
+
+            self.cdn_url = cdn_url
+            self.multicast_addr = multicast_addr
+            self.port = str(port)
+            self.ttl = ttl
+            self.pipeline = pipeline
+            self.use_cache = cache
+            self.storage = storage
+            self.hls_mode = hls_mode
+            self.ladder = ladder
+            self.multicast_sender = multicast_sender
+            self.fec = fec
+
+            # Kiểm tra xem địa chỉ có phải là multicast không
+            is_multicast = multicast_addr.startswith('239.') or multicast_addr.startswith('224.')
+            is_local = multicast_addr.startswith('127.')
+            
+            # In thông tin địa chỉ cho debug
+            print(f"[{self.id}] Stream address: {multicast_addr}", file=sys.stderr)
+            print(f"[{self.id}] Is multicast: {is_multicast}", file=sys.stderr)
+            print(f"[{self.id}] Is localhost: {is_local}", file=sys.stderr)
+            print(f"[{self.id}] Pipeline mode: {pipeline}", file=sys.stderr)
+            print(f"[{self.id}] HLS mode: {hls_mode}", file=sys.stderr)
+            if ladder:
+                print(f"[{self.id}] Rendition ladder: {', '.join(ladder)}", file=sys.stderr)
+            if fec:
+                print(f"[{self.id}] FEC: {fec[0]}x{fec[1]} (RTP)", file=sys.stderr)
+            
+            # Kiểm tra cache nguồn (request tới CDN) và probe codec mất tới vài chục giây: làm trong luồng nền để
+            # /start trả về ngay. Scheduler dùng probe đã cache, nếu chưa có thì ước lượng theo tham số encode
+            # (encode lại ở 720p) và cập nhật khi có kết quả probe
+            self.source_url = None
+            self.source_probe = cached_probe(cdn_url)
+            self.passthrough = self._passthrough_for(self.source_probe, passthrough)
+
+            if SCHEDULER_ENABLED:
+                # Chỉ khởi động khi còn đủ CPU để mọi kênh chạy realtime
+                profile, estimate = self._capacity_profile()
+                decision, reason = scheduler.admit(self, profile, estimate,
+                                                   start_args if admission == "queue" else None)
+                if decision == "refuse":
+                    self._set_state("stopped", reason)
+                    return False, f"{SCHEDULER_REFUSED}: {reason}"
+                if decision == "queue":
+                    self._set_state("queued", reason)
+                    return True, f"Channel queued until CPU capacity is available: {reason}"
+
+            self.preparing = True
+            self.monitor_stop = threading.Event()
+            self._set_state("starting", "Resolving the source (cache, probe)")
+            threading.Thread(target=self._prepare, args=(cdn_url, cache, passthrough, self.monitor_stop),
+                             daemon=True).start()
+            if pipeline == "shared":
+                return True, "Streaming is starting (shared encode for Multicast and HLS)."
+            return True, "Streaming is starting (both Multicast and HLS)."
+
+    def _passthrough_for(self, probe, passthrough):
+        """Các đầu ra chỉ remux theo kết quả probe (ladder luôn phải encode)"""
+        # Nguồn đã là H.264/AAC với GOP ngắn thì chỉ remux, không encode lại
+        outputs = passthrough_outputs(probe, self.hls_mode == "ll") \
+            if not self.ladder and passthrough == "auto" else set()
+        if self.pipeline == "shared" and outputs != {"multicast", "hls"}:
+            # Một tiến trình cho cả 2 đầu ra: chỉ remux khi cả 2 cùng tương thích
+            outputs = set()
+        return sorted(outputs)
+
+    def _capacity_profile(self):
+        """Profile (khóa của chi phí đã học) và chi phí ước lượng của kênh cho scheduler"""
+        video = (self.source_probe or {}).get("video") or {}
+        profile = (self.pipeline, tuple(self.passthrough), tuple(self.ladder), self.hls_mode, self.multicast_sender,
+                   video.get("width"), video.get("height"))
+        return profile, estimate_channel_cost(self.pipeline, self.passthrough, self.ladder, self.multicast_sender,
+                                              self.source_probe)
+
+    def _prepare(self, cdn_url, cache, passthrough, stop_event):
+        """Luồng nền của start(): cache nguồn, probe, chọn passthrough rồi chạy FFmpeg và theo dõi kênh"""
+        paced_ts = None
+        try:
+            # Đọc nguồn qua cache cục bộ để các lần loop không kéo lại từ CDN
+            source_url = get_source_cache().source_for(cdn_url) if cache else cdn_url
+            # Chỉ probe khi cần chọn passthrough (kết quả cache theo cdn_url, scheduler dùng lại cho lần start sau);
+            # không có probe thì scheduler ước lượng theo tham số encode, số đo thực sẽ thay thế sau khi chạy
+            source_probe = probe_source(cdn_url, source_url) if passthrough == "auto" else cached_probe(cdn_url)
+            outputs = self._passthrough_for(source_probe, passthrough)
+            if self.multicast_sender == "paced":
+                # Encode một lần ra file TS (có thể lâu) ở đây, không phải trong luồng phát
+                paced_ts = prepare_paced_ts(cdn_url, source_url, "multicast" in outputs)
+        except Exception as e:
+            source_url, source_probe, error = None, None, e
+        else:
+            error = None
+        with self.lock:
+            if stop_event.is_set():
+                # Kênh đã bị dừng (hoặc khởi động lại) trong lúc chuẩn bị
+                return
+            self.preparing = False
+            if error is not None:
+                scheduler.release(self.id)
+                self._set_state("failed", f"Error preparing source: {error}")
+                return
+            self.source_url = source_url
+            self.source_probe = source_probe
+            print(f"[{self.id}] Source: {source_url}", file=sys.stderr)
+            self.passthrough = outputs
+            print(f"[{self.id}] Passthrough: {', '.join(self.passthrough) or 'none'}", file=sys.stderr)
+            if SCHEDULER_ENABLED:
+                scheduler.refine(self.id, *self._capacity_profile())
+            launched = self._launch(paced_ts)
+        if launched is not None:
+            self._monitor(*launched, stop_event)
+
+    def _launch(self, paced_ts=None):
+        """Tạo nơi chứa HLS và chạy các tiến trình FFmpeg (gọi khi giữ self.lock); (processes, probe) hoặc None"""
+        pipeline, ladder, outputs, source_url = self.pipeline, self.ladder, set(self.passthrough), self.source_url
+        low_latency = self.hls_mode == "ll"
+        multicast_url = build_multicast_url(self.multicast_addr, self.port, self.ttl, self.fec)
+        if self.storage == "memory":
+            # FFmpeg gửi segment qua HTTP PUT, không ghi đĩa
+            self.hls_store = LowLatencyStore() if low_latency else SegmentStore()
+            hls_base = hls_ingest_base(self.id)
+        else:
+            # Đảm bảo thư mục HLS tồn tại và trống
+            ensure_hls_dir(self.hls_dir)
+            hls_base = self.hls_dir
+
+        # Mở trước khi chạy FFmpeg để không bỏ lỡ gói đầu tiên
+        probe = open_packet_probe(self.multicast_addr, self.port)
+
+        try:
+            if pipeline == "shared" and ladder:
+                # Một tiến trình: decode một lần cho multicast và mọi rendition HLS
+                print(f"[{self.id}] Starting shared multicast + HLS ladder stream...", file=sys.stderr)
+                self.ffmpeg_process = launch_ffmpeg(build_ladder_command(source_url, hls_base, ladder, multicast_url,
+                                                                         self.fec))
+                self.hls_process = self.ffmpeg_process
+            elif pipeline == "shared":
+                # Một tiến trình duy nhất: chỉ kéo CDN và encode một lần
+                print(f"[{self.id}] Starting shared multicast + HLS stream...", file=sys.stderr)
+                self.ffmpeg_process = launch_ffmpeg(build_shared_command(source_url, multicast_url, hls_base,
+                                                                         low_latency, bool(outputs), self.fec))
+                self.hls_process = self.ffmpeg_process
+            else:
+                if self.multicast_sender == "paced":
+                    # Phát file TS (encode một lần) theo nhịp PCR, lặp lại không encode
+                    print(f"[{self.id}] Starting paced multicast sender...", file=sys.stderr)
+                    self.ffmpeg_process = PacedTSSender(paced_ts, self.multicast_addr, self.port, self.ttl).start()
+                else:
+                    # Khởi chạy FFmpeg cho multicast
+                    print(f"[{self.id}] Starting multicast stream...", file=sys.stderr)
+                    self.ffmpeg_process = launch_ffmpeg(build_multicast_command(source_url, multicast_url,
+                                                                                "multicast" in outputs, self.fec))
+
+                # Khởi chạy FFmpeg cho HLS
+                print(f"[{self.id}] Starting HLS stream...", file=sys.stderr)
+                if ladder:
+                    hls_command = build_ladder_command(source_url, hls_base, ladder)
+                else:
+                    hls_command = build_hls_command(source_url, hls_base, low_latency, "hls" in outputs)
+                self.hls_process = launch_ffmpeg(hls_command)
+
+            # Mốc thời gian FFmpeg bắt đầu đọc nguồn (-re), dùng để đo độ trễ
+            self.started_at = time.time()
+            self.first_packet_at = None
+            self.first_segment_at = None
+            self._set_state("starting", "Waiting for the first UDP packet and HLS segment")
+
+            # Không chờ ở đây: luồng theo dõi chuyển trạng thái khi có gói UDP và segment đầu tiên
+            processes = [self.ffmpeg_process] if self.hls_process is self.ffmpeg_process \
+                else [self.ffmpeg_process, self.hls_process]
+            self.stderr_tails = {}
+            roles = ["shared"] if len(processes) == 1 else ["multicast", "hls"]
+            self.telemetry = []
+            for role, process in zip(roles, processes):
+                if isinstance(process, PacedTSSender):
+                    # Bộ phát Python tự thống kê (không có stderr/-progress)
+                    self.telemetry.append(process)
+                    continue
+                self.stderr_tails[process.pid] = deque(maxlen=CHANNEL_STDERR_LINES)
+                threading.Thread(target=drain_stderr, args=(process, self.stderr_tails[process.pid]),
+                                 daemon=True).start()
+                self.telemetry.append(EncoderTelemetry(role, process))
+            if SCHEDULER_ENABLED:
+                scheduler.launched(self.id, processes)
+            print_connection_guide(self)
+            return processes, probe
         except Exception as e:
-            success = False
-            message.append(f"Error stopping HLS: {e}")
+            if probe is not None:
+                probe.close()
+            self._discard_processes()
+            scheduler.release(self.id)
+            self._set_state("failed", f"Error starting stream: {e}")
+            return None
+
+    def _set_state(self, state, message=""):
+        if (state, message) != (self.state, self.state_message):
+            print(f"[{self.id}] State: {state} {message}", file=sys.stderr)
+        self.state = state
+        self.state_message = message
+
+    def _has_segment(self):
+        """Đã có segment HLS đầu tiên chưa (RAM hoặc đĩa)"""
+        if self.hls_store is not None:
+            stats = self.hls_store.stats()
+            return stats["segments"] > 0 or stats.get("parts", 0) > 0
+        for _, _, files in os.walk(self.hls_dir):
+            if any(name.endswith(".ts") for name in files):
+                return True
+        return False
+
+    def _process_error(self, process):
+        if isinstance(process, PacedTSSender):
+            return f"Paced multicast sender stopped (code {process.returncode}): {process.error}"
+        name = "HLS" if process is self.hls_process and process is not self.ffmpeg_process else "Multicast"
+        tail = "\n".join(self.stderr_tails.get(process.pid, []))
+        return f"{name} FFmpeg exited with code {process.returncode}: {tail}"
+
+    def _monitor(self, processes, probe, stop_event):
+        """Theo dõi khởi động và sức khỏe kênh: starting -> ready -> degraded -> failed"""
+        deadline = self.started_at + CHANNEL_STARTUP_TIMEOUT
+        try:
+            while not stop_event.is_set():
+                if probe is not None:
+                    readable, _, _ = select.select([probe], [], [], 0.05)
+                    if readable:
+                        self.first_packet_at = time.time()
+                        probe.close()
+                        probe = None
+                else:
+                    stop_event.wait(0.05 if self.state == "starting" else 0.5)
+                if stop_event.is_set():
+                    break
+                if self.first_segment_at is None and self._has_segment():
+                    self.first_segment_at = time.time()
+
+                exited = [p for p in processes if p.poll() is not None]
+                # Không lắng nghe được địa chỉ đích thì chỉ dựa vào segment HLS
+                packet_ok = self.first_packet_at is not None or probe is None
+                segment_ok = self.first_segment_at is not None
+                if len(exited) == len(processes):
+                    self._set_state("failed", self._process_error(exited[0]))
+                    break
+                elif exited:
+                    self._set_state("degraded", self._process_error(exited[0]))
+                elif packet_ok and segment_ok:
+                    self._set_state("ready", "Multicast and HLS are running")
+                elif time.time() > deadline:
+                    missing = [name for name, ok in (("UDP packet", packet_ok), ("HLS segment", segment_ok)) if not ok]
+                    self._set_state("degraded", f"No {' or '.join(missing)} after {CHANNEL_STARTUP_TIMEOUT} s")
         finally:
-            hls_process = None
-    
-    # Dọn dẹp thư mục HLS
+            if probe is not None:
+                probe.close()
+
+    def _discard_processes(self):
+        """Dừng các tiến trình còn chạy sau khi khởi động thất bại"""
+        if self.monitor_stop is not None:
+            self.monitor_stop.set()
+            self.monitor_stop = None
+        self.preparing = False
+        for process in {self.ffmpeg_process, self.hls_process}:
+            if process is not None and process.poll() is None:
+                # Chờ thoát (kill sau timeout) để không để lại tiến trình zombie
+                stop_process(process)
+        self.ffmpeg_process = None
+        self.hls_process = None
+        self.started_at = None
+        self.first_packet_at = None
+        self.first_segment_at = None
+
+    def stop(self):
+        with self.lock:
+            if self.monitor_stop is not None:
+                self.monitor_stop.set()
+                self.monitor_stop = None
+            self.preparing = False
+            success = True
+            message = []
+            # Ở chế độ shared, một tiến trình phục vụ cả multicast và HLS
+            shared = self.ffmpeg_process is not None and self.hls_process is self.ffmpeg_process
+            
+            # Dừng multicast process
+            if self.ffmpeg_process:
+                try:
+                    stop_process(self.ffmpeg_process)
+                    message.append("Multicast stream stopped")
+                    if shared:
+                        message.append("HLS stream stopped")
+                except Exception as e:
+                    success = False
+                    message.append(f"Error stopping multicast: {e}")
+                finally:
+                    self.ffmpeg_process = None
+                    if shared:
+                        self.hls_process = None
+            
+            # Dừng HLS process
+            if self.hls_process:
+                try:
+                    stop_process(self.hls_process)
+                    message.append("HLS stream stopped")
+                except Exception as e:
+                    success = False
+                    message.append(f"Error stopping HLS: {e}")
+                finally:
+                    self.hls_process = None
+            
+            # Dọn dẹp segment HLS (RAM hoặc thư mục)
+            if self.hls_store is not None:
+                self.hls_store.clear()
+                self.hls_store = None
+            try:
+                if os.path.exists(self.hls_dir):
+                    shutil.rmtree(self.hls_dir)
+            except Exception as e:
+                print(f"Error cleaning HLS directory: {e}", file=sys.stderr)
+            
+            # Trả lại CPU đã giữ chỗ (hoặc rời hàng đợi nếu kênh đang chờ)
+            scheduler.release(self.id)
+            
+            self.started_at = None
+            self.first_packet_at = None
+            self.first_segment_at = None
+            self._set_state("stopped")
+            return success, ". ".join(message)
+
+    def expire_queue(self):
+        """Kênh chờ CPU quá SCHEDULER_QUEUE_TIMEOUT"""
+        with self.lock:
+            if self.state == "queued":
+                self._set_state("failed", f"No CPU capacity after {SCHEDULER_QUEUE_TIMEOUT} s in the queue")
+
+    def multicast_ports(self):
+        """Các (địa chỉ, cổng) kênh đang dùng: luồng media và các luồng FEC"""
+        if self.port is None:
+            return set()
+        ports = [int(self.port)]
+        if self.fec:
+            ports += [int(self.port) + FEC_COLUMN_PORT_OFFSET, int(self.port) + FEC_ROW_PORT_OFFSET]
+        return {(self.multicast_addr, p) for p in ports}
+
+    def read_hls(self, name):
+        """Nội dung một file HLS của kênh (playlist hoặc segment), None nếu không có"""
+        if self.hls_store is not None:
+            return self.hls_store.get(name)
+        path = os.path.join(self.hls_dir, name)
+        if not os.path.abspath(path).startswith(self.hls_dir + os.sep):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def count_traffic(self, key, nbytes, requests=0):
+        """Cộng dồn byte HLS của kênh (phục vụ cho người xem hoặc FFmpeg gửi vào RAM)"""
+        with self.traffic_lock:
+            self.traffic[key] += nbytes
+            self.traffic["hls_requests"] += requests
+
+    def disk_playlist(self, name):
+        """Playlist trên đĩa kèm EXT-X-PROGRAM-DATE-TIME suy từ PTS đầu mỗi segment, None nếu không có file"""
+        data = self.read_hls(name)
+        if data is None:
+            return None
+        directory = os.path.dirname(name)
+        listed = set()
+
+        def captured_at(uri):
+            segment = os.path.join(directory, uri)
+            listed.add(segment)
+            if segment not in self.disk_captured:
+                data = self.read_hls(segment)
+                if data is None:
+                    return None
+                self.disk_captured[segment] = capture_time(data)
+            return self.disk_captured[segment]
+
+        with self.traffic_lock:
+            text = add_program_date_time(data.decode("utf-8", "replace"), captured_at)
+            for segment in [s for s in self.disk_captured if os.path.dirname(s) == directory and s not in listed]:
+                del self.disk_captured[segment]
+        return text.encode("utf-8")
+
+    def processes(self):
+        """PID và byte đầu ra của từng tiến trình FFmpeg (bộ phát paced là luồng trong process server)"""
+        if not self.running:
+            return []
+        result = []
+        for telemetry in self.telemetry:
+            if isinstance(telemetry, PacedTSSender):
+                stats = telemetry.stats(history=False)
+                result.append({"role": "multicast", "kind": "paced", "pid": os.getpid(), "thread": True,
+                               "output_bytes": stats["bytes"], "cpu_seconds": stats["cpu_seconds"]})
+                continue
+            latest = telemetry.latest()
+            result.append({"role": telemetry.role, "kind": "ffmpeg", "pid": telemetry.pid, "thread": False,
+                           "output_bytes": latest["total_size"] or None if latest else None})
+        return result
+
+    def encoder_stats(self, history=True):
+        return {
+            "state": self.state,
+            "processes": [t.stats(history) for t in self.telemetry] if self.running else [],
+        }
+
+    def status(self):
+        multicast_alive = self.ffmpeg_process is not None and self.ffmpeg_process.poll() is None
+        hls_alive = self.hls_process is not None and self.hls_process.poll() is None
+        return {
+            "channel_id": self.id,
+            "multicast_running": self.ffmpeg_process is not None,
+            "hls_running": self.hls_process is not None,
+            "multicast_alive": multicast_alive,
+            "hls_alive": hls_alive,
+            "pipeline": self.pipeline,
+            "cdn_url": self.cdn_url,
+            "source_url": self.source_url,
+            "cache": self.use_cache,
+            "hls_storage": self.storage,
+            "hls_mode": self.hls_mode,
+            "ladder": self.ladder,
+            "source_probe": self.source_probe,
+            "passthrough": self.passthrough,
+            "multicast_sender": self.multicast_sender,
+            "fec": {"columns": self.fec[0], "rows": self.fec[1], "media": "rtp",
+                    "column_port": int(self.port) + FEC_COLUMN_PORT_OFFSET,
+                    "row_port": int(self.port) + FEC_ROW_PORT_OFFSET} if self.fec else None,
+            # PTS/PCR multicast theo giờ hệ thống (wallclock_ts_offset), HLS có EXT-X-PROGRAM-DATE-TIME
+            "wallclock_timestamps": {"multicast": not isinstance(self.ffmpeg_process, PacedTSSender), "hls": True},
+            "hls_memory": self.hls_store.stats() if self.hls_store is not None else None,
+            "multicast_addr": self.multicast_addr,
+            "port": self.port,
+            "hls_url": f"/hls/{self.id}/playlist.m3u8",
+            "uptime": time.time() - self.started_at if self.started_at else 0,
+            "started_at": self.started_at,
+            "state": self.state,
+            "state_message": self.state_message,
+            "time_to_first_packet": self.first_packet_at - self.started_at if self.first_packet_at else None,
+            "time_to_first_segment": self.first_segment_at - self.started_at if self.first_segment_at else None,
+            "scheduler": scheduler.allocation(self.id),
+        }
+
+def print_connection_guide(channel):
+    """In hướng dẫn kết nối cho một kênh"""
+    hls_path = "/hls/playlist.m3u8" if channel.id == DEFAULT_CHANNEL_ID else f"/hls/{channel.id}/playlist.m3u8"
+    print(f"\n----- HƯỚNG DẪN KẾT NỐI ({channel.id}) -----", file=sys.stderr)
+    # Có FEC thì media đi trong RTP
+    scheme = "rtp" if channel.fec else "udp"
+    print(f"1. Xem qua Multicast:", file=sys.stderr)
+    print(f"   - VLC -> Media -> Open Network Stream -> Nhập: {scheme}://@{channel.multicast_addr}:{channel.port}", file=sys.stderr)
+    print(f"   - Hoặc: vlc {scheme}://@{channel.multicast_addr}:{channel.port} --network-caching=50", file=sys.stderr)
+    if channel.fec:
+        print(f"   - FEC {channel.fec[0]}x{channel.fec[1]}: python3 checkMulticast.py --fec "
+              f"--group {channel.multicast_addr} --port {channel.port}", file=sys.stderr)
+    print(f"2. Xem qua HLS:", file=sys.stderr)
+    print(f"   - VLC -> Media -> Open Network Stream -> Nhập: http://localhost:{SERVER_PORT}{hls_path}", file=sys.stderr)
+    print(f"   - Hoặc trình duyệt web: http://localhost:{SERVER_PORT}/hls/player.html", file=sys.stderr)
+    print(f"--------------------------------\n", file=sys.stderr)
+
+def get_channel(channel_id, create=False):
+    """Lấy kênh theo id, tạo mới nếu create=True"""
+    with channels_lock:
+        channel = channels.get(channel_id)
+        if channel is None and create:
+            channel = Channel(channel_id)
+            channels[channel_id] = channel
+        return channel
+
+def start_channel(channel_id, cdn_url, multicast_addr, port, ttl, pipeline=DEFAULT_PIPELINE,
+                  cache=SOURCE_CACHE_ENABLED, storage=HLS_STORAGE, hls_mode=DEFAULT_HLS_MODE,
+                  ladder=DEFAULT_HLS_LADDER, passthrough=DEFAULT_PASSTHROUGH,
+                  multicast_sender=DEFAULT_MULTICAST_SENDER, admission=DEFAULT_SCHEDULER_ADMISSION,
+                  fec=DEFAULT_MULTICAST_FEC):
+    """Khởi động một kênh, kiểm tra trùng nhóm/cổng multicast (kể cả cổng FEC) với các kênh khác"""
+    if not CHANNEL_ID_PATTERN.match(channel_id):
+        return False, f"Invalid channel id: {channel_id}"
     try:
-        if os.path.exists(HLS_OUTPUT_DIR):
-            shutil.rmtree(HLS_OUTPUT_DIR)
-    except Exception as e:
-        print(f"Error cleaning HLS directory: {e}", file=sys.stderr)
-    
-    return success, ". ".join(message)
+        fec_ports = [] if parse_fec(fec) is None else [FEC_COLUMN_PORT_OFFSET, FEC_ROW_PORT_OFFSET]
+        wanted = {(multicast_addr, int(port) + offset) for offset in [0, *fec_ports]}
+    except ValueError as e:
+        return False, str(e)
+    with channels_lock:
+        for other in channels.values():
+            if other.id != channel_id and (other.running or other.state == "queued") and \
+                    wanted & other.multicast_ports():
+                return False, f"{multicast_addr}:{port} is already used by channel {other.id}."
+    channel = get_channel(channel_id, create=True)
+    return channel.start(cdn_url, multicast_addr, port, ttl, pipeline, cache, storage, hls_mode, ladder,
+                         passthrough, multicast_sender, admission, fec)
+
+def stop_channel(channel_id):
+    channel = get_channel(channel_id)
+    if channel is None:
+        return False, f"Unknown channel: {channel_id}"
+    return channel.stop()
+
+def stop_all_channels():
+    with channels_lock:
+        running = [c for c in channels.values() if c.running]
+    for channel in running:
+        channel.stop()
 
 @app.route("/")
 def index():
@@ -255,6 +2751,15 @@ def index():
                 <li>multicast_addr (optional): Multicast address</li>
                 <li>port (optional): Port number</li>
                 <li>ttl (optional): Time to live</li>
+                <li>pipeline (optional): "separate" (default) or "shared" (one encode for Multicast and HLS)</li>
+                <li>cache (optional): 1 (default) to read the source through the local cache, 0 to read the CDN directly</li>
+                <li>storage (optional): "memory" (default, HLS segments kept in RAM) or "disk"</li>
+                <li>ladder (optional): ABR renditions, e.g. "1080p,720p,480p,audio" (master playlist + one playlist per rendition)</li>
+                <li>passthrough (optional): "auto" (default, remux without re-encoding when the source is already H.264/AAC with short GOPs) or "off"</li>
+                <li>multicast_sender (optional): "ffmpeg" (default) or "paced" (loop a pre-encoded TS paced by PCR, no re-encode; pipeline=separate)</li>
+                <li>hls_mode (optional): "standard" (default) or "ll" (Low-Latency HLS with partial segments, needs storage=memory)</li>
+                <li>fec (optional): "off" (default) or "LxD", e.g. "10x5" (SMPTE 2022-1 row/column FEC on port+2/port+4; the multicast stream becomes RTP)</li>
+                <li>admission (optional): "refuse" (default) or "queue" when the server has no CPU headroom left for the channel</li>
             </ul>
         </div>
         <div class="endpoint">
@@ -264,11 +2769,32 @@ def index():
         <div class="endpoint">
             <h3>Check Status</h3>
             <p>GET /status</p>
+            <p>state: starting, ready, degraded, failed or stopped; time_to_first_packet and time_to_first_segment in seconds</p>
+        </div>
+        <div class="endpoint">
+            <h3>Channels</h3>
+            <p>GET /channels</p>
+            <p>GET /channels/&lt;id&gt;/start (same parameters as /start)</p>
+            <p>GET /channels/&lt;id&gt;/stop</p>
+            <p>GET /channels/&lt;id&gt;/status</p>
+        </div>
+        <div class="endpoint">
+            <h3>Encoder Stats</h3>
+            <p>GET /stats (FFmpeg fps, speed, bitrate, dropped/duplicated frames per process; ?channel=&lt;id&gt;, ?history=0)</p>
+        </div>
+        <div class="endpoint">
+            <h3>Capacity</h3>
+            <p>GET /capacity (current and maximum CPU headroom in cores, per-channel cost and core set, queued channels)</p>
+        </div>
+        <div class="endpoint">
+            <h3>Source Cache</h3>
+            <p>GET /cache (hit/miss counts and bytes saved)</p>
         </div>
         <div class="endpoint">
             <h3>HLS Stream</h3>
             <p>Access the HLS stream at: /hls/playlist.m3u8</p>
-            <p>Web player available at: /hls/player.html</p>
+            <p>Per-channel HLS stream at: /hls/&lt;id&gt;/playlist.m3u8</p>
+            <p>Web player available at: /hls/player.html (add ?channel=&lt;id&gt; for a channel)</p>
         </div>
         <div class="player">
             <h2>Live Stream Player</h2>
@@ -293,31 +2819,177 @@ def index():
     </html>
     """
 
+def read_stream_params(args):
+    """Đọc tham số khởi động kênh từ query string"""
+    return {
+        "cdn_url": args.get("cdn_url", DEFAULT_CDN_URL),
+        "multicast_addr": args.get("multicast_addr", DEFAULT_MULTICAST_ADDR),
+        "port": args.get("port", DEFAULT_PORT),
+        "ttl": args.get("ttl", DEFAULT_TTL),
+        "pipeline": args.get("pipeline", DEFAULT_PIPELINE),
+        "cache": args.get("cache", "1" if SOURCE_CACHE_ENABLED else "0") not in ("0", "false", "no"),
+        "storage": args.get("storage", HLS_STORAGE),
+        "hls_mode": args.get("hls_mode", DEFAULT_HLS_MODE),
+        "ladder": args.get("ladder", DEFAULT_HLS_LADDER),
+        "passthrough": args.get("passthrough", DEFAULT_PASSTHROUGH),
+        "multicast_sender": args.get("multicast_sender", DEFAULT_MULTICAST_SENDER),
+        "admission": args.get("admission", DEFAULT_SCHEDULER_ADMISSION),
+        "fec": args.get("fec", DEFAULT_MULTICAST_FEC),
+    }
+
 @app.route("/start")
 def start_stream():
-    cdn_url = request.args.get("cdn_url", DEFAULT_CDN_URL)
-    multicast_addr = request.args.get("multicast_addr", DEFAULT_MULTICAST_ADDR)
-    port = request.args.get("port", DEFAULT_PORT)
-    ttl = request.args.get("ttl", DEFAULT_TTL)
-    
-    success, message = start_ffmpeg(cdn_url, multicast_addr, port, ttl)
+    success, message = start_channel(DEFAULT_CHANNEL_ID, **read_stream_params(request.args))
     return jsonify({"success": success, "message": message})
 
 @app.route("/stop")
 def stop_stream():
-    success, message = stop_ffmpeg()
+    success, message = stop_channel(DEFAULT_CHANNEL_ID)
+    if not success and get_channel(DEFAULT_CHANNEL_ID) is None:
+        # Giữ hành vi cũ: /stop khi chưa phát vẫn thành công
+        success, message = True, ""
     return jsonify({"success": success, "message": message})
 
 @app.route("/status")
 def status():
+    channel = get_channel(DEFAULT_CHANNEL_ID)
+    with channels_lock:
+        running_channels = sum(1 for c in channels.values() if c.running)
+    channel_status = channel.status() if channel else {}
+    capacity = scheduler.snapshot()
     return jsonify({
-        "multicast_running": ffmpeg_process is not None,
-        "hls_running": hls_process is not None
+        "multicast_running": channel is not None and channel.ffmpeg_process is not None,
+        "hls_running": channel is not None and channel.hls_process is not None,
+        "pipeline": channel.pipeline if channel else DEFAULT_PIPELINE,
+        "state": channel_status.get("state", "stopped"),
+        "state_message": channel_status.get("state_message", ""),
+        "time_to_first_packet": channel_status.get("time_to_first_packet"),
+        "time_to_first_segment": channel_status.get("time_to_first_segment"),
+        "running_channels": running_channels,
+        "headroom_cores": capacity["headroom_cores"],
+        "max_headroom_cores": capacity["max_headroom_cores"],
     })
 
+@app.route("/channels")
+def list_channels():
+    with channels_lock:
+        all_channels = list(channels.values())
+    return jsonify({"channels": [c.status() for c in all_channels]})
+
+@app.route("/channels/<channel_id>/start")
+def start_channel_route(channel_id):
+    success, message = start_channel(channel_id, **read_stream_params(request.args))
+    return jsonify({"success": success, "message": message})
+
+@app.route("/channels/<channel_id>/stop")
+def stop_channel_route(channel_id):
+    success, message = stop_channel(channel_id)
+    return jsonify({"success": success, "message": message}), (200 if get_channel(channel_id) else 404)
+
+@app.route("/channels/<channel_id>/status")
+def channel_status(channel_id):
+    channel = get_channel(channel_id)
+    if channel is None:
+        return jsonify({"success": False, "message": f"Unknown channel: {channel_id}"}), 404
+    return jsonify(channel.status())
+
+@app.route("/stats")
+def encoder_stats():
+    """Tiến độ encode của từng tiến trình FFmpeg (?channel=<id>, ?history=0 để bỏ lịch sử)"""
+    channel_id = request.args.get("channel")
+    history = request.args.get("history", "1") not in ("0", "false", "no")
+    with channels_lock:
+        selected = [c for c in channels.values() if channel_id in (None, c.id)]
+    if channel_id and not selected:
+        return jsonify({"success": False, "message": f"Unknown channel: {channel_id}"}), 404
+    return jsonify({c.id: c.encoder_stats(history) for c in selected})
+
+@app.route("/processes")
+def process_list():
+    """PID của server và các tiến trình FFmpeg từng kênh, kèm số byte mỗi kênh đã gửi/nhận (cho checkPerformanceHLS.py)"""
+    with channels_lock:
+        all_channels = list(channels.values())
+    result = {}
+    for channel in all_channels:
+        with channel.traffic_lock:
+            traffic = dict(channel.traffic)
+        result[channel.id] = {"state": channel.state, "processes": channel.processes(), "traffic": traffic}
+    return jsonify({"server_pid": os.getpid(), "channels": result})
+
+@app.route("/capacity")
+def capacity():
+    """Headroom CPU hiện tại và tối đa, chi phí/tập core từng kênh và hàng đợi của scheduler"""
+    return jsonify(scheduler.snapshot())
+
+@app.route("/cache")
+def cache_stats():
+    return jsonify(get_source_cache().get_stats())
+
+ll_waiters = threading.BoundedSemaphore(HLS_LL_MAX_WAITERS)
+
+def wait_low_latency(store, name, args):
+    """Blocking playlist reload (_HLS_msn/_HLS_part) và chờ part trong EXT-X-PRELOAD-HINT
+
+    Mỗi request đang chờ giữ một luồng waitress, nên chỉ HLS_LL_MAX_WAITERS request được chờ cùng lúc;
+    các request khác nhận ngay playlist hiện tại (hoặc 404 với part chưa có) và client tự tải lại.
+    """
+    timeout = HLS_LL_WAIT_PARTS * store.part_target
+    if name == "playlist.m3u8" and "_HLS_msn" in args:
+        try:
+            msn = int(args["_HLS_msn"])
+            part = int(args["_HLS_part"]) if "_HLS_part" in args else None
+        except ValueError:
+            abort(400)
+        if msn > store.next_msn + 2:
+            # Yêu cầu quá xa so với segment hiện tại (theo đặc tả LL-HLS)
+            abort(400)
+        if store.has_part(msn, part) or not ll_waiters.acquire(blocking=False):
+            return
+        try:
+            if not store.wait_for_part(msn, part, timeout):
+                abort(503)
+        finally:
+            ll_waiters.release()
+    elif name.startswith("part_") and store.get(name) is None:
+        index = LowLatencyStore._part_index(name)
+        if store.last_part_index < index <= store.last_part_index + 2 and ll_waiters.acquire(blocking=False):
+            try:
+                store.wait_for_file(name, timeout)
+            finally:
+                ll_waiters.release()
+
 @app.route('/hls/<path:filename>')
 def serve_hls(filename):
-    return send_from_directory(HLS_OUTPUT_DIR, filename)
+    # /hls/<channel_id>/<file> cho từng kênh, /hls/<file> cho kênh mặc định
+    channel_id, _, name = filename.partition('/')
+    channel = get_channel(channel_id) if name else None
+    if channel is None:
+        channel, name = get_channel(DEFAULT_CHANNEL_ID), filename
+    if channel is None:
+        abort(404)
+    store = channel.hls_store
+    if isinstance(store, LowLatencyStore):
+        wait_low_latency(store, name, request.args)
+    if store is not None:
+        # Phục vụ thẳng từ RAM, không đụng tới đĩa
+        data = store.get(name)
+        if data is None:
+            abort(404)
+        response = Response(data, mimetype=hls_content_type(name))
+        response.headers["Cache-Control"] = "no-cache" if name.endswith(".m3u8") else "max-age=60"
+        channel.count_traffic("hls_bytes_served", len(data), requests=1)
+        return response
+    if name.endswith(".m3u8"):
+        data = channel.disk_playlist(name)
+        if data is None:
+            abort(404)
+        response = Response(data, mimetype=hls_content_type(name))
+        response.headers["Cache-Control"] = "no-cache"
+        channel.count_traffic("hls_bytes_served", len(data), requests=1)
+        return response
+    response = send_from_directory(channel.hls_dir, name)
+    channel.count_traffic("hls_bytes_served", response.content_length or 0, requests=1)
+    return response
 
 @app.route('/hls/player.html')
 def hls_player():
@@ -353,7 +3025,8 @@ def hls_player():
                         lowLatencyMode: true,
                         backBufferLength: 90
                     });
-                    hls.loadSource('/hls/playlist.m3u8');
+                    var channel = new URLSearchParams(location.search).get('channel');
+                    hls.loadSource(channel ? '/hls/' + channel + '/playlist.m3u8' : '/hls/playlist.m3u8');
                     hls.attachMedia(video);
                     hls.on(Hls.Events.MANIFEST_PARSED, function() {
                         video.play();
@@ -371,7 +3044,57 @@ def hls_player():
     </html>
     """
 
+def raise_open_file_limit(needed):
+    """Nâng giới hạn file descriptor mềm (mỗi kết nối viewer dùng một socket)"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft != resource.RLIM_INFINITY and soft < needed:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (needed if hard == resource.RLIM_INFINITY else min(needed, hard), hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+def run_server(mode, host, port, threads, connection_limit, debug=False):
+    """Chạy web server
+
+    "waitress": một tiến trình, vòng lặp bất đồng bộ nhận kết nối và một pool luồng xử lý request.
+    Mọi luồng dùng chung danh sách kênh, tiến trình FFmpeg và segment HLS trong RAM nên /status luôn đúng.
+    Không chạy nhiều tiến trình worker: mỗi tiến trình sẽ có danh sách kênh riêng.
+    """
+    if SOURCE_CACHE_ENABLED:
+        # Nạp index cache từ lần chạy trước trước khi nhận request
+        get_source_cache()
+    if mode == "waitress":
+        try:
+            from waitress import serve
+        except ImportError:
+            print("waitress is not installed (pip3 install waitress), falling back to the Flask development server",
+                  file=sys.stderr)
+            mode = "dev"
+    if mode == "waitress":
+        raise_open_file_limit(connection_limit + 256)
+        print(f"Serving with waitress on {host}:{port} ({threads} threads, "
+              f"up to {connection_limit} connections)", file=sys.stderr)
+        # poll() thay cho select(): select() lỗi với file descriptor >= 1024 và làm dừng cả server
+        serve(app, host=host, port=port, threads=threads, connection_limit=connection_limit,
+              backlog=min(connection_limit, 4096), channel_timeout=60, ident="streaming-server",
+              asyncore_use_poll=True)
+    else:
+        # Không dùng reloader: nó chạy 2 tiến trình và mỗi tiến trình có danh sách kênh riêng
+        app.run(host=host, port=port, debug=debug, use_reloader=False, threaded=True)
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Video Streaming Server (Multicast + HLS)")
+    parser.add_argument("--server", choices=("waitress", "dev"), default="waitress",
+                        help="waitress (default, production) or dev (Flask development server)")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--threads", type=int, default=SERVER_THREADS)
+    parser.add_argument("--connection-limit", type=int, default=SERVER_CONNECTION_LIMIT)
+    parser.add_argument("--debug", action="store_true", help="Flask debugger (dev server only)")
+    args = parser.parse_args()
+    SERVER_PORT = args.port
+
     # Kiểm tra xem ffmpeg có được cài đặt không
     if subprocess.call(["which", "ffmpeg"], stdout=subprocess.PIPE, stderr=subprocess.PIPE) != 0:
         print("ffmpeg is not installed. Please install ffmpeg before running this script.")
@@ -383,7 +3106,18 @@ if __name__ == "__main__":
     print(f"Default address: {DEFAULT_MULTICAST_ADDR}:{DEFAULT_PORT}", file=sys.stderr)
     print(f"HLS output directory: {HLS_OUTPUT_DIR}", file=sys.stderr)
     print(f"HLS segment time: {HLS_SEGMENT_TIME} seconds", file=sys.stderr)
+    print(f"HLS storage: {HLS_STORAGE}", file=sys.stderr)
+    print(f"Default pipeline: {DEFAULT_PIPELINE}", file=sys.stderr)
+    print(f"Source cache: {os.path.abspath(SOURCE_CACHE_DIR)} ({'enabled' if SOURCE_CACHE_ENABLED else 'disabled'}, "
+          f"max {SOURCE_CACHE_MAX_BYTES / 1024 ** 3:.1f} GB)", file=sys.stderr)
+    print(f"CPU scheduler: {'enabled' if SCHEDULER_ENABLED else 'disabled'} ({len(scheduler.cores)} cores, "
+          f"max headroom {scheduler.capacity:.2f} cores, pinning {'on' if scheduler.pinning else 'off'})",
+          file=sys.stderr)
     print("==========================\n", file=sys.stderr)
     
-    # Chạy server Flask trên cổng 3000
-    app.run(host="0.0.0.0", port=3000, debug=True)
+    # Dừng mọi tiến trình FFmpeg khi server thoát (kể cả khi nhận SIGTERM)
+    atexit.register(stop_all_channels)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
+    # Chạy server trên cổng 3000
+    run_server(args.server, args.host, args.port, args.threads, args.connection_limit, args.debug)